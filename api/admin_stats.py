@@ -0,0 +1,201 @@
+"""Сводная аналитика по всем пользователям (для команды эксплуатации).
+
+Итоги за всю историю читаются из user_sales_totals: строка на
+пользователя с версией данных, на которой она посчитана. Перед чтением
+устаревшие строки (версия отстала от users.data_version или строки нет)
+пересчитываются пачками по TOTALS_REFRESH_BATCH пользователей - один
+GROUP BY user_id по индексу продаж на пачку. Обычно устаревших строк
+единицы, и сводка по 100 тыс. пользователей - агрегат по 100 тыс. строк
+итогов, а не по всем продажам.
+
+Для периода (since) итогов нет: считается один GROUP BY по продажам
+периода. KPI пачки пользователей - страница по id (keyset) и один
+запрос на страницу вместо запроса /stats на каждого.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, delete, func, insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.queries import STATS_FIELDS, build_stats, stats_aggregates
+from database.models import User, Sale, UserSalesTotals
+
+
+TOTALS_REFRESH_BATCH = 1000
+USER_PAGE_SIZE = 100
+ZERO_TOTALS = dict.fromkeys(STATS_FIELDS, 0)
+
+
+def _user_entry(user, totals: Dict) -> Dict:
+    return {
+        "user_id": user.id,
+        "telegram_id": user.telegram_id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "is_demo": bool(user.is_demo),
+        "stats": build_stats(**totals)
+    }
+
+
+def _rollup_aggregates() -> tuple:
+    """Суммы STATS_FIELDS по строкам user_sales_totals"""
+    return tuple(
+        func.coalesce(func.sum(getattr(UserSalesTotals, field)), 0).label(field)
+        for field in STATS_FIELDS
+    )
+
+
+async def grouped_totals(
+    session: AsyncSession,
+    user_ids: Sequence[int],
+    since: Optional[datetime] = None
+) -> Dict[int, Dict]:
+    """Агрегаты STATS_FIELDS по пользователям одним GROUP BY (пользователи без продаж пропущены)"""
+    query = (
+        select(Sale.user_id, *stats_aggregates())
+        .where(Sale.user_id.in_(user_ids))
+        .group_by(Sale.user_id)
+    )
+    if since is not None:
+        query = query.where(Sale.date >= since)
+    rows = await session.execute(query)
+    return {row.user_id: {field: getattr(row, field) for field in STATS_FIELDS} for row in rows}
+
+
+async def refresh_user_totals(session: AsyncSession, user_ids: Optional[Sequence[int]] = None) -> int:
+    """Пересчитать устаревшие итоги (всех пользователей или user_ids); возвращает число пересчитанных"""
+    stale = (
+        select(User.id, User.data_version)
+        .outerjoin(UserSalesTotals, UserSalesTotals.user_id == User.id)
+        .where(or_(UserSalesTotals.user_id.is_(None), UserSalesTotals.data_version != User.data_version))
+    )
+    if user_ids is not None:
+        stale = stale.where(User.id.in_(user_ids))
+    versions = dict((await session.execute(stale)).all())
+
+    ids = list(versions)
+    for start in range(0, len(ids), TOTALS_REFRESH_BATCH):
+        batch = ids[start:start + TOTALS_REFRESH_BATCH]
+        # Версия прочитана до подсчета: продажи, записанные между ними,
+        # оставят строку устаревшей, и она пересчитается при следующем чтении
+        totals = await grouped_totals(session, batch)
+        await session.execute(delete(UserSalesTotals).where(UserSalesTotals.user_id.in_(batch)))
+        await session.execute(insert(UserSalesTotals), [
+            {"user_id": user_id, "data_version": versions[user_id], **totals.get(user_id, ZERO_TOTALS)}
+            for user_id in batch
+        ])
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Ту же пачку одновременно пересчитал другой воркер
+            await session.rollback()
+    return len(ids)
+
+
+async def platform_stats(session: AsyncSession, since: Optional[datetime] = None, include_demo: bool = True) -> Dict:
+    """KPI по всем пользователям за всю историю или с since"""
+    users_query = select(
+        func.count(User.id).label("users"),
+        func.coalesce(func.sum(case((User.is_demo.is_(True), 1), else_=0)), 0).label("demo_users")
+    )
+    if not include_demo:
+        users_query = users_query.where(User.is_demo.isnot(True))
+    users = (await session.execute(users_query)).one()
+
+    if since is None:
+        await refresh_user_totals(session)
+        query = (
+            select(
+                func.coalesce(func.sum(case((UserSalesTotals.total_sales > 0, 1), else_=0)), 0).label("active_users"),
+                *_rollup_aggregates()
+            )
+            .join(User, User.id == UserSalesTotals.user_id)
+        )
+    else:
+        query = (
+            select(func.count(func.distinct(Sale.user_id)).label("active_users"), *stats_aggregates())
+            .join(User, User.id == Sale.user_id)
+            .where(Sale.date >= since)
+        )
+    if not include_demo:
+        query = query.where(User.is_demo.isnot(True))
+    row = (await session.execute(query)).one()
+
+    return {
+        "users": users.users,
+        "demo_users": users.demo_users,
+        "active_users": row.active_users,
+        "stats": build_stats(**{field: getattr(row, field) for field in STATS_FIELDS})
+    }
+
+
+async def top_sellers(
+    session: AsyncSession,
+    limit: int = 10,
+    since: Optional[datetime] = None,
+    include_demo: bool = True
+) -> List[Dict]:
+    """Пользователи с наибольшей выручкой за всю историю или с since"""
+    if since is None:
+        await refresh_user_totals(session)
+        query = (
+            select(User, *(getattr(UserSalesTotals, field) for field in STATS_FIELDS))
+            .join(UserSalesTotals, UserSalesTotals.user_id == User.id)
+            .where(UserSalesTotals.total_sales > 0)
+            .order_by(UserSalesTotals.total_kopecks.desc(), User.id)
+        )
+    else:
+        per_user = (
+            select(Sale.user_id, *stats_aggregates())
+            .where(Sale.date >= since)
+            .group_by(Sale.user_id)
+            .subquery()
+        )
+        query = (
+            select(User, *(getattr(per_user.c, field) for field in STATS_FIELDS))
+            .join(per_user, per_user.c.user_id == User.id)
+            .order_by(per_user.c.total_kopecks.desc(), User.id)
+        )
+    if not include_demo:
+        query = query.where(User.is_demo.isnot(True))
+
+    rows = await session.execute(query.limit(limit))
+    return [
+        _user_entry(row.User, {field: getattr(row, field) for field in STATS_FIELDS})
+        for row in rows
+    ]
+
+
+async def user_stats_page(
+    session: AsyncSession,
+    after_user_id: int = 0,
+    limit: int = USER_PAGE_SIZE,
+    telegram_ids: Optional[Sequence[int]] = None,
+    since: Optional[datetime] = None,
+    include_demo: bool = True
+) -> Tuple[List[Dict], Optional[int]]:
+    """KPI страницы пользователей с id > after_user_id: (записи, курсор следующей страницы)"""
+    query = select(User).where(User.id > after_user_id).order_by(User.id).limit(limit)
+    if telegram_ids is not None:
+        query = query.where(User.telegram_id.in_(telegram_ids))
+    if not include_demo:
+        query = query.where(User.is_demo.isnot(True))
+    users = (await session.execute(query)).scalars().all()
+    if not users:
+        return [], None
+
+    user_ids = [user.id for user in users]
+    if since is None:
+        await refresh_user_totals(session, user_ids)
+        rows = await session.execute(select(UserSalesTotals).where(UserSalesTotals.user_id.in_(user_ids)))
+        totals = {
+            row.user_id: {field: getattr(row, field) for field in STATS_FIELDS}
+            for row in rows.scalars()
+        }
+    else:
+        totals = await grouped_totals(session, user_ids, since)
+
+    entries = [_user_entry(user, totals.get(user.id, ZERO_TOTALS)) for user in users]
+    return entries, users[-1].id if len(users) == limit else None
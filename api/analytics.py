@@ -0,0 +1,176 @@
+"""Производные метрики продаж на pandas.
+
+Продажи пользователя загружаются одним запросом в колоночный DataFrame,
+дальше все считается векторно: скользящее среднее, накопленная выручка,
+темпы роста, профили по дням недели и часам, ABC-классификация товаров.
+Функции расчета принимают готовый DataFrame и не зависят от БД (см.
+benchmarks/bench_analytics.py).
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Sale, Product, KOPECKS_PER_RUBLE
+
+
+FRAME_COLUMNS = ["date", "line_total", "quantity", "status", "product_id"]
+
+# Границы ABC-классов по накопленной доле выручки
+ABC_THRESHOLDS = (0.8, 0.95)
+
+WEEKDAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+
+async def load_sales_frame(
+    session: AsyncSession,
+    user_id: int,
+    since: Optional[datetime] = None,
+    tz_name: str = "UTC"
+) -> pd.DataFrame:
+    """Продажи пользователя одним запросом; date переводится в tz_name"""
+    query = select(
+        Sale.date, Sale.line_total, Sale.quantity, Sale.status, Sale.product_id
+    ).where(Sale.user_id == user_id)
+    if since is not None:
+        query = query.where(Sale.date >= since)
+
+    frame = await session.run_sync(
+        lambda sync_session: pd.read_sql(query, sync_session.connection())
+    )
+    frame["date"] = (
+        pd.to_datetime(frame["date"])
+        .dt.tz_localize("UTC")
+        .dt.tz_convert(tz_name)
+        .dt.tz_localize(None)
+    )
+    return prepare_frame(frame)
+
+
+def prepare_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """Компактные типы колонок: статус - категория, а не строки"""
+    frame["status"] = frame["status"].astype("category")
+    return frame
+
+
+def _completed(frame: pd.DataFrame) -> pd.DataFrame:
+    return frame[frame["status"] == "completed"]
+
+
+def _hours_since_epoch(frame: pd.DataFrame) -> np.ndarray:
+    # Целочисленная арифметика по datetime64 быстрее, чем аксессоры .dt
+    return frame["date"].to_numpy().astype("datetime64[h]").astype(np.int64)
+
+
+def _rubles(values: pd.Series) -> List[float]:
+    return (values / KOPECKS_PER_RUBLE).round(2).tolist()
+
+
+def _percent(values: pd.Series) -> List[Optional[float]]:
+    values = (values * 100).round(2).replace([np.inf, -np.inf], np.nan)
+    return [None if pd.isna(value) else float(value) for value in values]
+
+
+def daily_trends(frame: pd.DataFrame, window: int = 7) -> Dict[str, List]:
+    """Дневная выручка, скользящее среднее, накопленная выручка и рост"""
+    completed = _completed(frame)
+    if completed.empty:
+        return {key: [] for key in (
+            "labels", "revenue", "rolling_average", "cumulative", "growth_day", "growth_week"
+        )}
+
+    daily = completed.groupby(completed["date"].dt.normalize())["line_total"].sum()
+    daily = daily.asfreq("D", fill_value=0)
+
+    return {
+        "labels": daily.index.strftime("%Y-%m-%d").tolist(),
+        "revenue": _rubles(daily),
+        "rolling_average": _rubles(daily.rolling(window, min_periods=1).mean()),
+        "cumulative": _rubles(daily.cumsum()),
+        "growth_day": _percent(daily.pct_change(fill_method=None)),
+        "growth_week": _percent(daily.pct_change(periods=7, fill_method=None)),
+    }
+
+
+def weekday_profile(frame: pd.DataFrame) -> Dict[str, List]:
+    """Средняя выручка и число продаж по дням недели"""
+    completed = _completed(frame)
+    days = completed["date"].dt.normalize()
+    # Делим на число календарных дней каждого дня недели в периоде
+    calendar = pd.Series(0, index=range(7))
+    if not completed.empty:
+        span = pd.date_range(days.min(), days.max(), freq="D")
+        calendar = pd.Series(span.dayofweek).value_counts().reindex(range(7), fill_value=0)
+
+    # 1970-01-01 - четверг, понедельник = 0
+    weekday = (_hours_since_epoch(completed) // 24 + 3) % 7
+    revenue = pd.Series(np.bincount(weekday, weights=completed["line_total"].to_numpy(), minlength=7))
+    count = np.bincount(weekday, minlength=7)
+
+    return {
+        "labels": WEEKDAY_NAMES,
+        "average_revenue": _rubles(revenue / calendar.clip(lower=1)),
+        "sales_count": count.tolist(),
+    }
+
+
+def hourly_profile(frame: pd.DataFrame) -> Dict[str, List]:
+    """Выручка и число продаж по часам суток"""
+    completed = _completed(frame)
+    hour = _hours_since_epoch(completed) % 24
+    revenue = pd.Series(np.bincount(hour, weights=completed["line_total"].to_numpy(), minlength=24))
+    count = np.bincount(hour, minlength=24)
+
+    return {
+        "labels": [f"{hour:02d}:00" for hour in range(24)],
+        "revenue": _rubles(revenue),
+        "sales_count": count.tolist(),
+    }
+
+
+def abc_classification(frame: pd.DataFrame) -> pd.DataFrame:
+    """ABC-анализ (Парето): класс товара по накопленной доле выручки.
+
+    Возвращает DataFrame по product_id с колонками revenue, share,
+    cumulative_share и abc_class, отсортированный по убыванию выручки.
+    """
+    completed = _completed(frame)
+    revenue = completed.groupby("product_id")["line_total"].sum().sort_values(ascending=False)
+    total = revenue.sum()
+
+    result = pd.DataFrame({"revenue": revenue})
+    result["share"] = revenue / total if total else 0.0
+    result["cumulative_share"] = result["share"].cumsum()
+    # Товар попадает в класс по доле выручки до него: первый товар всегда A
+    previous_share = result["cumulative_share"] - result["share"]
+    result["abc_class"] = np.select(
+        [previous_share < ABC_THRESHOLDS[0], previous_share < ABC_THRESHOLDS[1]],
+        ["A", "B"],
+        default="C"
+    )
+    return result
+
+
+async def abc_report(session: AsyncSession, frame: pd.DataFrame) -> List[Dict]:
+    """ABC-классы с названиями товаров"""
+    result = abc_classification(frame)
+    if result.empty:
+        return []
+
+    names = dict((await session.execute(
+        select(Product.id, Product.name).where(Product.id.in_(result.index.tolist()))
+    )).all())
+
+    return [
+        {
+            "product_name": names[int(product_id)],
+            "total_amount": round(row.revenue / KOPECKS_PER_RUBLE, 2),
+            "share": round(row.share * 100, 2),
+            "cumulative_share": round(row.cumulative_share * 100, 2),
+            "abc_class": row.abc_class,
+        }
+        for product_id, row in result.iterrows()
+    ]
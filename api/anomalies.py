@@ -0,0 +1,232 @@
+"""Поиск аномальных дней в продажах всех пользователей.
+
+Для каждого пользователя и дня сравниваются выручка завершенных продаж
+и число отмен с WINDOW_DAYS предыдущими днями через робастный z-score:
+
+    z = (x - median) / (MAD / 0.6745)
+
+(Iglewicz, Hoaglin, 1993); при MAD = 0 вместо него берется среднее
+абсолютное отклонение * 1.2533. День аномален при |z| > Z_THRESHOLD.
+Чтобы недельный цикл (например, выходной) не давал ложных срабатываний,
+провал выручки должен быть еще и ниже всех тех же дней недели в окне,
+а всплеск - выше них.
+
+Задача идет пачками по BATCH_SIZE пользователей: продажи пачки
+сворачиваются одним GROUP BY (пользователь, день) в матрицу
+пользователи x дни, дальше медианы и MAD считаются по скользящим окнам
+для всей матрицы сразу, без циклов по пользователям и продажам.
+Найденное сохраняется в sales_anomalies; уведомления отправляет бот
+(bot/handlers.py) через /alerts/anomalies.
+"""
+import asyncio
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import select, func, case, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import async_session, User, Sale, SalesAnomaly, to_rubles
+
+
+WINDOW_DAYS = 28  # кратно 7: те же дни недели окна - каждый 7-й
+CATCHUP_DAYS = 3  # проверяемые последние дни (на случай пропущенных запусков)
+Z_THRESHOLD = 4.0  # выше классических 3.5: MAD по 28 точкам сам по себе шумный
+MIN_ACTIVE_DAYS = 14  # дней с продажами в окне, иначе история слишком короткая
+MIN_CANCELLATIONS = 3
+BATCH_SIZE = 1000
+
+ANOMALY_INTERVAL_SECONDS = int(os.getenv("ANOMALY_INTERVAL_SECONDS", 3600))
+
+_MAD_SCALE = 0.6745
+_MEAN_AD_SCALE = 1.2533
+
+
+def robust_scale(windows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Медианы и робастная оценка разброса окон (по последней оси)"""
+    median = np.median(windows, axis=-1)
+    deviation = np.abs(windows - median[..., None])
+    scale = np.median(deviation, axis=-1) / _MAD_SCALE
+    fallback = deviation.mean(axis=-1) * _MEAN_AD_SCALE
+    return median, np.where(scale > 0, scale, fallback)
+
+
+def _scores(values: np.ndarray, median: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    # Без разброса в окне z-score не определен - такие дни не отмечаются
+    return np.divide(values - median, scale, out=np.zeros_like(scale), where=scale > 0)
+
+
+def detect(
+    revenue: np.ndarray,
+    cancelled: np.ndarray,
+    active: np.ndarray
+) -> List[Tuple[int, int, str, str, float, float, float]]:
+    """Аномалии в матрицах пользователи x дни.
+
+    Последние CATCHUP_DAYS столбцов проверяются по WINDOW_DAYS столбцам
+    перед каждым. Возвращает [(строка, столбец, metric, kind, value,
+    expected, score)].
+    """
+    # (пользователи, проверяемые дни, окно): окно дня t - столбцы [t - WINDOW_DAYS, t)
+    span = slice(-CATCHUP_DAYS - WINDOW_DAYS, -1)
+    revenue_windows = sliding_window_view(revenue[:, span], WINDOW_DAYS, axis=1)
+    cancelled_windows = sliding_window_view(cancelled[:, span], WINDOW_DAYS, axis=1)
+    active_days = sliding_window_view(active[:, span], WINDOW_DAYS, axis=1).sum(axis=-1)
+
+    target = slice(-CATCHUP_DAYS, None)
+    day_revenue, day_cancelled = revenue[:, target], cancelled[:, target]
+    enough = active_days >= MIN_ACTIVE_DAYS
+
+    expected, scale = robust_scale(revenue_windows)
+    scores = _scores(day_revenue, expected, scale)
+    same_weekday = revenue_windows[..., ::7]
+    drop = enough & (scores < -Z_THRESHOLD) & (day_revenue < same_weekday.min(axis=-1))
+    spike = enough & (scores > Z_THRESHOLD) & (day_revenue > same_weekday.max(axis=-1))
+
+    # Отмены - счетчик: разброс меньше одной отмены считаем шумом
+    expected_cancelled, cancel_scale = robust_scale(cancelled_windows)
+    cancel_scores = _scores(day_cancelled, expected_cancelled, np.maximum(cancel_scale, 1.0))
+    cancel_spike = enough & (day_cancelled >= MIN_CANCELLATIONS) & (cancel_scores > Z_THRESHOLD)
+
+    offset = revenue.shape[1] - CATCHUP_DAYS
+    found = []
+    for mask, metric, kind, values, medians, z in (
+        (drop, "revenue", "drop", day_revenue, expected, scores),
+        (spike, "revenue", "spike", day_revenue, expected, scores),
+        (cancel_spike, "cancellations", "spike", day_cancelled, expected_cancelled, cancel_scores),
+    ):
+        for row, column in zip(*np.nonzero(mask)):
+            found.append((
+                int(row), offset + int(column), metric, kind,
+                float(values[row, column]), float(medians[row, column]), round(float(z[row, column]), 2)
+            ))
+    return found
+
+
+async def _daily_matrix(
+    session: AsyncSession,
+    user_ids: List[int],
+    date_from: date,
+    days: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Выручка, отмены и признак активности по дням - матрицы пользователи x дни"""
+    day = func.date(Sale.date)
+    rows = (await session.execute(
+        select(
+            Sale.user_id,
+            day.label("day"),
+            func.sum(case((Sale.status == "completed", Sale.line_total), else_=0)).label("revenue"),
+            func.sum(case((Sale.status == "cancelled", 1), else_=0)).label("cancelled"),
+        )
+        .where(Sale.user_id.in_(user_ids))
+        .where(Sale.date >= datetime.combine(date_from, datetime.min.time()))
+        .where(Sale.date < datetime.combine(date_from + timedelta(days=days), datetime.min.time()))
+        .group_by(Sale.user_id, day)
+    )).all()
+
+    shape = (len(user_ids), days)
+    revenue, cancelled, active = np.zeros(shape), np.zeros(shape), np.zeros(shape, dtype=bool)
+    if rows:
+        users = np.fromiter((row.user_id for row in rows), dtype=np.int64, count=len(rows))
+        offsets = np.fromiter(
+            ((date.fromisoformat(str(row.day)) - date_from).days for row in rows),
+            dtype=np.int64, count=len(rows)
+        )
+        index = np.searchsorted(np.asarray(user_ids), users)
+        revenue[index, offsets] = [row.revenue for row in rows]
+        cancelled[index, offsets] = [row.cancelled for row in rows]
+        active[index, offsets] = True
+    return revenue, cancelled, active
+
+
+async def detect_anomalies() -> int:
+    """Проверить последние полные дни у всех пользователей; возвращает число новых аномалий"""
+    yesterday = datetime.utcnow().date() - timedelta(days=1)
+    days = WINDOW_DAYS + CATCHUP_DAYS
+    date_from = yesterday - timedelta(days=days - 1)
+    created = 0
+    last_id = 0
+
+    while True:
+        async with async_session() as session:
+            user_ids = (await session.execute(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(BATCH_SIZE)
+            )).scalars().all()
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+
+            revenue, cancelled, active = await _daily_matrix(session, list(user_ids), date_from, days)
+            found = detect(revenue, cancelled, active)
+            if not found:
+                continue
+
+            anomalies = [
+                SalesAnomaly(
+                    user_id=user_ids[row], day=date_from + timedelta(days=column),
+                    metric=metric, kind=kind, value=value, expected=expected, score=score
+                )
+                for row, column, metric, kind, value, expected, score in found
+            ]
+            # Дни повторно проверяются при следующих запусках - уже сохраненное пропускаем
+            existing = set((await session.execute(
+                select(SalesAnomaly.user_id, SalesAnomaly.day, SalesAnomaly.metric).where(
+                    tuple_(SalesAnomaly.user_id, SalesAnomaly.day, SalesAnomaly.metric).in_(
+                        [(a.user_id, a.day, a.metric) for a in anomalies]
+                    )
+                )
+            )).all())
+            new = [a for a in anomalies if (a.user_id, a.day, a.metric) not in existing]
+            session.add_all(new)
+            try:
+                await session.commit()
+                created += len(new)
+            except IntegrityError:
+                # Параллельный запуск (другой воркер API) успел записать те же аномалии
+                await session.rollback()
+
+    return created
+
+
+async def anomaly_detection_loop():
+    """Фоновая задача API: поиск аномалий раз в ANOMALY_INTERVAL_SECONDS"""
+    while True:
+        try:
+            created = await detect_anomalies()
+            if created:
+                print(f"⚠️ Найдено аномалий в продажах: {created}")
+        except Exception as e:
+            print(f"❌ Ошибка поиска аномалий: {e}")
+        await asyncio.sleep(ANOMALY_INTERVAL_SECONDS)
+
+
+async def pending_alerts(session: AsyncSession, limit: int) -> List[Dict]:
+    """Неотправленные аномалии вместе с telegram_id получателя"""
+    rows = (await session.execute(
+        select(SalesAnomaly, User.telegram_id)
+        .join(User, User.id == SalesAnomaly.user_id)
+        .where(SalesAnomaly.notified_at.is_(None))
+        .order_by(SalesAnomaly.id)
+        .limit(limit)
+    )).all()
+    return [anomaly_payload(anomaly, telegram_id) for anomaly, telegram_id in rows]
+
+
+def anomaly_payload(anomaly: SalesAnomaly, telegram_id: int = None) -> Dict:
+    """Аномалия для ответа API; выручка в рублях"""
+    to_api = (lambda value: to_rubles(round(value))) if anomaly.metric == "revenue" else float
+    payload = {
+        "id": anomaly.id,
+        "day": anomaly.day,
+        "metric": anomaly.metric,
+        "kind": anomaly.kind,
+        "value": to_api(anomaly.value),
+        "expected": to_api(anomaly.expected),
+        "score": anomaly.score,
+    }
+    if telegram_id is not None:
+        payload["telegram_id"] = telegram_id
+    return payload
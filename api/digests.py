@@ -0,0 +1,111 @@
+"""Утренние сводки KPI для рассылки ботом.
+
+Сводка - KPI за вчера (в поясе REPORT_TZ) и изменение выручки к
+позавчера. Пользователи обходятся страницами по id (keyset), на страницу -
+один GROUP BY по (пользователь, день) на диапазоне индекса
+ix_sales_user_date_cover: по одному поиску на пользователя, остальная
+история не читается. Пользователи без продаж за оба дня сводку не получают.
+
+Бот подтверждает каждую отправленную страницу (digest_runs): после сбоя
+рассылка продолжается со страницы, следующей за подтвержденной. Внутри
+страницы доставка "хотя бы раз" - неподтвержденная страница уйдет заново.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import case, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.models import DigestAck
+from api.queries import STATS_FIELDS, build_stats, stats_aggregates, percent_change
+from api.timeseries import local_range_to_utc
+from database.models import User, Sale, DigestRun, to_rubles
+
+
+DIGEST_PAGE_SIZE = 500
+
+
+def digest_day(zone: ZoneInfo) -> date:
+    """День сводки - вчера по местному времени"""
+    return datetime.now(zone).date() - timedelta(days=1)
+
+
+async def get_digest_run(session: AsyncSession, day: date) -> Optional[DigestRun]:
+    return await session.get(DigestRun, day)
+
+
+async def fetch_digest_page(
+    session: AsyncSession,
+    day: date,
+    zone: ZoneInfo,
+    after_user_id: int = 0,
+    limit: int = DIGEST_PAGE_SIZE
+) -> Tuple[List[Dict], Optional[int], bool]:
+    """Сводки пользователей с id > after_user_id: (сводки, последний id страницы, есть ли еще)"""
+    users = (await session.execute(
+        select(User.id, User.telegram_id, User.first_name)
+        .where(User.id > after_user_id)
+        .order_by(User.id)
+        .limit(limit)
+    )).all()
+    if not users:
+        return [], None, False
+
+    previous_start, current_start = local_range_to_utc(day - timedelta(days=1), day - timedelta(days=1), zone)
+    _, current_end = local_range_to_utc(day, day, zone)
+    period = case((Sale.date >= current_start, "current"), else_="previous").label("period")
+    rows = await session.execute(
+        select(
+            Sale.user_id,
+            period,
+            *stats_aggregates()
+        )
+        .where(Sale.user_id.in_([user.id for user in users]))
+        .where(Sale.date >= previous_start, Sale.date < current_end)
+        .group_by(Sale.user_id, period)
+    )
+    totals = defaultdict(dict)
+    for row in rows:
+        totals[row.user_id][row.period] = row
+
+    digests = []
+    for user in users:
+        current = totals[user.id].get("current")
+        previous = totals[user.id].get("previous")
+        if current is None and previous is None:
+            continue
+        current_kopecks = current.total_kopecks if current else 0
+        previous_kopecks = previous.total_kopecks if previous else 0
+        digests.append({
+            "user_id": user.id,
+            "telegram_id": user.telegram_id,
+            "first_name": user.first_name,
+            "stats": build_stats(**{field: getattr(current, field) if current else 0 for field in STATS_FIELDS}),
+            "revenue_change": percent_change(to_rubles(current_kopecks), to_rubles(previous_kopecks))
+        })
+    return digests, users[-1].id, len(users) == limit
+
+
+async def ack_digest_page(session: AsyncSession, ack: DigestAck) -> DigestRun:
+    """Сдвинуть контрольную точку рассылки; повтор того же подтверждения ничего не меняет"""
+    run = await get_digest_run(session, ack.day)
+    if run is None:
+        run = DigestRun(day=ack.day, last_user_id=0, sent=0, failed=0, blocked=0)
+        session.add(run)
+    if ack.last_user_id > run.last_user_id:
+        run.last_user_id = ack.last_user_id
+        run.sent += ack.sent
+        run.failed += ack.failed
+        run.blocked += ack.blocked
+    if ack.finished and run.finished_at is None:
+        run.finished_at = datetime.utcnow()
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Первую страницу дня одновременно подтвердил другой процесс
+        await session.rollback()
+        return await ack_digest_page(session, ack)
+    return run
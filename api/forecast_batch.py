@@ -0,0 +1,140 @@
+"""Пакетное обновление моделей прогноза выручки всех пользователей.
+
+Запуск: python -m api.forecast_batch [число процессов]
+
+Пользователи обходятся пачками по BATCH_SIZE. Ряды пачки читаются одним
+GROUP BY, а обучение (чистый NumPy, см. refresh_model) идет в пуле
+процессов; состояния пишутся обратно в основном процессе. После прогона
+/forecast только строит прогноз по готовому состоянию.
+"""
+import asyncio
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.forecasting import HoltWinters, daily_values, refresh_model, last_complete_day
+from api.queries import fetch_daily_revenue_by_user
+from database.models import init_db, async_session, User, RevenueForecastState
+
+
+BATCH_SIZE = 500
+
+
+async def _load_states(session: AsyncSession, user_ids: List[int]) -> Dict[int, RevenueForecastState]:
+    result = await session.execute(
+        select(RevenueForecastState).where(RevenueForecastState.user_id.in_(user_ids))
+    )
+    return {row.user_id: row for row in result.scalars()}
+
+
+def _apply_states(
+    session: AsyncSession,
+    states: Dict[int, RevenueForecastState],
+    fitted: List[Tuple[int, HoltWinters]],
+    last_day: date
+):
+    """Записать обученные модели в состояния (новые строки добавляются в сессию)"""
+    for user_id, model in fitted:
+        row = states.get(user_id)
+        if row is None:
+            row = RevenueForecastState(user_id=user_id)
+            session.add(row)
+        model.to_row(row)
+        row.last_day = last_day
+
+
+async def refresh_all_models(workers: Optional[int] = None) -> int:
+    """Обучить или дообучить модели всех пользователей; возвращает число обновленных"""
+    loop = asyncio.get_running_loop()
+    yesterday = last_complete_day()
+    refreshed = 0
+    last_id = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            async with async_session() as session:
+                user_ids = (await session.execute(
+                    select(User.id).where(User.id > last_id).order_by(User.id).limit(BATCH_SIZE)
+                )).scalars().all()
+                if not user_ids:
+                    break
+                last_id = user_ids[-1]
+
+                states = await _load_states(session, user_ids)
+                stale = [
+                    user_id for user_id in user_ids
+                    if user_id not in states or states[user_id].last_day < yesterday
+                ]
+                if not stale:
+                    continue
+
+                # Нижняя граница выборки - самый ранний неучтенный день пачки
+                date_from = None
+                if all(user_id in states for user_id in stale):
+                    date_from = min(states[user_id].last_day for user_id in stale) + timedelta(days=1)
+                daily = await fetch_daily_revenue_by_user(session, stale, date_from, yesterday)
+
+                tasks = []
+                for user_id in stale:
+                    row, rows = states.get(user_id), daily.get(user_id, [])
+                    if row is not None:
+                        model, start = HoltWinters.from_row(row), row.last_day + timedelta(days=1)
+                    elif rows:
+                        model, start = None, rows[0][0]
+                    else:
+                        continue
+                    tasks.append((user_id, model, daily_values(rows, start, yesterday)))
+
+                models = await asyncio.gather(*(
+                    loop.run_in_executor(pool, refresh_model, model, values)
+                    for _, model, values in tasks
+                ))
+
+                fitted = [
+                    (user_id, model) for (user_id, _, _), model in zip(tasks, models)
+                    if model is not None
+                ]
+                _apply_states(session, states, fitted, yesterday)
+                try:
+                    await session.commit()
+                except IntegrityError:
+                    # API успел сохранить состояние кого-то из новых пользователей
+                    # пачки - оно уже актуально; остальные сохраняются повторно
+                    await session.rollback()
+                    fresh = await _load_states(session, user_ids)
+                    fitted = [
+                        (user_id, model) for user_id, model in fitted
+                        if user_id in states or user_id not in fresh
+                    ]
+                    _apply_states(session, fresh, fitted, yesterday)
+                    try:
+                        await session.commit()
+                    except IntegrityError:
+                        # Повторная гонка - пачка дообучится при следующем запуске
+                        await session.rollback()
+                        continue
+                refreshed += len(fitted)
+
+    return refreshed
+
+
+async def run(workers: Optional[int] = None) -> int:
+    await init_db()
+    return await refresh_all_models(workers)
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    started = time.perf_counter()
+    count = asyncio.run(run(workers))
+    print(f"✅ Обновлено моделей прогноза: {count} за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
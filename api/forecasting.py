@@ -0,0 +1,250 @@
+"""Прогноз дневной выручки сезонным экспоненциальным сглаживанием.
+
+Аддитивная модель Хольта-Винтерса с трендом и недельной сезонностью
+(ETS(A,A,A), Hyndman et al., 2008) в форме коррекции ошибок:
+
+    e = y - (l + b + s[t-m])
+    l = l + b + alpha * e
+    b = b + beta * e
+    s[t] = s[t-m] + gamma * e
+
+Прогноз на h дней вперед - l + h * b + s, дисперсия его ошибки
+sigma^2 * (1 + sum_{j<h} (alpha + beta * j + gamma * [j % m == 0])^2),
+отсюда интервалы прогноза.
+
+alpha, beta, gamma подбираются по сетке при первом обучении: все
+варианты сетки прогоняются по ряду одновременно, векторно по NumPy.
+Состояние модели хранится в revenue_forecast_states и дальше только
+дообучается по новым полным дням (UTC), без повторного подбора. Продажи,
+задним числом добавленные в уже учтенные дни, модель не видит до
+переобучения (состояние удаляется при перегенерации демо-данных).
+"""
+from datetime import date, datetime, timedelta
+from itertools import product
+from statistics import NormalDist
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.queries import fetch_daily_revenue
+from database.models import RevenueForecastState
+
+
+SEASON_LENGTH = 7
+MIN_HISTORY_DAYS = 2 * SEASON_LENGTH
+
+# Сетка параметров сглаживания (beta <= alpha и gamma <= 1 - alpha - условия устойчивости)
+ALPHA_GRID = (0.05, 0.1, 0.2, 0.3, 0.5)
+BETA_GRID = (0.0, 0.01, 0.05)
+GAMMA_GRID = (0.05, 0.1, 0.2, 0.3)
+
+
+def _smooth(
+    values: np.ndarray,
+    alpha: np.ndarray,
+    beta: np.ndarray,
+    gamma: np.ndarray,
+    level: np.ndarray,
+    trend: np.ndarray,
+    season: np.ndarray,
+    skip: int = 0
+) -> np.ndarray:
+    """Прогон рекурсий по ряду для K наборов параметров сразу.
+
+    level, trend - (K,), season - (K, m), season[:, 0] - компонента
+    следующего дня; массивы обновляются на месте. Возвращает сумму
+    квадратов ошибок на шаг по наблюдениям начиная с skip.
+    """
+    sse = np.zeros(len(alpha))
+    for t, y in enumerate(values):
+        error = y - (level + trend + season[:, 0])
+        level += trend + alpha * error
+        trend += beta * error
+        seasonal = season[:, 0] + gamma * error
+        season[:, :-1] = season[:, 1:]
+        season[:, -1] = seasonal
+        if t >= skip:
+            sse += error * error
+    return sse
+
+
+class HoltWinters:
+    """Состояние аддитивной модели Хольта-Винтерса с недельной сезонностью"""
+
+    def __init__(
+        self,
+        alpha: float,
+        beta: float,
+        gamma: float,
+        level: float,
+        trend: float,
+        season: np.ndarray,
+        sse: float,
+        observations: int
+    ):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.level = level
+        self.trend = trend
+        self.season = season
+        self.sse = sse
+        self.observations = observations
+
+    @classmethod
+    def fit(cls, values: Sequence[float]) -> "HoltWinters":
+        """Обучение с нуля с подбором параметров по минимуму ошибки на шаг"""
+        y = np.asarray(values, dtype=float)
+        if len(y) < MIN_HISTORY_DAYS:
+            raise ValueError(f"Нужно не менее {MIN_HISTORY_DAYS} дней истории")
+
+        m = SEASON_LENGTH
+        grid = np.array([
+            (alpha, beta, gamma)
+            for alpha, beta, gamma in product(ALPHA_GRID, BETA_GRID, GAMMA_GRID)
+            if beta <= alpha and gamma <= 1 - alpha
+        ])
+        k = len(grid)
+
+        # Начальное состояние по первым двум сезонам
+        first, second = y[:m].mean(), y[m:2 * m].mean()
+        level = np.full(k, first)
+        trend = np.full(k, (second - first) / m)
+        season = np.tile(y[:m] - first, (k, 1))
+
+        # Первый сезон служит инициализацией и в оценку ошибки не входит
+        sse = _smooth(y, grid[:, 0], grid[:, 1], grid[:, 2], level, trend, season, skip=m)
+        best = int(np.argmin(sse))
+        alpha, beta, gamma = grid[best]
+        return cls(
+            alpha=float(alpha),
+            beta=float(beta),
+            gamma=float(gamma),
+            level=float(level[best]),
+            trend=float(trend[best]),
+            season=season[best].copy(),
+            sse=float(sse[best]),
+            observations=len(y) - m
+        )
+
+    def update(self, values: Sequence[float]):
+        """Дообучение на новых днях с сохраненными параметрами"""
+        y = np.asarray(values, dtype=float)
+        if len(y) == 0:
+            return
+        level, trend = np.array([self.level]), np.array([self.trend])
+        season = self.season.reshape(1, -1).copy()
+        sse = _smooth(
+            y, np.array([self.alpha]), np.array([self.beta]), np.array([self.gamma]),
+            level, trend, season
+        )
+        self.level, self.trend = float(level[0]), float(trend[0])
+        self.season = season[0]
+        self.sse += float(sse[0])
+        self.observations += len(y)
+
+    def forecast(self, horizon: int, confidence: float = 0.95) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Прогноз на horizon дней и границы интервала; выручка не бывает отрицательной"""
+        steps = np.arange(1, horizon + 1)
+        mean = self.level + steps * self.trend + self.season[(steps - 1) % SEASON_LENGTH]
+
+        j = np.arange(1, horizon)
+        c = self.alpha + self.beta * j + self.gamma * (j % SEASON_LENGTH == 0)
+        variance = self.sigma2 * (1 + np.concatenate([[0.0], np.cumsum(c * c)]))
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        spread = z * np.sqrt(variance)
+
+        return np.clip(mean, 0, None), np.clip(mean - spread, 0, None), np.clip(mean + spread, 0, None)
+
+    @property
+    def sigma2(self) -> float:
+        return self.sse / max(self.observations, 1)
+
+    @classmethod
+    def from_row(cls, row: RevenueForecastState) -> "HoltWinters":
+        return cls(
+            alpha=row.alpha,
+            beta=row.beta,
+            gamma=row.gamma,
+            level=row.level,
+            trend=row.trend,
+            season=np.frombuffer(row.season, dtype="<f8").copy(),
+            sse=row.sse,
+            observations=row.observations
+        )
+
+    def to_row(self, row: RevenueForecastState):
+        row.alpha, row.beta, row.gamma = self.alpha, self.beta, self.gamma
+        row.level, row.trend = self.level, self.trend
+        row.season = self.season.astype("<f8").tobytes()
+        row.sse, row.observations = self.sse, self.observations
+
+
+def daily_values(rows: List[Tuple[date, int]], date_from: date, date_to: date) -> np.ndarray:
+    """Плотный ряд выручки по дням [date_from, date_to]; дни без продаж - нули"""
+    values = np.zeros(max((date_to - date_from).days + 1, 0))
+    for day, revenue in rows:
+        offset = (day - date_from).days
+        if 0 <= offset < len(values):
+            values[offset] = revenue
+    return values
+
+
+def refresh_model(model: Optional[HoltWinters], values: np.ndarray) -> Optional[HoltWinters]:
+    """Обучить модель с нуля или дообучить на новых днях.
+
+    Чистый NumPy без БД, поэтому выполняется и в пуле процессов
+    (см. api/forecast_batch.py). None - если истории пока мало.
+    """
+    if model is None:
+        return HoltWinters.fit(values) if len(values) >= MIN_HISTORY_DAYS else None
+    model.update(values)
+    return model
+
+
+def last_complete_day() -> date:
+    """Последний полный день UTC: сегодняшние продажи еще не закончились"""
+    return datetime.utcnow().date() - timedelta(days=1)
+
+
+async def get_user_model(session: AsyncSession, user_id: int) -> Tuple[Optional[HoltWinters], date]:
+    """Актуальная модель пользователя и последний учтенный ею день.
+
+    Сохраненное состояние дообучается только на днях после last_day.
+    """
+    yesterday = last_complete_day()
+    row = (await session.execute(
+        select(RevenueForecastState).where(RevenueForecastState.user_id == user_id)
+    )).scalar_one_or_none()
+
+    if row is not None:
+        model = HoltWinters.from_row(row)
+        if row.last_day >= yesterday:
+            return model, row.last_day
+        date_from = row.last_day + timedelta(days=1)
+        rows = await fetch_daily_revenue(session, user_id, date_from, yesterday)
+    else:
+        model = None
+        rows = await fetch_daily_revenue(session, user_id, None, yesterday)
+        if not rows:
+            return None, yesterday
+        date_from = rows[0][0]
+
+    model = refresh_model(model, daily_values(rows, date_from, yesterday))
+    if model is None:
+        return None, yesterday
+
+    if row is None:
+        row = RevenueForecastState(user_id=user_id)
+        session.add(row)
+    model.to_row(row)
+    row.last_day = yesterday
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Параллельный запрос уже сохранил состояние - используем посчитанное в памяти
+        await session.rollback()
+    return model, yesterday
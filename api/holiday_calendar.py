@@ -0,0 +1,170 @@
+"""Календарь праздников, скомпилированный в отсортированный индекс дат.
+
+Праздники описаны в HOLIDAYS_FILE (api/data/holidays.json) правилами:
+"date": "MM-DD" - каждый год (можно ограничить from_year/to_year),
+"dates": {"YYYY": "MM-DD"} - переходящие праздники с датой на каждый
+год, "easter_offset": N - за N дней до (N < 0) или после православной
+Пасхи, дата которой вычисляется для любого года. "demand" - средний
+рост спроса по товарным категориям, %.
+
+При загрузке правила разворачиваются в даты на годы от
+today - PAST_YEARS до today + FUTURE_YEARS и сортируются; любой запрос
+"праздники в интервале" - два bisect по этому списку. Для каждой
+товарной категории строится свой такой же индекс.
+
+Файл перечитывается при изменении (mtime проверяется не чаще раза в
+RELOAD_CHECK_SECONDS); если новый файл не читается, остается прежний
+календарь.
+"""
+import json
+import os
+import time
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+HOLIDAYS_FILE = os.getenv(
+    "HOLIDAYS_FILE",
+    os.path.join(os.path.dirname(__file__), "data", "holidays.json")
+)
+PAST_YEARS = 10  # история для персональных оценок (api/holiday_forecast.py)
+FUTURE_YEARS = 2
+RELOAD_CHECK_SECONDS = 5
+
+
+class Holiday(NamedTuple):
+    """Праздник из календаря"""
+    id: str
+    name: str
+    category: str
+    products: Tuple[str, ...]
+    demand: Dict[str, int]  # категория товаров -> рост спроса, %
+
+
+def orthodox_easter(year: int) -> date:
+    """Дата православной Пасхи по григорианскому календарю (алгоритм Гаусса-Меуса)"""
+    a, b, c = year % 4, year % 7, year % 19
+    d = (19 * c + 15) % 30
+    e = (2 * a + 4 * b - d + 34) % 7
+    month, day = divmod(d + e + 114, 31)
+    # Дата по юлианскому календарю; разница календарей растет на день в каждом
+    # столетии, кроме кратных 400
+    julian_shift = year // 100 - year // 400 - 2
+    return date(year, month, day + 1) + timedelta(days=julian_shift)
+
+
+def _rule_dates(rule: Dict, first_year: int, last_year: int) -> List[date]:
+    """Даты праздника по его правилу в диапазоне лет"""
+    if "easter_offset" in rule:
+        offset = timedelta(days=rule["easter_offset"])
+        return [orthodox_easter(year) + offset for year in range(first_year, last_year + 1)]
+    if "dates" in rule:
+        candidates = [(int(year), month_day) for year, month_day in rule["dates"].items()]
+    else:
+        years = range(max(first_year, rule.get("from_year", first_year)), min(last_year, rule.get("to_year", last_year)) + 1)
+        candidates = [(year, rule["date"]) for year in years]
+
+    dates = []
+    for year, month_day in candidates:
+        if not first_year <= year <= last_year:
+            continue
+        month, day = (int(part) for part in month_day.split("-"))
+        try:
+            dates.append(date(year, month, day))
+        except ValueError:
+            continue  # 29 февраля в невисокосный год
+    return dates
+
+
+class HolidayCalendar:
+    """Праздники, развернутые в даты, с поиском по интервалу через bisect"""
+
+    def __init__(self, rules: List[Dict], first_year: int, last_year: int, version: int = 0):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.version = version
+        self.holidays: Dict[str, Holiday] = {}
+
+        entries: List[Tuple[date, Holiday]] = []
+        for rule in rules:
+            holiday = Holiday(
+                id=rule["id"],
+                name=rule["name"],
+                category=rule.get("category", "major"),
+                products=tuple(rule.get("products", [])),
+                demand=dict(rule.get("demand", {}))
+            )
+            if holiday.id in self.holidays:
+                raise ValueError(f"Праздник '{holiday.id}' описан дважды")
+            self.holidays[holiday.id] = holiday
+            entries.extend((day, holiday) for day in _rule_dates(rule, first_year, last_year))
+
+        entries.sort(key=lambda entry: (entry[0], entry[1].id))
+        self._dates = [day for day, _ in entries]
+        self._entries = entries
+
+        # Отдельный индекс на каждую товарную категорию
+        self._by_category: Dict[str, Tuple[List[date], List[Tuple[date, Holiday]]]] = {}
+        for day, holiday in entries:
+            for category in holiday.demand:
+                dates, category_entries = self._by_category.setdefault(category, ([], []))
+                dates.append(day)
+                category_entries.append((day, holiday))
+
+    @classmethod
+    def load(cls, path: str, today: date, version: int = 0) -> "HolidayCalendar":
+        with open(path, encoding="utf-8") as f:
+            rules = json.load(f)["holidays"]
+        return cls(rules, today.year - PAST_YEARS, today.year + FUTURE_YEARS, version)
+
+    @property
+    def categories(self) -> List[str]:
+        """Товарные категории, для которых известен рост спроса"""
+        return list(self._by_category)
+
+    def covers(self, today: date) -> bool:
+        return self.first_year <= today.year - PAST_YEARS and today.year + FUTURE_YEARS <= self.last_year
+
+    def between(self, start: date, end: date) -> List[Tuple[date, Holiday]]:
+        """Праздники в интервале [start, end] по возрастанию даты"""
+        return self._entries[bisect_left(self._dates, start):bisect_right(self._dates, end)]
+
+    def category_between(self, category: str, start: date, end: date) -> List[Tuple[date, Holiday]]:
+        """Праздники с ростом спроса на категорию в интервале [start, end]"""
+        dates, entries = self._by_category.get(category, ([], []))
+        return entries[bisect_left(dates, start):bisect_right(dates, end)]
+
+    def occurrences(self, start: date, end: date) -> List[Tuple[str, date]]:
+        """[(id праздника, дата)] в интервале - для оценок по истории"""
+        return [(holiday.id, day) for day, holiday in self.between(start, end)]
+
+
+_calendar: Optional[HolidayCalendar] = None
+_loaded_mtime: Optional[int] = None
+_checked_at = 0.0
+
+
+def get_calendar() -> HolidayCalendar:
+    """Текущий календарь; перечитывает файл, если он изменился или сменился год"""
+    global _calendar, _loaded_mtime, _checked_at
+
+    now = time.monotonic()
+    if _calendar is not None and now - _checked_at < RELOAD_CHECK_SECONDS:
+        return _calendar
+    _checked_at = now
+
+    today = date.today()
+    try:
+        mtime = os.stat(HOLIDAYS_FILE).st_mtime_ns
+        if _calendar is not None and mtime == _loaded_mtime and _calendar.covers(today):
+            return _calendar
+        version = _calendar.version + 1 if _calendar is not None else 0
+        _calendar = HolidayCalendar.load(HOLIDAYS_FILE, today, version)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if _calendar is None:
+            raise
+        print(f"❌ Календарь праздников не перечитан, используется прежний: {e}")
+        mtime = _loaded_mtime if isinstance(e, OSError) else mtime
+    _loaded_mtime = mtime
+    return _calendar
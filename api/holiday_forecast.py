@@ -0,0 +1,137 @@
+"""Персональный прогноз роста спроса к праздникам по истории продаж.
+
+Для каждого праздника из календаря (api/holiday_calendar.py, за все годы
+истории) сравнивается средняя дневная выручка пользователя за неделю до
+праздника включительно с базовым уровнем - средней выручкой за четыре
+недели перед этой неделей. Оценки разных лет сглаживаются
+экспоненциально, свежие годы весят больше.
+
+Параметры хранятся в holiday_uplifts и дообучаются инкрементально: при
+изменении data_version пользователя учитываются только праздники,
+прошедшие после последнего учтенного года. Результат кэшируется в
+процессе по (пользователь, data_version, день, версия календаря).
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.holiday_calendar import get_calendar
+from api.queries import fetch_daily_revenue
+from database.models import User, HolidayUplift
+
+
+UPLIFT_WINDOW_DAYS = 7
+BASELINE_DAYS = 28
+SMOOTHING_ALPHA = 0.5
+
+_FITTED_CACHE_MAX_SIZE = 10_000
+# user_id -> ((data_version, день, версия календаря), {id праздника: рост в %}):
+# пересчет и при новых продажах, и после прошедшего праздника, и после правки календаря
+_fitted: Dict[int, Tuple[tuple, Dict[str, float]]] = {}
+
+
+def estimate_uplifts(daily: pd.Series, occurrences: pd.DataFrame) -> pd.Series:
+    """Рост выручки (%) в неделю перед каждым праздником.
+
+    daily - выручка по дням без пропусков (DatetimeIndex), occurrences -
+    DataFrame с колонкой date. Для всех дней ряд окна и базы считается
+    одной свертке rolling, затем значения выбираются по датам праздников.
+    NaN - если истории не хватает или база нулевая.
+    """
+    window = daily.rolling(UPLIFT_WINDOW_DAYS).mean()
+    baseline = daily.shift(UPLIFT_WINDOW_DAYS).rolling(BASELINE_DAYS).mean()
+    uplift = (window / baseline.replace(0, np.nan) - 1) * 100
+    return pd.Series(
+        uplift.reindex(pd.DatetimeIndex(occurrences["date"])).to_numpy(),
+        index=occurrences.index
+    )
+
+
+async def _load_daily_revenue(session: AsyncSession, user_id: int, since: Optional[date]) -> pd.Series:
+    """Выручка завершенных продаж по дням UTC"""
+    rows = await fetch_daily_revenue(session, user_id, since)
+    if not rows:
+        return pd.Series(dtype=float)
+
+    daily = pd.Series(
+        [revenue for _, revenue in rows],
+        index=pd.to_datetime([day for day, _ in rows]),
+        dtype=float
+    )
+    # Дни без продаж внутри истории - нулевая выручка, а не пропуск
+    yesterday = pd.Timestamp(datetime.utcnow().date() - timedelta(days=1))
+    end = max(daily.index[-1], yesterday)
+    return daily.reindex(pd.date_range(daily.index[0], end, freq="D"), fill_value=0.0)
+
+
+async def fit_user_uplifts(session: AsyncSession, user: User) -> Dict[str, float]:
+    """Персональный рост к праздникам {id праздника: %}; только для праздников с историей"""
+    today = datetime.utcnow().date()
+    calendar = get_calendar()
+    cache_key = (user.data_version, today, calendar.version)
+    cached = _fitted.get(user.id)
+    if cached is not None and cached[0] == cache_key:
+        return cached[1]
+
+    result = await session.execute(
+        select(HolidayUplift).where(HolidayUplift.user_id == user.id)
+    )
+    states = {row.holiday: row for row in result.scalars()}
+
+    keys = list(calendar.holidays)
+
+    # Инкрементально: грузим историю только начиная с базы первого неучтенного праздника
+    since = None
+    if all(key in states for key in keys):
+        next_year = min(state.last_year for state in states.values()) + 1
+        since = date(next_year, 1, 1) - timedelta(days=UPLIFT_WINDOW_DAYS + BASELINE_DAYS)
+
+    daily = await _load_daily_revenue(session, user.id, since)
+    if not daily.empty:
+        first_day = daily.index[0].date()
+        occurrences = pd.DataFrame(
+            [
+                (key, day.year, day)
+                for key, day in calendar.occurrences(first_day, today - timedelta(days=1))
+                if key not in states or day.year > states[key].last_year
+            ],
+            columns=["holiday", "year", "date"]
+        )
+        occurrences = occurrences.assign(uplift=estimate_uplifts(daily, occurrences))
+
+        for key, group in occurrences.sort_values("year").groupby("holiday"):
+            state = states.get(key)
+            if state is None:
+                state = HolidayUplift(user_id=user.id, holiday=key, uplift=None, observations=0)
+                session.add(state)
+                states[key] = state
+            for year, value in zip(group["year"], group["uplift"]):
+                if not np.isnan(value):
+                    state.uplift = value if state.uplift is None else (
+                        SMOOTHING_ALPHA * value + (1 - SMOOTHING_ALPHA) * state.uplift
+                    )
+                    state.observations += 1
+                state.last_year = int(year)
+
+    uplifts = {
+        key: round(state.uplift)
+        for key, state in states.items()
+        if state.uplift is not None
+    }
+
+    if not daily.empty:
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Параллельный запрос уже сохранил параметры - используем посчитанные в памяти
+            await session.rollback()
+
+    if len(_fitted) >= _FITTED_CACHE_MAX_SIZE:
+        _fitted.clear()
+    _fitted[user.id] = (cache_key, uplifts)
+    return uplifts
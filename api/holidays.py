@@ -1,128 +1,122 @@
-from datetime import datetime, timedelta
-from typing import List, Dict
-
-# Российские праздники 2025
-RUSSIAN_HOLIDAYS = {
-    "2025-01-01": {"name": "Новый год", "category": "major", "products": ["шампанское", "фейерверки", "подарки"]},
-    "2025-01-07": {"name": "Рождество", "category": "major", "products": ["сладости", "подарки детям"]},
-    "2025-02-14": {"name": "День святого Валентина", "category": "commercial", "products": ["цветы", "конфеты", "подарки"]},
-    "2025-02-23": {"name": "День защитника Отечества", "category": "major", "products": ["алкоголь", "мужские подарки", "сувениры"]},
-    "2025-03-08": {"name": "Международный женский день", "category": "major", "products": ["цветы", "духи", "украшения", "косметика"]},
-    "2025-05-01": {"name": "Праздник Весны и Труда", "category": "major", "products": ["шашлык", "уголь", "пикник"]},
-    "2025-05-09": {"name": "День Победы", "category": "major", "products": ["цветы", "георгиевская лента"]},
-    "2025-06-12": {"name": "День России", "category": "major", "products": ["флаги", "сувениры"]},
-    "2025-09-01": {"name": "День знаний", "category": "seasonal", "products": ["школьные принадлежности", "цветы", "рюкзаки"]},
-    "2025-11-04": {"name": "День народного единства", "category": "major", "products": []},
-    "2025-12-31": {"name": "Новый год (подготовка)", "category": "major", "products": ["елки", "украшения", "подарки", "шампанское"]}
-}
-
-# Средний рост спроса по категориям (в процентах)
-DEMAND_PATTERNS = {
-    "цветы": {
-        "2025-02-14": 280,  # +280% к обычному спросу
-        "2025-03-08": 350,
-        "2025-09-01": 200
-    },
-    "алкоголь": {
-        "2025-02-23": 180,
-        "2025-12-31": 300,
-        "2025-01-01": 150
-    },
-    "подарки": {
-        "2025-12-31": 400,
-        "2025-03-08": 250,
-        "2025-02-14": 200,
-        "2025-02-23": 150
-    },
-    "школьные принадлежности": {
-        "2025-09-01": 500
-    },
-    "шампанское": {
-        "2025-12-31": 450,
-        "2025-01-01": 200
-    },
-    "сувениры": {
-        "2025-02-23": 180,
-        "2025-03-08": 150
-    }
-}
-
-
-def get_upcoming_holidays(days_ahead: int = 30) -> List[Dict]:
-    """Получить ближайшие праздники"""
-    today = datetime.now()
-    upcoming = []
-
-    for date_str, info in RUSSIAN_HOLIDAYS.items():
-        holiday_date = datetime.strptime(date_str, "%Y-%m-%d")
-        days_until = (holiday_date - today).days
-
-        if 0 <= days_until <= days_ahead:
-            upcoming.append({
-                "date": date_str,
-                "name": info["name"],
-                "category": info["category"],
-                "days_until": days_until,
-                "products": info["products"],
-                "week_before": days_until <= 14,
-                "urgent": days_until <= 7
-            })
-
-    return sorted(upcoming, key=lambda x: x["days_until"])
-
-
-def get_demand_forecast(product_category: str, days_ahead: int = 30) -> List[Dict]:
-    """Прогноз спроса на товарную категорию"""
-    today = datetime.now()
-    forecast = []
-
-    if product_category not in DEMAND_PATTERNS:
-        return []
-
-    pattern = DEMAND_PATTERNS[product_category]
-
-    for date_str, demand_increase in pattern.items():
-        holiday_date = datetime.strptime(date_str, "%Y-%m-%d")
-        days_until = (holiday_date - today).days
-
-        if 0 <= days_until <= days_ahead:
-            holiday_info = RUSSIAN_HOLIDAYS.get(date_str, {})
-            forecast.append({
-                "date": date_str,
-                "holiday": holiday_info.get("name", ""),
-                "days_until": days_until,
-                "demand_increase": demand_increase,
-                "peak_week": days_until <= 7
-            })
-
-    return sorted(forecast, key=lambda x: x["days_until"])
+from datetime import date, timedelta
+from typing import Callable, List, Dict, Optional
+
+from api.holiday_calendar import HolidayCalendar, get_calendar
+
+# Результаты на текущий день: сбрасываются в полночь и при перезагрузке календаря
+_memo: Dict[tuple, List[Dict]] = {}
+_memo_stamp: tuple = (None, None)
+
+
+def _memoized(key: tuple, compute: Callable[[HolidayCalendar, date], List[Dict]]) -> List[Dict]:
+    global _memo_stamp
+
+    calendar = get_calendar()
+    today = date.today()
+    if _memo_stamp != (today, calendar.version):
+        _memo.clear()
+        _memo_stamp = (today, calendar.version)
+
+    result = _memo.get(key)
+    if result is None:
+        result = _memo[key] = compute(calendar, today)
+    return result
+
+
+def has_category(product_category: str) -> bool:
+    """Известен ли рост спроса на категорию товаров"""
+    return product_category in get_calendar().categories
+
+
+def get_upcoming_holidays(days_ahead: int = 30, uplifts: Optional[Dict[str, float]] = None) -> List[Dict]:
+    """Получить ближайшие праздники (uplifts - персональный рост выручки по id праздника)"""
+    def compute(calendar: HolidayCalendar, today: date) -> List[Dict]:
+        return [
+            {
+                "id": holiday.id,
+                "date": day.isoformat(),
+                "name": holiday.name,
+                "category": holiday.category,
+                "days_until": (day - today).days,
+                "products": list(holiday.products),
+                "week_before": (day - today).days <= 14,
+                "urgent": (day - today).days <= 7
+            }
+            for day, holiday in calendar.between(today, today + timedelta(days=days_ahead))
+        ]
+
+    upcoming = _memoized(("upcoming", days_ahead), compute)
+    if uplifts is None:
+        return upcoming
+    return [{**item, "revenue_uplift": uplifts.get(item["id"])} for item in upcoming]
+
+
+def get_demand_forecast(
+    product_category: str,
+    days_ahead: int = 30,
+    uplifts: Optional[Dict[str, float]] = None
+) -> List[Dict]:
+    """Прогноз спроса на товарную категорию.
+
+    demand_increase - средний рост спроса на категорию из календаря. Если
+    переданы uplifts (персональный рост всей выручки пользователя по id
+    праздника), он добавляется отдельным полем revenue_uplift: история
+    продаж не разделена по категориям и не заменяет среднее по категории.
+    """
+    def compute(calendar: HolidayCalendar, today: date) -> List[Dict]:
+        return [
+            {
+                "date": day.isoformat(),
+                "holiday_id": holiday.id,
+                "holiday": holiday.name,
+                "days_until": (day - today).days,
+                "demand_increase": holiday.demand[product_category],
+                "peak_week": (day - today).days <= 7
+            }
+            for day, holiday in calendar.category_between(
+                product_category, today, today + timedelta(days=days_ahead)
+            )
+        ]
+
+    forecast = _memoized(("demand", product_category, days_ahead), compute)
+    if uplifts is None:
+        return forecast
+    return [{**item, "revenue_uplift": uplifts.get(item["holiday_id"])} for item in forecast]
 
 
 def get_peak_sales_periods() -> List[Dict]:
     """Пиковые периоды продаж на ближайший месяц"""
-    holidays = get_upcoming_holidays(30)
-    peaks = []
-
-    for holiday in holidays:
-        if holiday["products"]:
-            peaks.append({
+    def compute(calendar: HolidayCalendar, today: date) -> List[Dict]:
+        return [
+            {
                 "period": f"{holiday['days_until']} дней до {holiday['name']}",
                 "date": holiday["date"],
                 "days_until": holiday["days_until"],
                 "holiday": holiday["name"],
                 "top_products": holiday["products"][:3],
                 "alert_level": "high" if holiday["urgent"] else "medium" if holiday["week_before"] else "low"
-            })
+            }
+            for holiday in get_upcoming_holidays(30)
+            if holiday["products"]
+        ]
+
+    return _memoized(("peaks",), compute)
 
-    return peaks
 
+def get_category_insights(
+    uplifts: Optional[Dict[str, float]] = None,
+    category_totals: Optional[Dict[str, Dict]] = None
+) -> List[Dict]:
+    """Инсайты по всем категориям.
 
-def get_category_insights() -> List[Dict]:
-    """Инсайты по всем категориям"""
+    uplifts - персональный рост выручки по id праздника (поле revenue_uplift),
+    category_totals - выручка пользователя по категориям товаров
+    (api/queries.py: fetch_category_totals), добавляется к инсайтам.
+    """
     insights = []
 
-    for category in DEMAND_PATTERNS.keys():
-        forecast = get_demand_forecast(category, 30)
+    for category in get_calendar().categories:
+        forecast = get_demand_forecast(category, 30, uplifts)
         if forecast:
             next_peak = forecast[0]
             insights.append({
@@ -130,7 +124,13 @@ def get_category_insights() -> List[Dict]:
                 "next_holiday": next_peak["holiday"],
                 "days_until": next_peak["days_until"],
                 "expected_growth": next_peak["demand_increase"],
-                "recommendation": f"Пик через {next_peak['days_until']} дней. Прогноз: +{next_peak['demand_increase']}%"
+                "recommendation": f"Пик через {next_peak['days_until']} дней. Прогноз: {next_peak['demand_increase']:+}%"
             })
+            if uplifts is not None:
+                insights[-1]["revenue_uplift"] = next_peak["revenue_uplift"]
+            if category_totals is not None:
+                totals = category_totals.get(category, {})
+                insights[-1]["your_revenue"] = totals.get("total_amount", 0.0)
+                insights[-1]["your_share"] = totals.get("share", 0.0)
 
     return sorted(insights, key=lambda x: x["days_until"])
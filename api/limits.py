@@ -0,0 +1,225 @@
+"""Ограничение частоты и допуск к дорогим эндпоинтам.
+
+Частота: token bucket на (класс маршрута, пользователь) в форме GCRA -
+на ключ хранится одно число, теоретическое время следующего запроса
+(TAT). Запрос пропускается, если TAT опережает текущее время не больше
+чем на (burst - 1) интервалов; иначе 429 с Retry-After до ближайшего
+свободного токена.
+
+Хранилище подключаемое (RATE_LIMIT_STORE): memory - в процессе (по
+умолчанию, один воркер), database - таблица rate_limit_buckets, общая
+для всех воркеров API; проверка - один атомарный UPDATE.
+
+Допуск: сборка отчетов ограничена REPORT_CONCURRENCY одновременными
+сборками на процесс с очередью ожидания не длиннее REPORT_QUEUE_SIZE;
+при полной очереди или ожидании дольше REPORT_QUEUE_TIMEOUT_SECONDS -
+429. Дешевые чтения дашборда через очередь не проходят.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, NamedTuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database.models import async_session, RateLimitBucket
+
+
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+REPORT_CONCURRENCY = int(os.getenv("REPORT_CONCURRENCY", 1))
+REPORT_QUEUE_SIZE = int(os.getenv("REPORT_QUEUE_SIZE", 16))
+REPORT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("REPORT_QUEUE_TIMEOUT_SECONDS", 30))
+
+MEMORY_STORE_MAX_KEYS = 100_000
+PRUNE_EVERY_CALLS = 1000
+
+
+class RateLimit(NamedTuple):
+    """per_minute - устойчивая частота, burst - сколько запросов подряд без ожидания"""
+    per_minute: float
+    burst: int
+
+    @property
+    def interval(self) -> float:
+        return 60 / self.per_minute
+
+    @property
+    def tolerance(self) -> float:
+        return (self.burst - 1) * self.interval
+
+
+# Классы маршрутов: отчеты, пересоздание демо-данных, агрегаты дашборда
+RATE_LIMITS: Dict[str, RateLimit] = {
+    "report": RateLimit(per_minute=6, burst=3),
+    "demo": RateLimit(per_minute=2, burst=2),
+    "aggregate": RateLimit(per_minute=300, burst=60),
+}
+
+
+class LimitExceeded(Exception):
+    """Запрос отклонен ограничителем; retry_after - через сколько секунд повторить"""
+
+    def __init__(self, retry_after: float, detail: str):
+        super().__init__(detail)
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+async def limit_exceeded_handler(request: Request, exc: LimitExceeded) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    )
+
+
+class MemoryStore:
+    """TAT ключей в памяти процесса"""
+
+    def __init__(self, max_keys: int = MEMORY_STORE_MAX_KEYS):
+        self.max_keys = max_keys
+        self._tat: Dict[str, float] = {}
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        """0 - запрос пропущен, иначе секунды до следующей попытки"""
+        now = time.monotonic()
+        tat = max(self._tat.get(key, now), now)
+        if tat - now > limit.tolerance:
+            return tat - now - limit.tolerance
+        if key not in self._tat and len(self._tat) >= self.max_keys:
+            self._prune(now)
+        self._tat[key] = tat + limit.interval
+        return 0.0
+
+    def _prune(self, now: float):
+        # TAT в прошлом - полное ведро, то же самое, что отсутствующий ключ
+        for key in [key for key, tat in self._tat.items() if tat <= now]:
+            del self._tat[key]
+
+
+class DatabaseStore:
+    """TAT ключей в таблице rate_limit_buckets (общая для воркеров API)"""
+
+    def __init__(self):
+        self._calls = 0
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        now = time.time()
+        tat = case((RateLimitBucket.tat > now, RateLimitBucket.tat), else_=now)
+        async with async_session() as session:
+            result = await session.execute(
+                update(RateLimitBucket)
+                .where(RateLimitBucket.key == key, tat - now <= limit.tolerance)
+                .values(tat=tat + limit.interval)
+            )
+            if result.rowcount:
+                await session.commit()
+                await self._maybe_prune(now)
+                return 0.0
+
+            stored = await session.scalar(select(RateLimitBucket.tat).where(RateLimitBucket.key == key))
+            if stored is None:
+                session.add(RateLimitBucket(key=key, tat=now + limit.interval))
+                try:
+                    await session.commit()
+                    return 0.0
+                except IntegrityError:
+                    pass  # ключ вставил другой воркер - проверяем заново
+            elif stored - now > limit.tolerance:
+                return stored - now - limit.tolerance
+
+        return await self.acquire(key, limit)
+
+    async def _maybe_prune(self, now: float):
+        self._calls += 1
+        if self._calls % PRUNE_EVERY_CALLS:
+            return
+        async with async_session() as session:
+            await session.execute(delete(RateLimitBucket).where(RateLimitBucket.tat < now))
+            await session.commit()
+
+
+class RateLimiter:
+    """Token bucket на (класс маршрута, пользователь) поверх хранилища"""
+
+    def __init__(self, store, limits: Dict[str, RateLimit] = RATE_LIMITS):
+        self.store = store
+        self.limits = limits
+        self.metrics: Counter = Counter()
+
+    async def check(self, route_class: str, telegram_id: int):
+        limit = self.limits[route_class]
+        retry_after = await self.store.acquire(f"{route_class}:{telegram_id}", limit)
+        if retry_after > 0:
+            self.metrics[f"{route_class}_rejected"] += 1
+            raise LimitExceeded(retry_after, "Слишком много запросов, повторите позже")
+        self.metrics[f"{route_class}_allowed"] += 1
+
+    def dependency(self, route_class: str):
+        """Зависимость FastAPI для маршрутов с параметром telegram_id"""
+        async def check_rate_limit(telegram_id: int):
+            await self.check(route_class, telegram_id)
+        return check_rate_limit
+
+
+class ConcurrencyGate:
+    """Не больше limit одновременных операций, остальные ждут в ограниченной очереди"""
+
+    def __init__(self, limit: int, max_queue: int, timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.metrics: Counter = Counter()
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.metrics["rejected"] += 1
+            raise LimitExceeded(self.timeout, "Сервер занят сборкой отчетов, повторите позже")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.metrics["timed_out"] += 1
+            raise LimitExceeded(self.timeout, "Сервер занят сборкой отчетов, повторите позже")
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.metrics["admitted"] += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def metrics_snapshot(self) -> Dict[str, int]:
+        return {
+            **self.metrics,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+        }
+
+
+rate_limiter = RateLimiter(DatabaseStore() if RATE_LIMIT_STORE == "database" else MemoryStore())
+report_gate = ConcurrencyGate(REPORT_CONCURRENCY, REPORT_QUEUE_SIZE, REPORT_QUEUE_TIMEOUT_SECONDS)
+
+
+def limits_snapshot() -> Dict:
+    return {
+        "store": RATE_LIMIT_STORE,
+        "rate_limits": dict(rate_limiter.metrics),
+        "reports": report_gate.metrics_snapshot(),
+    }
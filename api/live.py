@@ -0,0 +1,257 @@
+"""Живой дашборд: изменения продаж в реальном времени через Server-Sent Events.
+
+Каждое изменение продаж пишется в sales_events в той же транзакции, что
+и сами продажи (database/models.py: bump_data_version). Один фоновый
+опрос на процесс API читает новые события (LIVE_POLL_SECONDS) и для
+пользователей с открытыми подключениями один раз считает дельту
+дашборда - KPI, точки графика начиная с самого раннего измененного дня
+и топ товаров - из горячего кэша. Готовое SSE-сообщение раскладывается
+по очередям подключений, поэтому тысячи простаивающих подключений
+стоят только по корутине с очередью и не трогают БД.
+
+Номер события - id в SSE. При переподключении браузер присылает
+Last-Event-ID; если с тех пор у пользователя были события, сразу
+отправляется снимок дашборда (так же, как при первом подключении).
+Медленный клиент, у которого переполнилась очередь, отключается - он
+переподключится и получит снимок.
+
+Номера событий выдаются при вставке, а видны после коммита: в PostgreSQL
+транзакция с меньшим id может зафиксироваться позже большего. Пропущенные
+номера ниже прочитанного максимума запоминаются и перечитываются еще
+LIVE_GAP_SECONDS - дольше незакрытых транзакций с продажами не бывает, а
+номера откатившихся транзакций так и остаются пропусками.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from sqlalchemy import select, func, delete, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import async_session, SalesEvent, KOPECKS_PER_RUBLE, to_rubles
+from database.hot_cache import hot_cache
+from database.sketches import load_check_sketch
+from api.queries import build_stats, name_top_products
+from api.timeseries import bucket_labels
+
+
+LIVE_POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", 1.0))
+HEARTBEAT_SECONDS = 15
+EVENT_RETENTION_HOURS = 24
+PRUNE_EVERY_POLLS = 600
+POLL_BATCH_SIZE = 1000
+LIVE_GAP_SECONDS = float(os.getenv("LIVE_GAP_SECONDS", 30))
+MAX_TRACKED_GAPS = 1000
+QUEUE_SIZE = 32  # непрочитанных сообщений у подключения, дальше - отключение
+
+# Окно дашборда (web_app/src/components/Dashboard.jsx)
+DASHBOARD_DAYS = 30
+DASHBOARD_TOP_LIMIT = 5
+
+_DISCONNECT = None  # маркер в очереди: подключение нужно закрыть
+
+
+def format_event(event_id: int, event: str, payload: Dict) -> str:
+    """Сообщение в формате text/event-stream"""
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def dashboard_state(session: AsyncSession, user_id: int, since: Optional[datetime] = None) -> Dict:
+    """KPI, дневной график и топ товаров за окно дашборда.
+
+    since - самая ранняя измененная продажа: график отдается начиная с
+    ее дня (дельта); None - весь график (снимок).
+    """
+    date_to = datetime.utcnow().date()
+    date_from = date_to - timedelta(days=DASHBOARD_DAYS - 1)
+    window_start = datetime.combine(date_from, datetime.min.time())
+    columns = await hot_cache.get(session, user_id, window_start)
+
+    # KPI - как /stats?days=30: последние 30 суток от текущего момента
+    stats_since = datetime.utcnow() - timedelta(days=DASHBOARD_DAYS)
+    sketch = await load_check_sketch(session, user_id, stats_since.date())
+    median, p90, p99 = (
+        to_rubles(value) if value is not None else None
+        for value in sketch.quantiles([0.5, 0.9, 0.99])
+    )
+    stats = {
+        **build_stats(**columns.stats(stats_since)),
+        "median_check": median, "p90_check": p90, "p99_check": p99,
+    }
+
+    chart_from = max(date_from, since.date()) if since is not None else date_from
+    days = (date_to - date_from).days + 1
+    values = (columns.daily_revenue(date_from, days) / KOPECKS_PER_RUBLE).round(2).tolist()
+    offset = (chart_from - date_from).days
+    chart = {"labels": list(bucket_labels("day", chart_from, date_to)), "values": values[offset:]}
+
+    top_products = await name_top_products(session, columns.top_products(window_start, DASHBOARD_TOP_LIMIT))
+    return {"stats": stats, "chart": chart, "top_products": top_products}
+
+
+class LiveHub:
+    """Подписки процесса API на изменения продаж и рассылка по ним"""
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self.last_event_id = 0
+        # Пропущенные номера событий -> когда замечен пропуск (time.monotonic)
+        self._gaps: "OrderedDict[int, float]" = OrderedDict()
+
+    @property
+    def connections(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id: int, message: str):
+        for queue in list(self._subscribers.get(user_id, ())):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Клиент не успевает читать: отключаем, после переподключения будет снимок
+                self.unsubscribe(user_id, queue)
+                queue.get_nowait()
+                queue.put_nowait(_DISCONNECT)
+
+    async def start(self):
+        """Начать с текущего конца журнала событий"""
+        async with async_session() as session:
+            self.last_event_id = (await session.execute(select(func.max(SalesEvent.id)))).scalar() or 0
+
+    async def poll(self) -> int:
+        """Прочитать новые события и разослать дельты; возвращает число событий"""
+        self._expire_gaps()
+        new_events = SalesEvent.id > self.last_event_id
+        async with async_session() as session:
+            events = (await session.execute(
+                select(SalesEvent.id, SalesEvent.user_id, SalesEvent.since, SalesEvent.data_version)
+                .where(or_(new_events, SalesEvent.id.in_(list(self._gaps))) if self._gaps else new_events)
+                .order_by(SalesEvent.id)
+                .limit(POLL_BATCH_SIZE)
+            )).all()
+            if not events:
+                return 0
+            self._track_gaps([event.id for event in events])
+
+            # По пользователю: последнее событие и самая ранняя затронутая дата
+            changes: Dict[int, List] = {}
+            for event in events:
+                # Продажи мог записать другой процесс - колонки в кэше устарели
+                hot_cache.invalidate(event.user_id)
+                change = changes.get(event.user_id)
+                if change is None:
+                    changes[event.user_id] = [event.id, event.since, event.data_version]
+                    continue
+                # Поздно зафиксированное событие может быть старше уже прочитанных
+                change[0], change[2] = max(change[0], event.id), max(change[2], event.data_version)
+                if change[1] is not None:
+                    change[1] = None if event.since is None else min(change[1], event.since)
+
+            for user_id, (event_id, since, data_version) in changes.items():
+                if user_id not in self._subscribers:
+                    continue
+                try:
+                    payload = await dashboard_state(session, user_id, since)
+                except Exception as e:
+                    print(f"❌ Ошибка расчета живого дашборда пользователя {user_id}: {e}")
+                    continue
+                payload["data_version"] = data_version
+                self.publish(user_id, format_event(event_id, "delta" if since else "snapshot", payload))
+        return len(events)
+
+    def _track_gaps(self, event_ids: List[int]):
+        """Сдвинуть максимум прочитанных номеров и запомнить пропуски под ним"""
+        now = time.monotonic()
+        for event_id in event_ids:
+            if event_id <= self.last_event_id:
+                self._gaps.pop(event_id, None)
+                continue
+            for missing in range(max(self.last_event_id + 1, event_id - MAX_TRACKED_GAPS), event_id):
+                self._gaps[missing] = now
+            self.last_event_id = event_id
+        while len(self._gaps) > MAX_TRACKED_GAPS:
+            self._gaps.popitem(last=False)
+
+    def _expire_gaps(self):
+        """Забыть пропуски старше LIVE_GAP_SECONDS (номера откатившихся транзакций)"""
+        cutoff = time.monotonic() - LIVE_GAP_SECONDS
+        while self._gaps and next(iter(self._gaps.values())) < cutoff:
+            self._gaps.popitem(last=False)
+
+    async def prune(self):
+        """Удалить события старше EVENT_RETENTION_HOURS"""
+        cutoff = datetime.utcnow() - timedelta(hours=EVENT_RETENTION_HOURS)
+        async with async_session() as session:
+            await session.execute(delete(SalesEvent).where(SalesEvent.created_at < cutoff))
+            await session.commit()
+
+    async def run(self):
+        """Фоновая задача API: опрос журнала событий"""
+        await self.start()
+        polls = 0
+        while True:
+            try:
+                # Пачка заполнена целиком - в журнале есть еще события, читаем без паузы
+                if await self.poll() == POLL_BATCH_SIZE:
+                    continue
+                polls += 1
+                if polls % PRUNE_EVERY_POLLS == 0:
+                    await self.prune()
+            except Exception as e:
+                print(f"❌ Ошибка опроса изменений продаж: {e}")
+            await asyncio.sleep(LIVE_POLL_SECONDS)
+
+
+live_hub = LiveHub()
+
+
+async def dashboard_stream(user_id: int, last_event_id: Optional[int]) -> AsyncIterator[str]:
+    """SSE-поток дашборда пользователя: снимок, затем дельты и heartbeat"""
+    # Подписка до чтения снимка: событие между ними придет дельтой, а не потеряется
+    queue = live_hub.subscribe(user_id)
+    try:
+        async with async_session() as session:
+            latest = (await session.execute(
+                select(SalesEvent.id, SalesEvent.data_version)
+                .where(SalesEvent.user_id == user_id)
+                .order_by(SalesEvent.id.desc())
+                .limit(1)
+            )).first()
+            latest_id = latest.id if latest else 0
+            if last_event_id is None or last_event_id < latest_id:
+                payload = await dashboard_state(session, user_id)
+                payload["data_version"] = latest.data_version if latest else None
+                snapshot = format_event(latest_id, "snapshot", payload)
+            else:
+                snapshot = None
+        # Сессия закрыта до начала ожидания: подключение не держит соединение с БД
+        yield "retry: 3000\n\n"
+        if snapshot is not None:
+            yield snapshot
+
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if message is _DISCONNECT:
+                return
+            yield message
+    finally:
+        live_hub.unsubscribe(user_id, queue)
@@ -3,8 +3,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from database.models import init_db
 from api.routes import router
+from api.anomalies import anomaly_detection_loop
+from api.live import live_hub
+from api.report_batch import prerender_loop, REPORT_PRERENDER_HOUR
+from api.retention import retention_loop, DEMO_USER_TTL_DAYS
+from api.limits import LimitExceeded, limit_exceeded_handler
+from api.holiday_calendar import get_calendar
+import asyncio
 import os
 
+# Бот в режиме webhook внутри процесса API (вместо отдельного bot.main)
+BOT_WEBHOOK_IN_API = os.getenv("BOT_WEBHOOK_IN_API", "False") == "True"
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -12,8 +22,31 @@ async def lifespan(app: FastAPI):
     # Инициализация БД
     await init_db()
     print("✅ База данных инициализирована")
+    # Компиляция календаря праздников (ошибка в файле видна сразу при старте)
+    calendar = get_calendar()
+    print(f"✅ Календарь праздников: {len(calendar.holidays)} праздников")
+    # Фоновый поиск аномалий в продажах
+    anomaly_task = asyncio.create_task(anomaly_detection_loop())
+    # Опрос журнала изменений продаж для живого дашборда
+    live_task = asyncio.create_task(live_hub.run())
+    # Ночная сборка отчетов за период для активных пользователей
+    prerender_task = asyncio.create_task(prerender_loop()) if REPORT_PRERENDER_HOUR else None
+    # Удаление устаревших демо-пользователей
+    retention_task = asyncio.create_task(retention_loop()) if DEMO_USER_TTL_DAYS else None
+    if BOT_WEBHOOK_IN_API:
+        from bot.webhook import create_processor
+        app.state.webhook = create_processor()
+        await app.state.webhook.start()
     yield
+    if BOT_WEBHOOK_IN_API:
+        await app.state.webhook.close()
     # Cleanup при завершении
+    anomaly_task.cancel()
+    live_task.cancel()
+    if prerender_task:
+        prerender_task.cancel()
+    if retention_task:
+        retention_task.cancel()
     print("👋 API сервер остановлен")
 
 
@@ -34,8 +67,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 429 с Retry-After при превышении лимитов (api/limits.py)
+app.add_exception_handler(LimitExceeded, limit_exceeded_handler)
+
 # Подключение роутеров
 app.include_router(router, prefix="/api", tags=["api"])
+if BOT_WEBHOOK_IN_API:
+    from bot.webhook import create_webhook_router
+    app.include_router(create_webhook_router())
 
 
 @app.get("/")
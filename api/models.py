@@ -1,12 +1,12 @@
 from pydantic import BaseModel
-from datetime import datetime
-from typing import List, Optional
+from datetime import date, datetime
+from typing import Dict, List, Optional
 
 
 class SaleBase(BaseModel):
     """Базовая модель продажи"""
     product_name: str
-    amount: float
+    amount: float  # цена за единицу в рублях (в БД хранится в копейках)
     quantity: int
     date: datetime
     status: str
@@ -26,6 +26,21 @@ class SaleResponse(SaleBase):
         from_attributes = True
 
 
+class SearchTotals(BaseModel):
+    """Итоги по всем найденным продажам"""
+    total_amount: float
+    total_quantity: int
+    sales_count: int
+    products_count: int  # товары каталога, подходящие под запрос
+
+
+class SearchResponse(BaseModel):
+    """Страница результатов поиска продаж"""
+    sales: List[SaleResponse]
+    next_cursor: Optional[str]  # None - страниц больше нет
+    totals: Optional[SearchTotals]  # только на первой странице
+
+
 class UserBase(BaseModel):
     """Базовая модель пользователя"""
     telegram_id: int
@@ -57,6 +72,17 @@ class StatsResponse(BaseModel):
     pending_sales: int
     cancelled_sales: int
     conversion_rate: float
+    # Квантили чека завершенных продаж (оценка скетча, ошибка до 1%)
+    median_check: Optional[float] = None
+    p90_check: Optional[float] = None
+    p99_check: Optional[float] = None
+
+
+class CheckDistributionResponse(BaseModel):
+    """Распределение чеков завершенных продаж"""
+    count: int
+    relative_error: float  # максимальная относительная ошибка квантилей
+    quantiles: Dict[str, Optional[float]]  # p50, p75, p90, p95, p99 в рублях
 
 
 class ChartDataPoint(BaseModel):
@@ -71,6 +97,20 @@ class ChartResponse(BaseModel):
     values: List[float]
 
 
+class SeriesResponse(ChartResponse):
+    """Временной ряд с параметрами группировки"""
+    bucket: str
+    metric: str
+    timezone: str
+
+
+class ForecastResponse(ChartResponse):
+    """Прогноз дневной выручки с интервалом"""
+    lower: List[float]
+    upper: List[float]
+    confidence: float  # уровень доверия интервала
+
+
 class TopProduct(BaseModel):
     """Топ товар"""
     product_name: str
@@ -82,3 +122,165 @@ class TopProduct(BaseModel):
 class TopProductsResponse(BaseModel):
     """Модель топ товаров"""
     products: List[TopProduct]
+
+
+class CategoryTotal(BaseModel):
+    """Выручка товарной категории"""
+    category: Optional[str]  # None - категория не определена
+    total_amount: float
+    total_quantity: int
+    sales_count: int
+    share: float  # доля выручки, %
+
+
+class CategoriesResponse(BaseModel):
+    """Выручка по товарным категориям"""
+    categories: List[CategoryTotal]
+
+
+class PeriodSummary(BaseModel):
+    """KPI и топ товаров за период"""
+    date_from: date
+    date_to: date
+    stats: StatsResponse
+    top_products: List[TopProduct]
+
+
+class ComparisonResponse(BaseModel):
+    """Сравнение текущего периода с предыдущим"""
+    window: str
+    current: PeriodSummary
+    previous: PeriodSummary
+    deltas: Dict[str, Optional[float]]  # изменение KPI в процентах, None при нулевой базе
+
+
+class TrendsResponse(BaseModel):
+    """Дневные тренды выручки"""
+    labels: List[str]
+    revenue: List[float]
+    rolling_average: List[float]  # скользящее среднее за 7 дней
+    cumulative: List[float]
+    growth_day: List[Optional[float]]  # рост к предыдущему дню, %
+    growth_week: List[Optional[float]]  # рост к тому же дню неделей ранее, %
+
+
+class WeekdayProfile(BaseModel):
+    """Профиль продаж по дням недели"""
+    labels: List[str]
+    average_revenue: List[float]
+    sales_count: List[int]
+
+
+class HourlyProfile(BaseModel):
+    """Профиль продаж по часам суток"""
+    labels: List[str]
+    revenue: List[float]
+    sales_count: List[int]
+
+
+class ProfileResponse(BaseModel):
+    """Профили продаж по дням недели и часам"""
+    weekday: WeekdayProfile
+    hourly: HourlyProfile
+
+
+class AbcProduct(BaseModel):
+    """Товар в ABC-анализе"""
+    product_name: str
+    total_amount: float
+    share: float  # доля выручки, %
+    cumulative_share: float  # накопленная доля, %
+    abc_class: str
+
+
+class AbcResponse(BaseModel):
+    """ABC-классификация товаров"""
+    products: List[AbcProduct]
+
+
+class Anomaly(BaseModel):
+    """Аномальный день в продажах"""
+    id: int
+    day: date
+    metric: str  # revenue, cancellations
+    kind: str  # drop, spike
+    value: float  # выручка в рублях или число отмен
+    expected: float  # медиана за предыдущие 28 дней
+    score: float  # робастный z-score
+
+
+class AnomaliesResponse(BaseModel):
+    """Аномалии пользователя"""
+    anomalies: List[Anomaly]
+
+
+class AnomalyAlert(Anomaly):
+    """Аномалия для уведомления ботом"""
+    telegram_id: int
+
+
+class AnomalyAlertsResponse(BaseModel):
+    """Неотправленные уведомления об аномалиях"""
+    alerts: List[AnomalyAlert]
+
+
+class AlertAck(BaseModel):
+    """Подтверждение отправки уведомлений"""
+    ids: List[int]
+
+
+class Digest(BaseModel):
+    """Утренняя сводка пользователя за день"""
+    user_id: int
+    telegram_id: int
+    first_name: Optional[str] = None
+    stats: StatsResponse
+    revenue_change: Optional[float] = None  # к предыдущему дню, %
+
+
+class DigestPage(BaseModel):
+    """Страница рассылки сводок: пользователи с id до last_user_id включительно"""
+    day: date
+    digests: List[Digest]
+    last_user_id: Optional[int] = None  # None - пользователей после курсора нет
+    has_more: bool = False
+    finished: bool = False  # рассылка за день уже завершена
+
+
+class DigestAck(BaseModel):
+    """Подтверждение отправленной страницы сводок (контрольная точка рассылки)"""
+    day: date
+    last_user_id: int
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    finished: bool = False
+
+
+class UserStats(BaseModel):
+    """KPI пользователя в сводке по всем пользователям"""
+    user_id: int
+    telegram_id: int
+    username: Optional[str] = None
+    first_name: Optional[str] = None
+    is_demo: bool
+    stats: StatsResponse
+
+
+class PlatformStatsResponse(BaseModel):
+    """KPI по всем пользователям"""
+    users: int
+    demo_users: int
+    active_users: int  # с продажами (за период)
+    stats: StatsResponse
+
+
+class LeaderboardResponse(BaseModel):
+    """Пользователи с наибольшей выручкой"""
+    sellers: List[UserStats]
+
+
+class UserStatsPage(BaseModel):
+    """Страница KPI пользователей; next_after_user_id = None - страниц больше нет"""
+    users: List[UserStats]
+    next_after_user_id: Optional[int] = None
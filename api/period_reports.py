@@ -0,0 +1,188 @@
+"""Отчеты за период: выборка, отрисовка и готовые отчеты.
+
+Периоды совпадают с меню бота (bot/keyboards.py: get_period_menu):
+today - сегодня, yesterday - вчера, week/month - последние 7/30 полных
+дней без сегодняшнего; даты считаются в часовом поясе tz. Границы
+периода уходят в SQL (индекс ix_sales_user_date_cover), в память
+читаются только продажи периода, для PDF - только последние 50.
+
+Собранный отчет за период хранится в period_reports с версией данных
+пользователя на момент сборки. Он действителен, пока изменения продаж
+после сборки (sales_events) не затрагивают даты раньше конца периода:
+продажи за сегодня не делают устаревшим отчет за вчера или за прошлые
+30 дней. Такие отчеты заранее собирает api/report_batch.py.
+"""
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.queries import compute_stats, fetch_top_products, sketch_top_products
+from database.models import User, Sale, SalesEvent, PeriodReport
+from reports.pdf_generator import generate_pdf_report
+from reports.excel_generator import generate_excel_report
+
+
+PERIODS = ("today", "yesterday", "week", "month")
+PERIOD_DAYS = {"week": 7, "month": 30}
+DEFAULT_REPORT_TZ = os.getenv("REPORT_TZ", "UTC")
+
+PDF_SALES_LIMIT = 50
+TOP_PRODUCTS_LIMIT = {"pdf": 5, "excel": 10}
+
+
+class ReportData(NamedTuple):
+    """Данные для генератора отчета (передаются в процесс отрисовки)"""
+    stats: Dict
+    sales: List[Dict]
+    top_products: List[Dict]
+
+
+def period_dates(period: str, zone: ZoneInfo, today: Optional[date] = None) -> Tuple[date, date]:
+    """Первый и последний день периода (локальные даты, включительно)"""
+    today = today or datetime.now(zone).date()
+    if period == "today":
+        return today, today
+    if period == "yesterday":
+        return today - timedelta(days=1), today - timedelta(days=1)
+    return today - timedelta(days=PERIOD_DAYS[period]), today - timedelta(days=1)
+
+
+def period_label(date_from: date, date_to: date) -> str:
+    if date_from == date_to:
+        return date_from.strftime("%d.%m.%Y")
+    return f"{date_from.strftime('%d.%m.%Y')} - {date_to.strftime('%d.%m.%Y')}"
+
+
+def report_etag(user_id: int, data_version: int, period: Optional[str] = None, date_from: Optional[date] = None) -> str:
+    """ETag отчета: версия данных, для периода - еще период и его первый день"""
+    if period is None:
+        return f'"{user_id}-{data_version}"'
+    return f'"{user_id}-{data_version}-{period}-{date_from.isoformat()}"'
+
+
+async def load_report_data(
+    session: AsyncSession,
+    user_id: int,
+    report_format: str,
+    date_range: Optional[Tuple[datetime, datetime]] = None
+) -> Optional[ReportData]:
+    """Данные отчета за полуинтервал UTC date_range (None - вся история); None - нет продаж"""
+    since, until = date_range or (None, None)
+
+    query = select(Sale).where(Sale.user_id == user_id)
+    if date_range is not None:
+        query = query.where(Sale.date >= since, Sale.date < until)
+    query = query.order_by(Sale.date.desc())
+    if report_format == "pdf":
+        query = query.limit(PDF_SALES_LIMIT)
+    sales_list = (await session.execute(query)).scalars().all()
+
+    if not sales_list:
+        return None
+
+    stats = await compute_stats(session, user_id, since, until)
+    top_limit = TOP_PRODUCTS_LIMIT[report_format]
+    if date_range is not None:
+        top_products = await fetch_top_products(session, user_id, top_limit, since, until)
+    else:
+        top_products = await sketch_top_products(session, user_id, top_limit)
+
+    sales = [
+        {
+            'date': sale.date.isoformat(),
+            'product_name': sale.product_name,
+            'amount': sale.amount,
+            'quantity': sale.quantity,
+            'status': sale.status
+        }
+        for sale in sales_list
+    ]
+    return ReportData(stats, sales, top_products)
+
+
+def render_report(report_format: str, data: ReportData, user_name: str, label: Optional[str] = None) -> bytes:
+    """Отрисовать отчет и прочитать его в память (синхронно: в потоке или процессе)"""
+    generate = generate_pdf_report if report_format == "pdf" else generate_excel_report
+    path = generate(data.stats, data.sales, data.top_products, user_name, label)
+    try:
+        with open(path, "rb") as report_file:
+            return report_file.read()
+    finally:
+        os.remove(path)
+
+
+async def stored_report(
+    session: AsyncSession,
+    user: User,
+    period: str,
+    report_format: str,
+    tz_name: str,
+    date_from: date,
+    range_end: datetime
+) -> Optional[PeriodReport]:
+    """Готовый отчет за период, если он еще действителен (range_end - конец периода, UTC)"""
+    row = await session.scalar(
+        select(PeriodReport).where(
+            PeriodReport.user_id == user.id,
+            PeriodReport.period == period,
+            PeriodReport.format == report_format,
+            PeriodReport.tz == tz_name
+        )
+    )
+    if row is None or row.date_from != date_from:
+        return None
+    if row.data_version == user.data_version:
+        return row
+
+    # Все изменения после сборки должны быть в журнале (он чистится через сутки)
+    # и касаться только дат после конца периода
+    touches_period = or_(SalesEvent.since.is_(None), SalesEvent.since < range_end)
+    changes, touching = (await session.execute(
+        select(
+            func.count(SalesEvent.id),
+            func.coalesce(func.sum(case((touches_period, 1), else_=0)), 0)
+        )
+        .where(SalesEvent.user_id == user.id)
+        .where(SalesEvent.data_version > row.data_version)
+    )).one()
+    if changes == user.data_version - row.data_version and touching == 0:
+        return row
+    return None
+
+
+async def save_report(
+    session: AsyncSession,
+    user_id: int,
+    period: str,
+    report_format: str,
+    tz_name: str,
+    date_from: date,
+    data_version: int,
+    content: bytes
+):
+    """Сохранить собранный отчет за период (заменяет предыдущий)"""
+    row = await session.scalar(
+        select(PeriodReport).where(
+            PeriodReport.user_id == user_id,
+            PeriodReport.period == period,
+            PeriodReport.format == report_format,
+            PeriodReport.tz == tz_name
+        )
+    )
+    if row is None:
+        row = PeriodReport(user_id=user_id, period=period, format=report_format, tz=tz_name)
+        session.add(row)
+    row.date_from = date_from
+    row.data_version = data_version
+    row.content = content
+    row.created_at = datetime.utcnow()
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Тот же отчет одновременно сохранил другой воркер
+        await session.rollback()
@@ -0,0 +1,329 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import select, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Sale, Product, to_rubles
+from database.sketches import load_top_products_sketch
+
+
+# Целочисленные агрегаты, из которых build_stats собирает KPI
+STATS_FIELDS = ("total_kopecks", "total_sales", "completed_sales", "pending_sales", "cancelled_sales")
+
+
+def stats_aggregates() -> tuple:
+    """Колонки агрегатов STATS_FIELDS для select (по строкам sales)"""
+    return (
+        func.coalesce(func.sum(Sale.line_total), 0).label("total_kopecks"),
+        func.count(Sale.id).label("total_sales"),
+        func.coalesce(func.sum(case((Sale.status == "completed", 1), else_=0)), 0).label("completed_sales"),
+        func.coalesce(func.sum(case((Sale.status == "pending", 1), else_=0)), 0).label("pending_sales"),
+        func.coalesce(func.sum(case((Sale.status == "cancelled", 1), else_=0)), 0).label("cancelled_sales"),
+    )
+
+
+async def compute_stats(
+    session: AsyncSession,
+    user_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> Dict:
+    """Сводная статистика пользователя одним агрегирующим запросом (период [since, until))"""
+    query = select(*stats_aggregates()).where(Sale.user_id == user_id)
+    if since is not None:
+        query = query.where(Sale.date >= since)
+    if until is not None:
+        query = query.where(Sale.date < until)
+
+    result = await session.execute(query)
+    row = result.one()
+    return build_stats(
+        total_kopecks=row.total_kopecks,
+        total_sales=row.total_sales,
+        completed_sales=row.completed_sales,
+        pending_sales=row.pending_sales,
+        cancelled_sales=row.cancelled_sales
+    )
+
+
+async def fetch_daily_revenue(
+    session: AsyncSession,
+    user_id: int,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> List[Tuple[date, int]]:
+    """Выручка завершенных продаж по дням UTC [(день, копейки)]; дни без продаж пропущены"""
+    by_user = await fetch_daily_revenue_by_user(session, [user_id], date_from, date_to)
+    return by_user.get(user_id, [])
+
+
+async def fetch_daily_revenue_by_user(
+    session: AsyncSession,
+    user_ids: Sequence[int],
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> Dict[int, List[Tuple[date, int]]]:
+    """Дневная выручка нескольких пользователей одним GROUP BY (границы включительно)"""
+    day = func.date(Sale.date)
+    query = (
+        select(Sale.user_id, day.label("day"), func.sum(Sale.line_total).label("revenue"))
+        .where(Sale.user_id.in_(list(user_ids)))
+        .where(Sale.status == "completed")
+        .group_by(Sale.user_id, day)
+        .order_by(Sale.user_id, day)
+    )
+    if date_from is not None:
+        query = query.where(Sale.date >= datetime.combine(date_from, datetime.min.time()))
+    if date_to is not None:
+        query = query.where(Sale.date < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+
+    by_user: Dict[int, List[Tuple[date, int]]] = defaultdict(list)
+    for row in (await session.execute(query)).all():
+        # SQLite возвращает date() строкой, PostgreSQL - датой
+        by_user[row.user_id].append((date.fromisoformat(str(row.day)), int(row.revenue)))
+    return by_user
+
+
+def build_stats(
+    total_kopecks: int,
+    total_sales: int,
+    completed_sales: int,
+    pending_sales: int,
+    cancelled_sales: int
+) -> Dict:
+    """Сборка KPI в рублях из целочисленных агрегатов"""
+    average_check = round(total_kopecks / total_sales) if total_sales > 0 else 0
+    conversion_rate = (completed_sales / total_sales * 100) if total_sales > 0 else 0
+
+    return {
+        'total_amount': to_rubles(total_kopecks),
+        'total_sales': total_sales,
+        'average_check': to_rubles(average_check),
+        'completed_sales': completed_sales,
+        'pending_sales': pending_sales,
+        'cancelled_sales': cancelled_sales,
+        'conversion_rate': round(conversion_rate, 2)
+    }
+
+
+async def fetch_top_products(
+    session: AsyncSession,
+    user_id: int,
+    limit: Optional[int] = 5,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> List[Dict]:
+    """Точный топ товаров по выручке среди завершенных продаж (период [since, until)).
+
+    Группировка идет по целочисленному product_id (по индексу), названия
+    подтягиваются из справочника уже для отобранных строк.
+    """
+    total = func.sum(Sale.line_total)
+    top = (
+        select(
+            Sale.product_id,
+            total.label("total_kopecks"),
+            func.sum(Sale.quantity).label("total_quantity"),
+            func.count(Sale.id).label("sales_count")
+        )
+        .where(Sale.user_id == user_id)
+        .where(Sale.status == "completed")
+        .group_by(Sale.product_id)
+        .order_by(total.desc())
+    )
+    if since is not None:
+        top = top.where(Sale.date >= since)
+    if until is not None:
+        top = top.where(Sale.date < until)
+    if limit is not None:
+        top = top.limit(limit)
+    top = top.subquery()
+
+    result = await session.execute(
+        select(Product.name, top.c.total_kopecks, top.c.total_quantity, top.c.sales_count)
+        .join(top, Product.id == top.c.product_id)
+        .order_by(top.c.total_kopecks.desc())
+    )
+    return [
+        {
+            'product_name': row.name,
+            'total_amount': to_rubles(row.total_kopecks),
+            'total_quantity': row.total_quantity,
+            'sales_count': row.sales_count
+        }
+        for row in result
+    ]
+
+
+async def fetch_category_totals(
+    session: AsyncSession,
+    user_id: int,
+    since: Optional[datetime] = None
+) -> List[Dict]:
+    """Выручка завершенных продаж по товарным категориям.
+
+    Сначала агрегаты по product_id (по индексу продаж), затем свертка по
+    products.category для уже сгруппированных строк. category = None -
+    товары, категория которых не определена.
+    """
+    per_product = (
+        select(
+            Sale.product_id,
+            func.sum(Sale.line_total).label("total_kopecks"),
+            func.sum(Sale.quantity).label("total_quantity"),
+            func.count(Sale.id).label("sales_count")
+        )
+        .where(Sale.user_id == user_id)
+        .where(Sale.status == "completed")
+        .group_by(Sale.product_id)
+    )
+    if since is not None:
+        per_product = per_product.where(Sale.date >= since)
+    per_product = per_product.subquery()
+
+    total = func.sum(per_product.c.total_kopecks)
+    result = await session.execute(
+        select(
+            Product.category,
+            total.label("total_kopecks"),
+            func.sum(per_product.c.total_quantity).label("total_quantity"),
+            func.sum(per_product.c.sales_count).label("sales_count")
+        )
+        .join(per_product, Product.id == per_product.c.product_id)
+        .group_by(Product.category)
+        .order_by(total.desc())
+    )
+    rows = result.all()
+    grand_total = sum(row.total_kopecks for row in rows)
+    return [
+        {
+            'category': row.category,
+            'total_amount': to_rubles(row.total_kopecks),
+            'total_quantity': row.total_quantity,
+            'sales_count': row.sales_count,
+            'share': round(row.total_kopecks / grand_total * 100, 2) if grand_total else 0.0
+        }
+        for row in rows
+    ]
+
+
+async def sketch_top_products(
+    session: AsyncSession,
+    user_id: int,
+    limit: int = 5,
+    since: Optional[date] = None
+) -> List[Dict]:
+    """Топ товаров из скетчей Space-Saving (с даты UTC или за всю историю).
+
+    Время ответа зависит только от числа дней в периоде и емкости
+    скетча, а не от числа продаж и размера каталога.
+    """
+    sketch = await load_top_products_sketch(session, user_id, since)
+    return await name_top_products(session, [entry[:4] for entry in sketch.top(limit)])
+
+
+async def name_top_products(session: AsyncSession, top: List[tuple]) -> List[Dict]:
+    """[(product_id, выручка, количество, продаж)] -> записи топа с названиями"""
+    if not top:
+        return []
+
+    result = await session.execute(
+        select(Product.id, Product.name).where(Product.id.in_([entry[0] for entry in top]))
+    )
+    names = dict(result.all())
+    return [
+        {
+            'product_name': names[product_id],
+            'total_amount': to_rubles(revenue),
+            'total_quantity': quantity,
+            'sales_count': sales_count
+        }
+        for product_id, revenue, quantity, sales_count in top
+    ]
+
+
+def percent_change(current: float, previous: float) -> Optional[float]:
+    """Изменение в процентах; None, если в предыдущем периоде был ноль"""
+    if not previous:
+        return None
+    return round((current - previous) / previous * 100, 2)
+
+
+async def compare_periods(
+    session: AsyncSession,
+    user_id: int,
+    current: Tuple[datetime, datetime],
+    previous: Tuple[datetime, datetime],
+    top_limit: int = 5
+) -> Dict[str, Dict]:
+    """KPI и топ товаров за текущий и предыдущий периоды за один проход.
+
+    Периоды задаются полуинтервалами [начало, конец) в наивном UTC;
+    предыдущий должен заканчиваться там, где начинается текущий. Один
+    GROUP BY по (период, статус, товар) на диапазоне индекса
+    ix_sales_user_date_cover дает и KPI, и выручку по товарам.
+    """
+    period = case((Sale.date >= current[0], "current"), else_="previous").label("period")
+    result = await session.execute(
+        select(
+            period,
+            Sale.status,
+            Sale.product_id,
+            func.count(Sale.id).label("sales_count"),
+            func.sum(Sale.line_total).label("total_kopecks"),
+            func.sum(Sale.quantity).label("total_quantity")
+        )
+        .where(Sale.user_id == user_id)
+        .where(Sale.date >= previous[0])
+        .where(Sale.date < current[1])
+        .group_by(period, Sale.status, Sale.product_id)
+    )
+
+    totals = {name: defaultdict(int) for name in ("current", "previous")}
+    products = {name: defaultdict(lambda: [0, 0, 0]) for name in ("current", "previous")}
+    for row in result:
+        bucket = totals[row.period]
+        bucket["total_sales"] += row.sales_count
+        bucket["total_kopecks"] += row.total_kopecks
+        bucket[f"{row.status}_sales"] += row.sales_count
+        if row.status == "completed":
+            product = products[row.period][row.product_id]
+            product[0] += row.total_kopecks
+            product[1] += row.total_quantity
+            product[2] += row.sales_count
+
+    top_ids = {
+        name: sorted(per_product, key=lambda pid: per_product[pid][0], reverse=True)[:top_limit]
+        for name, per_product in products.items()
+    }
+    needed = set(top_ids["current"]) | set(top_ids["previous"])
+    names = {}
+    if needed:
+        result = await session.execute(
+            select(Product.id, Product.name).where(Product.id.in_(needed))
+        )
+        names = dict(result.all())
+
+    summary = {}
+    for name in ("current", "previous"):
+        bucket = totals[name]
+        summary[name] = {
+            'stats': build_stats(
+                total_kopecks=bucket["total_kopecks"],
+                total_sales=bucket["total_sales"],
+                completed_sales=bucket["completed_sales"],
+                pending_sales=bucket["pending_sales"],
+                cancelled_sales=bucket["cancelled_sales"]
+            ),
+            'top_products': [
+                {
+                    'product_name': names[pid],
+                    'total_amount': to_rubles(products[name][pid][0]),
+                    'total_quantity': products[name][pid][1],
+                    'sales_count': products[name][pid][2]
+                }
+                for pid in top_ids[name]
+            ]
+        }
+    return summary
@@ -0,0 +1,127 @@
+"""Заранее собранные отчеты за период для активных пользователей.
+
+Запуск: python -m api.report_batch [число процессов]
+или по расписанию внутри API (prerender_loop): раз в сутки в
+REPORT_PRERENDER_HOUR часов по REPORT_TZ, когда нагрузка минимальна.
+
+Активные пользователи (продажи за последние ACTIVE_DAYS дней) обходятся
+пачками по BATCH_SIZE. Данные отчетов читаются в основном процессе с
+границами периода в SQL, отрисовка идет в пуле процессов, готовые
+отчеты пишутся в period_reports. Отчеты, которые еще действительны,
+пропускаются. Отчеты за вчера и за прошлые 30 дней не меняются до конца
+суток, поэтому кнопка в боте отдает готовый файл.
+
+При нескольких воркерах API планировщик лучше выключить
+(REPORT_PRERENDER_HOUR=) и запускать модуль из cron.
+"""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import exists, select
+
+from api.period_reports import (
+    DEFAULT_REPORT_TZ,
+    period_dates,
+    period_label,
+    load_report_data,
+    render_report,
+    stored_report,
+    save_report
+)
+from api.scheduling import seconds_until_hour
+from api.timeseries import local_range_to_utc
+from database.models import init_db, async_session, User, Sale
+
+
+BATCH_SIZE = 100
+ACTIVE_DAYS = 30
+# Отчеты, которые бот запрашивает кнопками и которые не меняются до конца суток
+PRERENDER_PERIODS = ("yesterday", "month")
+PRERENDER_FORMATS = ("pdf",)
+REPORT_PRERENDER_HOUR = os.getenv("REPORT_PRERENDER_HOUR", "3")
+
+
+async def prerender_reports(workers: Optional[int] = None, tz_name: str = DEFAULT_REPORT_TZ) -> int:
+    """Собрать недостающие отчеты активных пользователей; возвращает число собранных"""
+    loop = asyncio.get_running_loop()
+    zone = ZoneInfo(tz_name)
+    active_since = datetime.utcnow() - timedelta(days=ACTIVE_DAYS)
+    periods = {}
+    for period in PRERENDER_PERIODS:
+        date_from, date_to = period_dates(period, zone)
+        periods[period] = (date_from, local_range_to_utc(date_from, date_to, zone), period_label(date_from, date_to))
+
+    rendered = 0
+    last_id = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            async with async_session() as session:
+                users = (await session.execute(
+                    select(User)
+                    .where(User.id > last_id)
+                    .where(exists().where(Sale.user_id == User.id, Sale.date >= active_since))
+                    .order_by(User.id)
+                    .limit(BATCH_SIZE)
+                )).scalars().all()
+                if not users:
+                    break
+                last_id = users[-1].id
+
+                jobs = []
+                for user in users:
+                    user_name = user.first_name or user.username or f"User {user.telegram_id}"
+                    for period, (date_from, date_range, label) in periods.items():
+                        for report_format in PRERENDER_FORMATS:
+                            if await stored_report(
+                                session, user, period, report_format, tz_name, date_from, date_range[1]
+                            ):
+                                continue
+                            data = await load_report_data(session, user.id, report_format, date_range)
+                            if data is None:
+                                continue
+                            jobs.append((
+                                (user.id, period, report_format, tz_name, date_from, user.data_version),
+                                loop.run_in_executor(pool, render_report, report_format, data, user_name, label)
+                            ))
+
+                contents = await asyncio.gather(*(future for _, future in jobs))
+                for (key, _), content in zip(jobs, contents):
+                    await save_report(session, *key, content)
+                rendered += len(jobs)
+
+    return rendered
+
+
+async def prerender_loop():
+    """Фоновая задача API: сборка отчетов раз в сутки в REPORT_PRERENDER_HOUR"""
+    zone = ZoneInfo(DEFAULT_REPORT_TZ)
+    while True:
+        await asyncio.sleep(seconds_until_hour(int(REPORT_PRERENDER_HOUR), zone))
+        try:
+            started = time.perf_counter()
+            count = await prerender_reports()
+            print(f"📄 Собрано отчетов за период: {count} за {time.perf_counter() - started:.1f} с")
+        except Exception as e:
+            print(f"❌ Ошибка сборки отчетов за период: {e}")
+
+
+async def run(workers: Optional[int] = None) -> int:
+    await init_db()
+    return await prerender_reports(workers)
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    started = time.perf_counter()
+    count = asyncio.run(run(workers))
+    print(f"✅ Собрано отчетов за период: {count} за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Удаление устаревших демо-пользователей.
+
+Запуск: python -m api.retention [срок хранения в днях]
+или по расписанию внутри API (retention_loop) раз в
+RETENTION_INTERVAL_SECONDS, если задан DEMO_USER_TTL_DAYS.
+
+Демо-пользователь устарел, если создан раньше срока хранения и у него
+нет продаж новее этого срока (повторный запуск демо-режима создает
+свежие продажи). Устаревшие пользователи обходятся пачками по
+RETENTION_BATCH_USERS. Продажи пачки удаляются запросами
+DELETE ... WHERE id IN (до RETENTION_DELETE_CHUNK строк) с паузой
+RETENTION_PAUSE_SECONDS между ними, поэтому блокировка записи держится
+недолго и запросы дашборда не ждут. Затем одним DELETE удаляются сами
+пользователи: товары, скетчи, прогнозы, аномалии и остальные производные
+строки удаляет БД по ON DELETE CASCADE. В старых базах SQLite ключи без
+каскада - там зависимые таблицы чистятся явно, так же по пачке.
+
+Фоновую очистку выполняет один процесс API на хосте - тот, кто взял
+блокировку RETENTION_LOCK_FILE. При нескольких хостах ее лучше
+выключить (DEMO_USER_TTL_DAYS=) и запускать модуль из cron.
+"""
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from sqlalchemy import delete, exists, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from database.hot_cache import hot_cache
+from database.models import init_db, async_session, Base, User, Sale
+from database.products import forget_user_products
+
+
+DEMO_USER_TTL_DAYS = os.getenv("DEMO_USER_TTL_DAYS", "30")
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", 3600))
+RETENTION_BATCH_USERS = 100
+RETENTION_DELETE_CHUNK = 5000
+RETENTION_PAUSE_SECONDS = float(os.getenv("RETENTION_PAUSE_SECONDS", 0.05))
+RETENTION_LOCK_FILE = os.getenv("RETENTION_LOCK_FILE", "/tmp/sales_api_retention.lock")
+
+_lock_file = None
+
+# Таблицы со строками пользователя, дочерние раньше родительских (sales раньше products)
+USER_TABLES = [
+    table for table in reversed(Base.metadata.sorted_tables)
+    if any(foreign_key.column.table.name == "users" for foreign_key in table.foreign_keys)
+]
+
+
+def _expired(cutoff: datetime):
+    """Условие: демо-пользователь создан до cutoff и без продаж после него"""
+    # Псевдоним: условие вкладывается и в запросы по sales, подзапрос не должен ссылаться на них
+    fresh = aliased(Sale)
+    return (
+        User.is_demo.is_(True),
+        User.created_at < cutoff,
+        ~exists().where(fresh.user_id == User.id, fresh.date >= cutoff)
+    )
+
+
+def _deletes_cascade(conn) -> bool:
+    """Удаление пользователя каскадно удаляет его продажи (схема с ON DELETE CASCADE)"""
+    if conn.dialect.name == "sqlite":
+        foreign_keys = conn.execute(text("PRAGMA foreign_key_list(sales)")).mappings()
+        return any(row["table"] == "users" and row["on_delete"] == "CASCADE" for row in foreign_keys)
+    # В PostgreSQL каскад добавляет миграция add_user_delete_cascade
+    return True
+
+
+async def expired_demo_users(session: AsyncSession, cutoff: datetime, limit: int) -> List[int]:
+    result = await session.execute(
+        select(User.id).where(*_expired(cutoff)).order_by(User.id).limit(limit)
+    )
+    return list(result.scalars())
+
+
+async def purge_users(session: AsyncSession, user_ids: List[int], cutoff: datetime, cascade: bool) -> Counter:
+    """Удалить пачку пользователей со всеми их данными; счетчик удаленных строк по таблицам"""
+    purged: Counter = Counter()
+
+    # Продаж больше всего: удаляем частями, отпуская блокировку между ними.
+    # Условие устаревания проверяется в каждом запросе: у пользователя, снова
+    # запустившего демо-режим, продажи перестают удаляться сразу
+    still_expired = select(User.id).where(User.id.in_(user_ids), *_expired(cutoff))
+    while True:
+        chunk = (
+            select(Sale.id)
+            .where(Sale.user_id.in_(still_expired), Sale.date < cutoff)
+            .limit(RETENTION_DELETE_CHUNK)
+        )
+        result = await session.execute(delete(Sale).where(Sale.id.in_(chunk.scalar_subquery())))
+        await session.commit()
+        purged["sales"] += result.rowcount
+        if result.rowcount < RETENTION_DELETE_CHUNK:
+            break
+        await asyncio.sleep(RETENTION_PAUSE_SECONDS)
+
+    # Условие проверяется еще раз: свежие продажи пользователя не удалялись
+    alive = select(User.id).where(User.id.in_(user_ids)).where(*_expired(cutoff))
+    user_ids = list((await session.execute(alive)).scalars())
+    if not user_ids:
+        return purged
+
+    for table in USER_TABLES:
+        if cascade:
+            # Строки удалит БД вместе с пользователем - считаем их заранее для отчета
+            purged[table.name] += await session.scalar(
+                select(func.count()).select_from(table).where(table.c.user_id.in_(user_ids))
+            )
+        else:
+            result = await session.execute(delete(table).where(table.c.user_id.in_(user_ids)))
+            purged[table.name] += result.rowcount
+    result = await session.execute(
+        delete(User).where(User.id.in_(user_ids)).where(*_expired(cutoff))
+    )
+    await session.commit()
+    purged["users"] += result.rowcount
+
+    for user_id in user_ids:
+        forget_user_products(user_id)
+        hot_cache.invalidate(user_id)
+    return purged
+
+
+async def purge_expired_demo_users(ttl_days: int) -> Counter:
+    """Удалить демо-пользователей старше ttl_days дней; счетчик удаленных строк по таблицам"""
+    cutoff = datetime.utcnow() - timedelta(days=ttl_days)
+    purged: Counter = Counter()
+    async with async_session() as session:
+        cascade = await (await session.connection()).run_sync(_deletes_cascade)
+        while True:
+            user_ids = await expired_demo_users(session, cutoff, RETENTION_BATCH_USERS)
+            if not user_ids:
+                break
+            purged.update(await purge_users(session, user_ids, cutoff, cascade))
+            await asyncio.sleep(RETENTION_PAUSE_SECONDS)
+    return purged
+
+
+def _report(purged: Counter, elapsed: float) -> str:
+    rows = sum(purged.values())
+    rate = rows / elapsed if elapsed else 0
+    return f"пользователей {purged['users']}, строк {rows} за {elapsed:.1f} с ({rate:.0f} строк/с)"
+
+
+def acquire_retention_lock() -> bool:
+    """Очистка - только в одном процессе API на хосте (блокировка снимается ОС при его завершении)"""
+    global _lock_file
+    try:
+        import fcntl
+    except ImportError:
+        return True  # нет flock (Windows) - один процесс
+    _lock_file = open(RETENTION_LOCK_FILE, "w")
+    try:
+        fcntl.flock(_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        _lock_file.close()
+        _lock_file = None
+        return False
+
+
+async def retention_loop():
+    """Фоновая задача API: удаление устаревших демо-пользователей"""
+    if not acquire_retention_lock():
+        return  # очистку выполняет другой воркер
+    while True:
+        try:
+            started = time.perf_counter()
+            purged = await purge_expired_demo_users(int(DEMO_USER_TTL_DAYS))
+            if purged["users"]:
+                print(f"🧹 Удалено демо-данных: {_report(purged, time.perf_counter() - started)}")
+        except Exception as e:
+            print(f"❌ Ошибка удаления демо-пользователей: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+
+
+async def run(ttl_days: int) -> Tuple[Counter, float]:
+    await init_db()
+    started = time.perf_counter()
+    purged = await purge_expired_demo_users(ttl_days)
+    return purged, time.perf_counter() - started
+
+
+def main():
+    ttl_days = int(sys.argv[1]) if len(sys.argv) > 1 else int(DEMO_USER_TTL_DAYS)
+    purged, elapsed = asyncio.run(run(ttl_days))
+    print(f"✅ Удалено демо-данных: {_report(purged, elapsed)}")
+    print(f"   по таблицам: {dict(+purged)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,84 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
-from sqlalchemy import select, func
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime, timedelta
-from typing import List
-from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Literal, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import asyncio
 import os
 
-from database.models import get_session, User, Sale
+from database.models import get_session, async_session, User, Sale, SalesAnomaly, to_rubles, KOPECKS_PER_RUBLE
+from database.hot_cache import hot_cache
+from database.sketches import load_check_sketch, RELATIVE_ERROR, TOP_K_CAPACITY
 from database.seed import create_demo_data
-from reports.pdf_generator import generate_pdf_report
-from reports.excel_generator import generate_excel_report
 from api.models import (
     SaleResponse,
+    SearchResponse,
     UserResponse,
     StatsResponse,
     ChartResponse,
+    SeriesResponse,
+    ForecastResponse,
     TopProduct,
-    TopProductsResponse
+    TopProductsResponse,
+    CategoriesResponse,
+    PeriodSummary,
+    ComparisonResponse,
+    CheckDistributionResponse,
+    TrendsResponse,
+    ProfileResponse,
+    AbcResponse,
+    AnomaliesResponse,
+    AnomalyAlertsResponse,
+    AlertAck,
+    DigestPage,
+    DigestAck,
+    PlatformStatsResponse,
+    LeaderboardResponse,
+    UserStatsPage
 )
+from api.queries import (
+    build_stats,
+    compute_stats,
+    fetch_top_products,
+    fetch_category_totals,
+    sketch_top_products,
+    name_top_products,
+    compare_periods,
+    percent_change
+)
+from api.timeseries import fetch_series, bucket_labels, local_range_to_utc
+from api.downsampling import downsample
+from api.forecasting import get_user_model
+from api.anomalies import pending_alerts, anomaly_payload
+from api.admin_stats import USER_PAGE_SIZE, platform_stats, top_sellers, user_stats_page
+from api.digests import DIGEST_PAGE_SIZE, digest_day, get_digest_run, fetch_digest_page, ack_digest_page
+from api.search import search_terms, decode_cursor, search_sales
+from api.live import dashboard_stream
+from api.singleflight import flights, coalesced
+from api.limits import rate_limiter, report_gate, limits_snapshot
+from api.period_reports import (
+    PERIODS,
+    DEFAULT_REPORT_TZ,
+    period_dates,
+    period_label,
+    report_etag,
+    load_report_data,
+    render_report,
+    stored_report,
+    save_report
+)
+from api.analytics import (
+    load_sales_frame,
+    daily_trends,
+    weekday_profile,
+    hourly_profile,
+    abc_report
+)
+from api.holiday_forecast import fit_user_uplifts
 from api.holidays import (
+    has_category,
     get_upcoming_holidays,
     get_demand_forecast,
     get_peak_sales_periods,
@@ -29,6 +88,20 @@ from api.holidays import (
 router = APIRouter()
 
 
+async def require_internal_key(x_internal_key: Optional[str] = Header(None)):
+    """Служебные эндпоинты (для бота) закрыты ключом SECRET_KEY, если он задан"""
+    secret = os.getenv("SECRET_KEY")
+    if secret and x_internal_key != secret:
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+
+
+async def require_admin_key(x_internal_key: Optional[str] = Header(None)):
+    """Данные всех пользователей (сводки, уведомления) закрыты всегда: без SECRET_KEY недоступны"""
+    secret = os.getenv("SECRET_KEY")
+    if not secret or x_internal_key != secret:
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+
+
 @router.get("/sales/{telegram_id}", response_model=List[SaleResponse])
 async def get_user_sales(
     telegram_id: int,
@@ -57,12 +130,84 @@ async def get_user_sales(
     return sales
 
 
-@router.get("/stats/{telegram_id}", response_model=StatsResponse)
+@router.get("/search/{telegram_id}", response_model=SearchResponse)
+async def search_user_sales(
+    telegram_id: int,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    status: Optional[Literal["completed", "pending", "cancelled"]] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Поиск продаж по названию товара (префиксы слов) с постраничной выдачей по курсору"""
+    result = await session.execute(
+        select(User).where(User.telegram_id == telegram_id)
+    )
+    user = result.scalar_one_or_none()
+
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    terms = search_terms(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Пустой поисковый запрос")
+
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    sales, next_cursor, totals = await search_sales(session, user.id, terms, limit, after, status)
+    return SearchResponse(sales=sales, next_cursor=next_cursor, totals=totals)
+
+
+@router.get("/live/{telegram_id}")
+async def live_dashboard(
+    telegram_id: int,
+    last_event_id: Optional[int] = Query(None, ge=0),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """Поток изменений дашборда (Server-Sent Events): snapshot, затем delta.
+
+    При переподключении EventSource сам присылает заголовок
+    Last-Event-ID; last_event_id в запросе - для первого подключения.
+    """
+    # Своя короткая сессия вместо Depends(get_session): подключение живет
+    # долго и не должно держать соединение с БД
+    async with async_session() as session:
+        result = await session.execute(
+            select(User.id).where(User.telegram_id == telegram_id)
+        )
+        user_id = result.scalar_one_or_none()
+
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    if last_event_id_header is not None:
+        try:
+            last_event_id = int(last_event_id_header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Некорректный Last-Event-ID")
+
+    return StreamingResponse(
+        dashboard_stream(user_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get(
+    "/stats/{telegram_id}",
+    response_model=StatsResponse,
+    dependencies=[Depends(rate_limiter.dependency("aggregate"))]
+)
+@coalesced
 async def get_user_stats(
     telegram_id: int,
+    days: Optional[int] = Query(None, ge=1, le=3660),
     session: AsyncSession = Depends(get_session)
 ):
-    """Получить статистику пользователя"""
+    """Получить статистику пользователя за последние days дней или за всю историю"""
     # Находим пользователя
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
@@ -72,51 +217,70 @@ async def get_user_stats(
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    # Получаем все продажи
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    columns = await hot_cache.get(session, user.id, since) if since else None
+    if columns is not None:
+        stats = build_stats(**columns.stats(since))
+    else:
+        stats = await compute_stats(session, user.id, since)
+
+    sketch = await load_check_sketch(session, user.id, since.date() if since else None)
+    median, p90, p99 = (
+        to_rubles(value) if value is not None else None
+        for value in sketch.quantiles([0.5, 0.9, 0.99])
+    )
+    return StatsResponse(**stats, median_check=median, p90_check=p90, p99_check=p99)
+
+
+@router.get(
+    "/distribution/{telegram_id}",
+    response_model=CheckDistributionResponse,
+    dependencies=[Depends(rate_limiter.dependency("aggregate"))]
+)
+@coalesced
+async def get_check_distribution(
+    telegram_id: int,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Получить квантили чека за период (даты UTC, по умолчанию вся история)"""
     result = await session.execute(
-        select(Sale).where(Sale.user_id == user.id)
+        select(User).where(User.telegram_id == telegram_id)
     )
-    sales = result.scalars().all()
+    user = result.scalar_one_or_none()
 
-    if not sales:
-        return StatsResponse(
-            total_amount=0,
-            total_sales=0,
-            average_check=0,
-            completed_sales=0,
-            pending_sales=0,
-            cancelled_sales=0,
-            conversion_rate=0
-        )
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    sketch = await load_check_sketch(session, user.id, date_from, date_to)
+    levels = {"p50": 0.5, "p75": 0.75, "p90": 0.9, "p95": 0.95, "p99": 0.99}
+    values = sketch.quantiles(levels.values())
 
-    # Вычисляем статистику
-    total_amount = sum(sale.amount * sale.quantity for sale in sales)
-    total_sales = len(sales)
-    completed_sales = len([s for s in sales if s.status == "completed"])
-    pending_sales = len([s for s in sales if s.status == "pending"])
-    cancelled_sales = len([s for s in sales if s.status == "cancelled"])
-
-    average_check = total_amount / total_sales if total_sales > 0 else 0
-    conversion_rate = (completed_sales / total_sales * 100) if total_sales > 0 else 0
-
-    return StatsResponse(
-        total_amount=round(total_amount, 2),
-        total_sales=total_sales,
-        average_check=round(average_check, 2),
-        completed_sales=completed_sales,
-        pending_sales=pending_sales,
-        cancelled_sales=cancelled_sales,
-        conversion_rate=round(conversion_rate, 2)
+    return CheckDistributionResponse(
+        count=sketch.count,
+        relative_error=RELATIVE_ERROR,
+        quantiles={
+            name: to_rubles(value) if value is not None else None
+            for name, value in zip(levels, values)
+        }
     )
 
 
-@router.get("/charts/{telegram_id}/daily", response_model=ChartResponse)
+@router.get(
+    "/charts/{telegram_id}/daily",
+    response_model=ChartResponse,
+    dependencies=[Depends(rate_limiter.dependency("aggregate"))]
+)
+@coalesced
 async def get_daily_sales_chart(
     telegram_id: int,
-    days: int = 30,
+    days: int = Query(30, ge=1),
+    max_points: Optional[int] = Query(None, ge=3),
+    downsample_method: Literal["lttb", "minmax"] = "lttb",
     session: AsyncSession = Depends(get_session)
 ):
-    """Получить данные для графика продаж по дням"""
+    """Получить данные для графика продаж по дням (UTC)"""
     # Находим пользователя
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
@@ -126,40 +290,127 @@ async def get_daily_sales_chart(
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    # Получаем продажи за указанный период
-    start_date = datetime.utcnow() - timedelta(days=days)
+    date_to = datetime.utcnow().date()
+    date_from = date_to - timedelta(days=days - 1)
+    columns = await hot_cache.get(session, user.id, datetime.combine(date_from, datetime.min.time()))
+    if columns is not None:
+        labels = list(bucket_labels("day", date_from, date_to))
+        values = (columns.daily_revenue(date_from, days) / KOPECKS_PER_RUBLE).round(2).tolist()
+    else:
+        labels, values = await fetch_series(session, user.id, bucket="day", days=days)
+
+    if max_points:
+        labels, values = downsample(labels, values, max_points, downsample_method)
+    return ChartResponse(labels=labels, values=values)
+
+
+@router.get(
+    "/charts/{telegram_id}/series",
+    response_model=SeriesResponse,
+    dependencies=[Depends(rate_limiter.dependency("aggregate"))]
+)
+@coalesced
+async def get_sales_series(
+    telegram_id: int,
+    bucket: Literal["hour", "day", "week", "month"] = "day",
+    tz: str = "UTC",
+    metric: Literal["revenue", "count", "quantity"] = "revenue",
+    status: Literal["completed", "pending", "cancelled", "all"] = "completed",
+    days: int = Query(30, ge=1),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    max_points: Optional[int] = Query(None, ge=3),
+    downsample_method: Literal["lttb", "minmax"] = "lttb",
+    session: AsyncSession = Depends(get_session)
+):
+    """Получить временной ряд продаж с группировкой по интервалам.
+
+    max_points ограничивает размер ответа: ряд прореживается методом LTTB
+    (сохраняет форму) или min/max (сохраняет все экстремумы).
+    """
     result = await session.execute(
-        select(Sale)
-        .where(Sale.user_id == user.id)
-        .where(Sale.date >= start_date)
-        .where(Sale.status == "completed")
+        select(User).where(User.telegram_id == telegram_id)
     )
-    sales = result.scalars().all()
+    user = result.scalar_one_or_none()
 
-    # Группируем по дням
-    daily_sales = defaultdict(float)
-    for sale in sales:
-        date_key = sale.date.strftime("%Y-%m-%d")
-        daily_sales[date_key] += sale.amount * sale.quantity
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    # Заполняем пропущенные дни
-    labels = []
-    values = []
-    for i in range(days):
-        date = (datetime.utcnow() - timedelta(days=days - i - 1)).strftime("%Y-%m-%d")
-        labels.append(date)
-        values.append(round(daily_sales.get(date, 0), 2))
+    try:
+        labels, values = await fetch_series(
+            session, user.id,
+            bucket=bucket,
+            tz_name=tz,
+            metric=metric,
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            days=days
+        )
+    except ZoneInfoNotFoundError:
+        raise HTTPException(status_code=400, detail=f"Неизвестный часовой пояс '{tz}'")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return ChartResponse(labels=labels, values=values)
+    if max_points:
+        labels, values = downsample(labels, values, max_points, downsample_method)
+
+    return SeriesResponse(labels=labels, values=values, bucket=bucket, metric=metric, timezone=tz)
 
 
-@router.get("/charts/{telegram_id}/top-products", response_model=TopProductsResponse)
+@router.get(
+    "/forecast/{telegram_id}",
+    response_model=ForecastResponse,
+    dependencies=[Depends(rate_limiter.dependency("aggregate"))]
+)
+@coalesced
+async def get_forecast(
+    telegram_id: int,
+    days: int = Query(14, ge=7, le=30),
+    confidence: float = Query(0.95, ge=0.5, le=0.99),
+    session: AsyncSession = Depends(get_session)
+):
+    """Прогноз выручки на days дней (Хольт-Винтерс) с интервалом прогноза"""
+    result = await session.execute(
+        select(User).where(User.telegram_id == telegram_id)
+    )
+    user = result.scalar_one_or_none()
+
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    model, last_day = await get_user_model(session, user.id)
+    if model is None:
+        raise HTTPException(status_code=400, detail="Недостаточно истории продаж для прогноза")
+
+    mean, lower, upper = model.forecast(days, confidence)
+    return ForecastResponse(
+        labels=[(last_day + timedelta(days=step)).isoformat() for step in range(1, days + 1)],
+        values=[to_rubles(round(value)) for value in mean],
+        lower=[to_rubles(round(value)) for value in lower],
+        upper=[to_rubles(round(value)) for value in upper],
+        confidence=confidence
+    )
+
+
+@router.get(
+    "/charts/{telegram_id}/top-products",
+    response_model=TopProductsResponse,
+    dependencies=[Depends(rate_limiter.dependency("aggregate"))]
+)
+@coalesced
 async def get_top_products(
     telegram_id: int,
-    limit: int = 5,
+    limit: int = Query(5, ge=1, le=TOP_K_CAPACITY),
+    days: Optional[int] = Query(None, ge=1, le=366),
+    exact: bool = False,
     session: AsyncSession = Depends(get_session)
 ):
-    """Получить топ товаров"""
+    """Получить топ товаров за последние days дней (UTC) или за всю историю.
+
+    Окно из горячего кэша считается точно в памяти; иначе ответ строится
+    из скетчей, а exact=true пересчитывает топ точным запросом.
+    """
     # Находим пользователя
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
@@ -169,34 +420,353 @@ async def get_top_products(
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    # Получаем агрегированные данные по товарам
+    since = None
+    if days is not None:
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+
+    since_dt = datetime.combine(since, datetime.min.time()) if since else None
+    columns = await hot_cache.get(session, user.id, since_dt) if since_dt else None
+    if columns is not None:
+        top = await name_top_products(session, columns.top_products(since_dt, limit))
+    elif exact:
+        top = await fetch_top_products(session, user.id, limit, since_dt)
+    else:
+        top = await sketch_top_products(session, user.id, limit, since)
+
+    products = [TopProduct(**product) for product in top]
+
+    return TopProductsResponse(products=products)
+
+
+@router.get(
+    "/charts/{telegram_id}/categories",
+    response_model=CategoriesResponse,
+    dependencies=[Depends(rate_limiter.dependency("aggregate"))]
+)
+@coalesced
+async def get_category_totals(
+    telegram_id: int,
+    days: Optional[int] = Query(None, ge=1, le=366),
+    session: AsyncSession = Depends(get_session)
+):
+    """Выручка по товарным категориям за последние days дней или за всю историю"""
     result = await session.execute(
-        select(
-            Sale.product_name,
-            func.sum(Sale.amount * Sale.quantity).label("total_amount"),
-            func.sum(Sale.quantity).label("total_quantity"),
-            func.count(Sale.id).label("sales_count")
+        select(User).where(User.telegram_id == telegram_id)
+    )
+    user = result.scalar_one_or_none()
+
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    return CategoriesResponse(categories=await fetch_category_totals(session, user.id, since))
+
+
+COMPARISON_WINDOWS = {"day": 1, "week": 7, "month": 30}
+
+
+@router.get(
+    "/compare/{telegram_id}",
+    response_model=ComparisonResponse,
+    dependencies=[Depends(rate_limiter.dependency("aggregate"))]
+)
+@coalesced
+async def get_period_comparison(
+    telegram_id: int,
+    window: Literal["day", "week", "month", "custom"] = "week",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    tz: str = "UTC",
+    limit: int = Query(5, ge=1, le=50),
+    session: AsyncSession = Depends(get_session)
+):
+    """Сравнить KPI и топ товаров с предыдущим периодом той же длины.
+
+    day/week/month - последние 1/7/30 дней включая сегодня; custom -
+    период date_from..date_to (обе даты обязательны).
+    """
+    result = await session.execute(
+        select(User).where(User.telegram_id == telegram_id)
+    )
+    user = result.scalar_one_or_none()
+
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    try:
+        zone = ZoneInfo(tz)
+    except ZoneInfoNotFoundError:
+        raise HTTPException(status_code=400, detail=f"Неизвестный часовой пояс '{tz}'")
+
+    if window == "custom":
+        if date_from is None or date_to is None or date_from > date_to:
+            raise HTTPException(status_code=400, detail="Для custom укажите date_from <= date_to")
+    else:
+        date_to = datetime.now(zone).date()
+        date_from = date_to - timedelta(days=COMPARISON_WINDOWS[window] - 1)
+
+    length = date_to - date_from + timedelta(days=1)
+    previous_from, previous_to = date_from - length, date_from - timedelta(days=1)
+
+    summary = await compare_periods(
+        session, user.id,
+        current=local_range_to_utc(date_from, date_to, zone),
+        previous=local_range_to_utc(previous_from, previous_to, zone),
+        top_limit=limit
+    )
+
+    current_stats = summary["current"]["stats"]
+    previous_stats = summary["previous"]["stats"]
+    deltas = {
+        key: percent_change(current_stats[key], previous_stats[key])
+        for key in current_stats
+    }
+
+    return ComparisonResponse(
+        window=window,
+        current=PeriodSummary(date_from=date_from, date_to=date_to, **summary["current"]),
+        previous=PeriodSummary(date_from=previous_from, date_to=previous_to, **summary["previous"]),
+        deltas=deltas
+    )
+
+
+async def _analytics_frame(session: AsyncSession, telegram_id: int, days: Optional[int], tz: str):
+    """Продажи пользователя для эндпоинтов аналитики"""
+    result = await session.execute(
+        select(User).where(User.telegram_id == telegram_id)
+    )
+    user = result.scalar_one_or_none()
+
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    try:
+        ZoneInfo(tz)
+    except ZoneInfoNotFoundError:
+        raise HTTPException(status_code=400, detail=f"Неизвестный часовой пояс '{tz}'")
+
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    return await load_sales_frame(session, user.id, since, tz)
+
+
+@router.get(
+    "/analytics/{telegram_id}/trends",
+    response_model=TrendsResponse,
+    dependencies=[Depends(rate_limiter.dependency("aggregate"))]
+)
+@coalesced
+async def get_analytics_trends(
+    telegram_id: int,
+    days: Optional[int] = Query(90, ge=1),
+    tz: str = "UTC",
+    session: AsyncSession = Depends(get_session)
+):
+    """Тренды: скользящее среднее, накопленная выручка, темпы роста"""
+    frame = await _analytics_frame(session, telegram_id, days, tz)
+    return TrendsResponse(**daily_trends(frame))
+
+
+@router.get(
+    "/analytics/{telegram_id}/profile",
+    response_model=ProfileResponse,
+    dependencies=[Depends(rate_limiter.dependency("aggregate"))]
+)
+@coalesced
+async def get_analytics_profile(
+    telegram_id: int,
+    days: Optional[int] = Query(90, ge=1),
+    tz: str = "UTC",
+    session: AsyncSession = Depends(get_session)
+):
+    """Профили продаж по дням недели и часам суток"""
+    frame = await _analytics_frame(session, telegram_id, days, tz)
+    return ProfileResponse(weekday=weekday_profile(frame), hourly=hourly_profile(frame))
+
+
+@router.get(
+    "/analytics/{telegram_id}/abc",
+    response_model=AbcResponse,
+    dependencies=[Depends(rate_limiter.dependency("aggregate"))]
+)
+@coalesced
+async def get_analytics_abc(
+    telegram_id: int,
+    days: Optional[int] = Query(None, ge=1),
+    session: AsyncSession = Depends(get_session)
+):
+    """ABC-классификация товаров по выручке"""
+    frame = await _analytics_frame(session, telegram_id, days, "UTC")
+    return AbcResponse(products=await abc_report(session, frame))
+
+
+@router.get("/anomalies/{telegram_id}", response_model=AnomaliesResponse)
+async def get_anomalies(
+    telegram_id: int,
+    days: int = Query(30, ge=1, le=365),
+    session: AsyncSession = Depends(get_session)
+):
+    """Аномальные дни пользователя за последние days дней"""
+    result = await session.execute(
+        select(User).where(User.telegram_id == telegram_id)
+    )
+    user = result.scalar_one_or_none()
+
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    result = await session.execute(
+        select(SalesAnomaly)
+        .where(SalesAnomaly.user_id == user.id)
+        .where(SalesAnomaly.day >= datetime.utcnow().date() - timedelta(days=days))
+        .order_by(SalesAnomaly.day.desc(), SalesAnomaly.id)
+    )
+    return AnomaliesResponse(anomalies=[anomaly_payload(anomaly) for anomaly in result.scalars()])
+
+
+@router.get(
+    "/alerts/anomalies",
+    response_model=AnomalyAlertsResponse,
+    dependencies=[Depends(require_admin_key)]
+)
+async def get_anomaly_alerts(
+    limit: int = Query(100, ge=1, le=1000),
+    session: AsyncSession = Depends(get_session)
+):
+    """Неотправленные уведомления об аномалиях (забирает бот)"""
+    return AnomalyAlertsResponse(alerts=await pending_alerts(session, limit))
+
+
+@router.post("/alerts/anomalies/ack", dependencies=[Depends(require_admin_key)])
+async def ack_anomaly_alerts(
+    ack: AlertAck,
+    session: AsyncSession = Depends(get_session)
+):
+    """Отметить уведомления отправленными"""
+    if ack.ids:
+        await session.execute(
+            update(SalesAnomaly)
+            .where(SalesAnomaly.id.in_(ack.ids))
+            .values(notified_at=datetime.utcnow())
         )
-        .where(Sale.user_id == user.id)
-        .where(Sale.status == "completed")
-        .group_by(Sale.product_name)
-        .order_by(func.sum(Sale.amount * Sale.quantity).desc())
-        .limit(limit)
+        await session.commit()
+    return {"success": True, "count": len(ack.ids)}
+
+
+@router.get(
+    "/digests",
+    response_model=DigestPage,
+    dependencies=[Depends(require_admin_key)]
+)
+async def get_digests(
+    day: Optional[date] = None,
+    after_user_id: Optional[int] = Query(None, ge=0),
+    limit: int = Query(DIGEST_PAGE_SIZE, ge=1, le=1000),
+    session: AsyncSession = Depends(get_session)
+):
+    """Страница утренних сводок (забирает бот); без after_user_id - с контрольной точки"""
+    zone = ZoneInfo(DEFAULT_REPORT_TZ)
+    day = day or digest_day(zone)
+    run = await get_digest_run(session, day)
+    if run is not None and run.finished_at is not None:
+        return DigestPage(day=day, digests=[], finished=True)
+    if after_user_id is None:
+        after_user_id = run.last_user_id if run is not None else 0
+
+    digests, last_user_id, has_more = await fetch_digest_page(session, day, zone, after_user_id, limit)
+    return DigestPage(day=day, digests=digests, last_user_id=last_user_id, has_more=has_more)
+
+
+@router.post("/digests/ack", dependencies=[Depends(require_admin_key)])
+async def ack_digests(
+    ack: DigestAck,
+    session: AsyncSession = Depends(get_session)
+):
+    """Подтвердить отправленную страницу сводок"""
+    run = await ack_digest_page(session, ack)
+    return {
+        "success": True,
+        "last_user_id": run.last_user_id,
+        "sent": run.sent,
+        "failed": run.failed,
+        "blocked": run.blocked,
+        "finished": run.finished_at is not None
+    }
+
+
+def _admin_since(days: Optional[int]) -> Optional[datetime]:
+    return datetime.utcnow() - timedelta(days=days) if days else None
+
+
+async def _admin_flight(name: str, compute, days: Optional[int], **params):
+    """Сводки по всем пользователям: одинаковые одновременные запросы считаются один раз"""
+    async def run():
+        async with async_session() as session:
+            return await compute(session, since=_admin_since(days), **params)
+    return await flights.do(("admin", name, days, tuple(sorted(params.items()))), run)
+
+
+@router.get(
+    "/admin/stats",
+    response_model=PlatformStatsResponse,
+    dependencies=[Depends(require_admin_key)]
+)
+async def get_platform_stats(
+    days: Optional[int] = Query(None, ge=1, le=3660),
+    include_demo: bool = True
+):
+    """KPI по всем пользователям за последние days дней или за всю историю"""
+    return await _admin_flight(
+        "stats", platform_stats, days, include_demo=include_demo
     )
 
-    products = []
-    for row in result:
-        products.append(TopProduct(
-            product_name=row.product_name,
-            total_amount=round(row.total_amount, 2),
-            total_quantity=row.total_quantity,
-            sales_count=row.sales_count
-        ))
 
-    return TopProductsResponse(products=products)
+@router.get(
+    "/admin/leaderboard",
+    response_model=LeaderboardResponse,
+    dependencies=[Depends(require_admin_key)]
+)
+async def get_leaderboard(
+    limit: int = Query(10, ge=1, le=100),
+    days: Optional[int] = Query(None, ge=1, le=3660),
+    include_demo: bool = True
+):
+    """Пользователи с наибольшей выручкой"""
+    sellers = await _admin_flight(
+        "leaderboard", top_sellers, days, limit=limit, include_demo=include_demo
+    )
+    return LeaderboardResponse(sellers=sellers)
 
 
-@router.post("/demo/{telegram_id}")
+@router.get(
+    "/admin/users/stats",
+    response_model=UserStatsPage,
+    dependencies=[Depends(require_admin_key)]
+)
+async def get_users_stats(
+    after_user_id: int = Query(0, ge=0),
+    limit: int = Query(USER_PAGE_SIZE, ge=1, le=1000),
+    telegram_id: Optional[List[int]] = Query(None, max_length=1000),
+    days: Optional[int] = Query(None, ge=1, le=3660),
+    include_demo: bool = True,
+    session: AsyncSession = Depends(get_session)
+):
+    """KPI пользователей страницами по id; telegram_id (можно несколько) - только эти пользователи"""
+    users, next_after_user_id = await user_stats_page(
+        session, after_user_id, limit, telegram_id, _admin_since(days), include_demo
+    )
+    return UserStatsPage(users=users, next_after_user_id=next_after_user_id)
+
+
+@router.get("/limits", dependencies=[Depends(require_internal_key)])
+async def get_limits():
+    """Метрики ограничителей: отказы по классам маршрутов, очередь сборки отчетов"""
+    return limits_snapshot()
+
+
+@router.post(
+    "/demo/{telegram_id}",
+    dependencies=[Depends(rate_limiter.dependency("demo"))]
+)
 async def create_demo(
     telegram_id: int,
     username: str = None,
@@ -232,13 +802,60 @@ async def get_user(
     return user
 
 
-@router.get("/reports/{telegram_id}/pdf")
-async def generate_pdf(
+REPORT_FORMATS = {
+    "pdf": ("pdf", "application/pdf"),
+    "excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+async def _build_report(
+    user_id: int,
+    user_name: str,
+    report_format: str,
+    date_range: Optional[Tuple[datetime, datetime]] = None,
+    label: Optional[str] = None
+) -> Optional[bytes]:
+    """Собрать отчет в памяти (None - нет продаж для отчета).
+
+    Своя сессия: сборку ждут все одновременные запросы отчета (single-flight).
+    Сборок одновременно не больше REPORT_CONCURRENCY, остальные в очереди
+    (api/limits.py); отрисовка идет в потоке и не блокирует чтения дашборда.
+    """
+    async with report_gate.slot():
+        async with async_session() as session:
+            data = await load_report_data(session, user_id, report_format, date_range)
+        if data is None:
+            return None
+        return await asyncio.to_thread(render_report, report_format, data, user_name, label)
+
+
+async def _build_period_report(
+    user_id: int,
+    data_version: int,
+    user_name: str,
+    report_format: str,
+    period: str,
+    tz: str,
+    date_from: date,
+    date_to: date,
+    date_range: Tuple[datetime, datetime]
+) -> Optional[bytes]:
+    """Собрать отчет за период и сохранить его для следующих запросов"""
+    content = await _build_report(user_id, user_name, report_format, date_range, period_label(date_from, date_to))
+    if content is not None:
+        async with async_session() as session:
+            await save_report(session, user_id, period, report_format, tz, date_from, data_version, content)
+    return content
+
+
+async def _report_response(
+    session: AsyncSession,
     telegram_id: int,
-    session: AsyncSession = Depends(get_session)
-):
-    """Сгенерировать PDF отчет"""
-    # Получаем данные
+    report_format: str,
+    if_none_match: Optional[str],
+    period: Optional[str] = None,
+    tz: str = DEFAULT_REPORT_TZ
+) -> Response:
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
     )
@@ -247,88 +864,91 @@ async def generate_pdf(
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    # Получаем статистику
-    result = await session.execute(
-        select(Sale).where(Sale.user_id == user.id)
-    )
-    sales_list = result.scalars().all()
-
-    if not sales_list:
+    user_name = user.first_name or user.username or f"User {telegram_id}"
+    content = None
+
+    if period is None:
+        # Отчет по всей истории определяется версией данных
+        etag = report_etag(user.id, user.data_version)
+        if if_none_match == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        # Лимит частоты расходуется только на сборку, не на 304 и готовые отчеты
+        await rate_limiter.check("report", telegram_id)
+        # Повторное нажатие или другой запрос того же отчета ждет уже идущую сборку
+        content = await flights.do(
+            ("report", report_format, user.id, user.data_version),
+            lambda: _build_report(user.id, user_name, report_format)
+        )
+    else:
+        try:
+            zone = ZoneInfo(tz)
+        except ZoneInfoNotFoundError:
+            raise HTTPException(status_code=400, detail=f"Неизвестный часовой пояс '{tz}'")
+
+        date_from, date_to = period_dates(period, zone)
+        date_range = local_range_to_utc(date_from, date_to, zone)
+
+        # Готовый отчет (собран заранее или предыдущим запросом) отдается без сборки
+        stored = await stored_report(session, user, period, report_format, tz, date_from, date_range[1])
+        version = stored.data_version if stored else user.data_version
+        etag = report_etag(user.id, version, period, date_from)
+        if if_none_match == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        if stored:
+            content = stored.content
+        else:
+            await rate_limiter.check("report", telegram_id)
+            content = await flights.do(
+                ("report", report_format, user.id, version, period, tz, date_from),
+                lambda: _build_period_report(
+                    user.id, version, user_name, report_format, period, tz, date_from, date_to, date_range
+                )
+            )
+
+    if content is None:
         raise HTTPException(status_code=404, detail="Нет данных для отчета")
 
-    # Вычисляем статистику
-    total_amount = sum(sale.amount * sale.quantity for sale in sales_list)
-    total_sales = len(sales_list)
-    completed_sales = len([s for s in sales_list if s.status == "completed"])
-    pending_sales = len([s for s in sales_list if s.status == "pending"])
-    cancelled_sales = len([s for s in sales_list if s.status == "cancelled"])
-    average_check = total_amount / total_sales if total_sales > 0 else 0
-    conversion_rate = (completed_sales / total_sales * 100) if total_sales > 0 else 0
-
-    stats = {
-        'total_amount': round(total_amount, 2),
-        'total_sales': total_sales,
-        'average_check': round(average_check, 2),
-        'completed_sales': completed_sales,
-        'pending_sales': pending_sales,
-        'cancelled_sales': cancelled_sales,
-        'conversion_rate': round(conversion_rate, 2)
-    }
-
-    # Получаем топ товары
-    result = await session.execute(
-        select(
-            Sale.product_name,
-            func.sum(Sale.amount * Sale.quantity).label("total_amount"),
-            func.sum(Sale.quantity).label("total_quantity"),
-            func.count(Sale.id).label("sales_count")
-        )
-        .where(Sale.user_id == user.id)
-        .where(Sale.status == "completed")
-        .group_by(Sale.product_name)
-        .order_by(func.sum(Sale.amount * Sale.quantity).desc())
-        .limit(5)
+    extension, media_type = REPORT_FORMATS[report_format]
+    filename = f'sales_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    return Response(
+        content,
+        media_type=media_type,
+        headers={"ETag": etag, "Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
-    top_products = []
-    for row in result:
-        top_products.append({
-            'product_name': row.product_name,
-            'total_amount': round(row.total_amount, 2),
-            'total_quantity': row.total_quantity,
-            'sales_count': row.sales_count
-        })
-
-    # Конвертируем продажи в dict
-    sales = [
-        {
-            'date': sale.date.isoformat(),
-            'product_name': sale.product_name,
-            'amount': sale.amount,
-            'quantity': sale.quantity,
-            'status': sale.status
-        }
-        for sale in sales_list[:50]  # Ограничиваем 50 продажами
-    ]
-
-    # Генерируем PDF
-    user_name = user.first_name or user.username or f"User {telegram_id}"
-    pdf_path = generate_pdf_report(stats, sales, top_products, user_name)
 
-    return FileResponse(
-        pdf_path,
-        media_type='application/pdf',
-        filename=f'sales_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-    )
+@router.get("/reports/{telegram_id}/pdf")
+async def generate_pdf(
+    telegram_id: int,
+    period: Optional[Literal[PERIODS]] = None,
+    tz: str = DEFAULT_REPORT_TZ,
+    if_none_match: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_session)
+):
+    """Сгенерировать PDF отчет за всю историю или за период (today, yesterday, week, month)"""
+    return await _report_response(session, telegram_id, "pdf", if_none_match, period, tz)
 
 
 @router.get("/reports/{telegram_id}/excel")
 async def generate_excel(
     telegram_id: int,
+    period: Optional[Literal[PERIODS]] = None,
+    tz: str = DEFAULT_REPORT_TZ,
+    if_none_match: Optional[str] = Header(None),
     session: AsyncSession = Depends(get_session)
 ):
-    """Сгенерировать Excel отчет"""
-    # Получаем данные (аналогично PDF)
+    """Сгенерировать Excel отчет за всю историю или за период (today, yesterday, week, month)"""
+    return await _report_response(session, telegram_id, "excel", if_none_match, period, tz)
+
+
+# Праздники и спрос
+async def _holiday_user(session: AsyncSession, telegram_id: Optional[int]) -> Optional[User]:
+    """Пользователь для персональных праздничных прогнозов, если передан telegram_id"""
+    if telegram_id is None:
+        return None
+
     result = await session.execute(
         select(User).where(User.telegram_id == telegram_id)
     )
@@ -337,94 +957,40 @@ async def generate_excel(
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    # Получаем статистику
-    result = await session.execute(
-        select(Sale).where(Sale.user_id == user.id)
-    )
-    sales_list = result.scalars().all()
-
-    if not sales_list:
-        raise HTTPException(status_code=404, detail="Нет данных для отчета")
-
-    # Вычисляем статистику
-    total_amount = sum(sale.amount * sale.quantity for sale in sales_list)
-    total_sales = len(sales_list)
-    completed_sales = len([s for s in sales_list if s.status == "completed"])
-    pending_sales = len([s for s in sales_list if s.status == "pending"])
-    cancelled_sales = len([s for s in sales_list if s.status == "cancelled"])
-    average_check = total_amount / total_sales if total_sales > 0 else 0
-    conversion_rate = (completed_sales / total_sales * 100) if total_sales > 0 else 0
-
-    stats = {
-        'total_amount': round(total_amount, 2),
-        'total_sales': total_sales,
-        'average_check': round(average_check, 2),
-        'completed_sales': completed_sales,
-        'pending_sales': pending_sales,
-        'cancelled_sales': cancelled_sales,
-        'conversion_rate': round(conversion_rate, 2)
-    }
-
-    # Получаем топ товары
-    result = await session.execute(
-        select(
-            Sale.product_name,
-            func.sum(Sale.amount * Sale.quantity).label("total_amount"),
-            func.sum(Sale.quantity).label("total_quantity"),
-            func.count(Sale.id).label("sales_count")
-        )
-        .where(Sale.user_id == user.id)
-        .where(Sale.status == "completed")
-        .group_by(Sale.product_name)
-        .order_by(func.sum(Sale.amount * Sale.quantity).desc())
-    )
-
-    top_products = []
-    for row in result:
-        top_products.append({
-            'product_name': row.product_name,
-            'total_amount': round(row.total_amount, 2),
-            'total_quantity': row.total_quantity,
-            'sales_count': row.sales_count
-        })
-
-    # Конвертируем продажи в dict
-    sales = [
-        {
-            'date': sale.date.isoformat(),
-            'product_name': sale.product_name,
-            'amount': sale.amount,
-            'quantity': sale.quantity,
-            'status': sale.status
-        }
-        for sale in sales_list
-    ]
+    return user
 
-    # Генерируем Excel
-    user_name = user.first_name or user.username or f"User {telegram_id}"
-    excel_path = generate_excel_report(stats, sales, top_products, user_name)
 
-    return FileResponse(
-        excel_path,
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        filename=f'sales_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    )
+async def _user_uplifts(session: AsyncSession, telegram_id: Optional[int]) -> Optional[Dict[str, float]]:
+    """Персональный рост к праздникам, если передан telegram_id"""
+    user = await _holiday_user(session, telegram_id)
+    if user is None:
+        return None
+    return await fit_user_uplifts(session, user)
 
 
-# Праздники и спрос
 @router.get("/holidays/upcoming")
-async def api_get_upcoming_holidays(days_ahead: int = 30):
+async def api_get_upcoming_holidays(
+    days_ahead: int = Query(30, ge=0, le=366),
+    telegram_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_session)
+):
     """Получить ближайшие праздники"""
-    return {"holidays": get_upcoming_holidays(days_ahead)}
+    uplifts = await _user_uplifts(session, telegram_id)
+    return {"holidays": get_upcoming_holidays(days_ahead, uplifts)}
 
 
 @router.get("/holidays/demand/{category}")
-async def api_get_demand_forecast(category: str, days_ahead: int = 30):
-    """Получить прогноз спроса на категорию товаров"""
-    forecast = get_demand_forecast(category, days_ahead)
-    if not forecast:
+async def api_get_demand_forecast(
+    category: str,
+    days_ahead: int = Query(30, ge=0, le=366),
+    telegram_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Получить прогноз спроса на категорию товаров (персональный при telegram_id)"""
+    if not has_category(category):
         raise HTTPException(status_code=404, detail=f"Категория '{category}' не найдена")
-    return {"category": category, "forecast": forecast}
+    uplifts = await _user_uplifts(session, telegram_id)
+    return {"category": category, "forecast": get_demand_forecast(category, days_ahead, uplifts)}
 
 
 @router.get("/holidays/peaks")
@@ -434,6 +1000,15 @@ async def api_get_peak_sales_periods():
 
 
 @router.get("/holidays/insights")
-async def api_get_category_insights():
-    """Получить инсайты по всем категориям"""
-    return {"insights": get_category_insights()}
+async def api_get_category_insights(
+    telegram_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """Получить инсайты по всем категориям (с выручкой пользователя по категориям при telegram_id)"""
+    user = await _holiday_user(session, telegram_id)
+    if user is None:
+        return {"insights": get_category_insights()}
+
+    uplifts = await fit_user_uplifts(session, user)
+    totals = await fetch_category_totals(session, user.id, datetime.utcnow() - timedelta(days=365))
+    return {"insights": get_category_insights(uplifts, {item["category"]: item for item in totals})}
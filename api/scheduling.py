@@ -0,0 +1,17 @@
+"""Расписание суточных фоновых задач.
+
+Только стандартная библиотека: модуль импортируют и API
+(api/report_batch.py), и бот (bot/broadcast.py), которому не нужны
+pandas и подключение к БД.
+"""
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+
+def seconds_until_hour(hour: int, zone: ZoneInfo) -> float:
+    """Секунд до ближайшего наступления hour:00 в поясе zone"""
+    now = datetime.now(zone)
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
@@ -0,0 +1,127 @@
+"""Полнотекстовый поиск продаж по названию товара.
+
+Названия живут в справочнике товаров, поэтому поиск идет в два шага:
+товары пользователя, подходящие под запрос, находятся по
+полнотекстовому индексу (SQLite FTS5 / PostgreSQL tsvector + GIN, см.
+database/migrations.py: create_product_search_index), затем продажи
+этих товаров выбираются по индексам sales.
+
+Каждое слово запроса - префикс ("бук роз" находит "Букет роз"),
+регистр и ё/е не различаются. Продажи отдаются страницами по
+(date, id) по убыванию: курсор - последняя строка предыдущей страницы,
+поэтому следующая страница не зависит от глубины (в отличие от OFFSET).
+Продажи найденных товаров и итоги по ним читаются из покрывающего
+индекса ix_sales_user_product_date. Итоги по всему найденному считаются один раз - для первой страницы.
+"""
+import base64
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, func, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.categories import normalize
+from database.models import Sale, to_rubles
+
+
+MAX_SEARCH_TERMS = 8
+
+
+def search_terms(query: str) -> List[str]:
+    """Слова запроса в нормализованном виде (только буквы и цифры)"""
+    return normalize(query).split()[:MAX_SEARCH_TERMS]
+
+
+def encode_cursor(sale: Sale) -> str:
+    raw = f"{sale.date.isoformat()}|{sale.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """(date, id) последней продажи предыдущей страницы; ValueError при порче"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        day, sale_id = raw.split("|")
+        return datetime.fromisoformat(day), int(sale_id)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Некорректный курсор") from e
+
+
+async def matching_product_ids(session: AsyncSession, user_id: int, terms: List[str]) -> List[int]:
+    """id товаров пользователя, в названии которых есть все слова-префиксы"""
+    if session.get_bind().dialect.name == "postgresql":
+        query = " & ".join(f"{term}:*" for term in terms)
+        result = await session.execute(
+            text(
+                "SELECT id FROM products "
+                "WHERE user_id = :user_id AND search_vector @@ to_tsquery('simple', :query)"
+            ),
+            {"user_id": user_id, "query": query}
+        )
+    else:
+        # Токен владельца в том же индексе: пересечение с товарами пользователя делает FTS5
+        query = f"owner:u{user_id} AND name:(" + " AND ".join(f'"{term}"*' for term in terms) + ")"
+        result = await session.execute(
+            text("SELECT rowid FROM products_fts WHERE products_fts MATCH :query"),
+            {"query": query}
+        )
+    return [row[0] for row in result]
+
+
+async def search_sales(
+    session: AsyncSession,
+    user_id: int,
+    terms: List[str],
+    limit: int,
+    cursor: Optional[Tuple[datetime, int]] = None,
+    status: Optional[str] = None
+) -> Tuple[List[Sale], Optional[str], Optional[Dict]]:
+    """Страница найденных продаж, курсор следующей страницы и итоги (только без cursor)"""
+    product_ids = await matching_product_ids(session, user_id, terms)
+    if not product_ids:
+        empty_totals = {"total_amount": 0.0, "total_quantity": 0, "sales_count": 0, "products_count": 0}
+        return [], None, empty_totals if cursor is None else None
+
+    conditions = [Sale.user_id == user_id, Sale.product_id.in_(product_ids)]
+    if status is not None:
+        conditions.append(Sale.status == status)
+    page_conditions = list(conditions)
+    if cursor is not None:
+        page_conditions.append(tuple_(Sale.date, Sale.id) < tuple_(*cursor))
+
+    # Страница выбирается по покрывающему индексу, и только ее строки
+    # читаются из таблицы (Sale подгружает товар JOIN-ом - для всех
+    # кандидатов до сортировки это в десятки раз дороже)
+    newest_first = (Sale.date.desc(), Sale.id.desc())
+    page_ids = (
+        select(Sale.id)
+        .where(*page_conditions)
+        .order_by(*newest_first)
+        .limit(limit + 1)
+    )
+    page_query = select(Sale).where(Sale.id.in_(page_ids.scalar_subquery())).order_by(*newest_first)
+    sales = (await session.execute(page_query)).scalars().all()
+
+    next_cursor = None
+    if len(sales) > limit:
+        sales = sales[:limit]
+        next_cursor = encode_cursor(sales[-1])
+
+    totals = None
+    if cursor is None:
+        row = (await session.execute(
+            select(
+                func.coalesce(func.sum(Sale.line_total), 0).label("total_kopecks"),
+                func.coalesce(func.sum(Sale.quantity), 0).label("total_quantity"),
+                func.count(Sale.id).label("sales_count")
+            ).where(*conditions)
+        )).one()
+        totals = {
+            "total_amount": to_rubles(row.total_kopecks),
+            "total_quantity": row.total_quantity,
+            "sales_count": row.sales_count,
+            # Найденные товары каталога: COUNT(DISTINCT) по продажам вдвое дороже всего запроса
+            "products_count": len(product_ids),
+        }
+
+    return sales, next_cursor, totals
@@ -0,0 +1,90 @@
+"""Схлопывание одинаковых одновременных запросов (single-flight).
+
+Двойное нажатие "📊 Excel отчет" или десяток вкладок Mini App, открытых
+разом, приходят как одинаковые запросы почти одновременно. Первый
+запрос запускает вычисление, остальные с тем же ключом ждут его
+результат (или его исключение) вместо повторного расчета.
+
+Ключ включает версию данных пользователя (users.data_version): запрос,
+пришедший после записи продаж, не присоединится к вычислению, которое
+началось до нее. Вычисление идет отдельной задачей со своей сессией БД,
+поэтому отмена первого запроса (клиент закрыл вкладку) не обрывает его
+для остальных. Схлопывание - в пределах процесса API.
+"""
+import asyncio
+import functools
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from sqlalchemy import select
+
+from database.models import async_session, User
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Одно выполняющееся вычисление на ключ"""
+
+    def __init__(self):
+        self.metrics: Counter = Counter()
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[T]]) -> T:
+        """Результат compute(); при уже идущем вычислении с тем же ключом - его результат"""
+        task = self._flights.get(key)
+        if task is None:
+            self.metrics["computed"] += 1
+            task = asyncio.ensure_future(compute())
+            self._flights[key] = task
+            task.add_done_callback(functools.partial(self._finish, key))
+        else:
+            self.metrics["coalesced"] += 1
+        # shield: отмена одного ожидающего не отменяет вычисление для остальных
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            task.exception()  # все ожидающие могли уйти - не оставляем исключение непрочитанным
+
+
+flights = SingleFlight()
+
+
+async def data_version(telegram_id: int):
+    """Версия данных пользователя (None - пользователя нет)"""
+    async with async_session() as session:
+        return await session.scalar(
+            select(User.data_version).where(User.telegram_id == telegram_id)
+        )
+
+
+def coalesced(route: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Декоратор маршрута с параметрами telegram_id и session (ставится под @router.get).
+
+    Ключ - (маршрут, telegram_id, версия данных, остальные параметры).
+    Маршрут выполняется с собственной сессией; сессия запроса не используется.
+    """
+    @functools.wraps(route)
+    async def wrapper(*, telegram_id: int, session, **params):
+        key = (
+            route.__name__,
+            telegram_id,
+            await data_version(telegram_id),
+            tuple(sorted(params.items()))
+        )
+
+        async def compute():
+            async with async_session() as own_session:
+                return await route(telegram_id=telegram_id, session=own_session, **params)
+
+        return await flights.do(key, compute)
+
+    return wrapper
@@ -0,0 +1,194 @@
+"""Временные ряды продаж с группировкой по интервалам на стороне БД.
+
+Продажи хранятся в наивном UTC. Перевод в часовой пояс пользователя и
+усечение до начала интервала выполняются в SQL, поэтому график за любой
+период стоит одного GROUP BY. Пропущенные интервалы заполняются нулями
+через pandas без циклов по дням.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+from sqlalchemy import select, func, case, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Sale, KOPECKS_PER_RUBLE
+
+
+BUCKETS = ("hour", "day", "week", "month")
+METRICS = ("revenue", "count", "quantity")
+STATUSES = ("completed", "pending", "cancelled", "all")
+
+# Защита от запросов на сотни тысяч точек (например, часы за 10 лет)
+MAX_BUCKETS = 50_000
+
+# Формат меток: strftime для SQLite и pandas, to_char для PostgreSQL
+_LABEL_FORMATS = {
+    "hour": ("%Y-%m-%d %H:00", "YYYY-MM-DD HH24:00"),
+    "day": ("%Y-%m-%d", "YYYY-MM-DD"),
+    "week": ("%Y-%m-%d", "YYYY-MM-DD"),
+    "month": ("%Y-%m-%d", "YYYY-MM-DD"),
+}
+
+_PANDAS_FREQ = {
+    "hour": "h",
+    "day": "D",
+    "week": "W-MON",
+    "month": "MS",
+}
+
+
+def local_range_to_utc(date_from: date, date_to: date, tz: ZoneInfo) -> Tuple[datetime, datetime]:
+    """Локальные даты [date_from, date_to] -> полуинтервал в наивном UTC"""
+    start = datetime.combine(date_from, time.min, tzinfo=tz)
+    end = datetime.combine(date_to + timedelta(days=1), time.min, tzinfo=tz)
+    return (
+        start.astimezone(timezone.utc).replace(tzinfo=None),
+        end.astimezone(timezone.utc).replace(tzinfo=None),
+    )
+
+
+def _offset_minutes(moment: datetime, tz: ZoneInfo) -> int:
+    return int(moment.replace(tzinfo=timezone.utc).astimezone(tz).utcoffset().total_seconds() // 60)
+
+
+def _offset_segments(tz: ZoneInfo, start: datetime, end: datetime) -> List[Tuple[datetime, int]]:
+    """Смещения пояса на отрезке UTC: [(начало участка, смещение в минутах)]
+
+    Переходы ищутся шагом в сутки и уточняются бинарным поиском до минуты,
+    так что для двух лет это меньше тысячи вызовов utcoffset.
+    """
+    segments = [(start, _offset_minutes(start, tz))]
+    moment = start
+    while moment < end:
+        next_moment = min(moment + timedelta(days=1), end)
+        offset = _offset_minutes(next_moment, tz)
+        if offset != segments[-1][1]:
+            low, high = moment, next_moment
+            while high - low > timedelta(minutes=1):
+                middle = low + (high - low) / 2
+                if _offset_minutes(middle, tz) == offset:
+                    high = middle
+                else:
+                    low = middle
+            segments.append((high.replace(second=0, microsecond=0), offset))
+        moment = next_moment
+    return segments
+
+
+def _local_time_sqlite(tz: ZoneInfo, start: datetime, end: datetime):
+    """Локальное время продажи для SQLite: datetime(date, '+N minutes')"""
+    segments = _offset_segments(tz, start, end)
+    if len(segments) == 1:
+        modifier = literal(f"{segments[0][1]:+d} minutes")
+    else:
+        modifier = case(
+            *[
+                (Sale.date < boundary, f"{offset:+d} minutes")
+                for (_, offset), (boundary, _) in zip(segments, segments[1:])
+            ],
+            else_=f"{segments[-1][1]:+d} minutes"
+        )
+    return func.datetime(Sale.date, modifier)
+
+
+def _bucket_sqlite(bucket: str, tz: ZoneInfo, start: datetime, end: datetime):
+    local = _local_time_sqlite(tz, start, end)
+    if bucket == "week":
+        # Понедельник недели: ближайшее воскресенье вперед минус 6 дней
+        return func.date(local, "weekday 0", "-6 days")
+    if bucket == "month":
+        return func.strftime("%Y-%m-01", local)
+    return func.strftime(_LABEL_FORMATS[bucket][0], local)
+
+
+def _bucket_postgresql(bucket: str, tz: ZoneInfo):
+    local = func.timezone(tz.key, func.timezone("UTC", Sale.date))
+    return func.to_char(func.date_trunc(bucket, local), _LABEL_FORMATS[bucket][1])
+
+
+def _metric_column(metric: str):
+    if metric == "revenue":
+        return func.sum(Sale.line_total)
+    if metric == "quantity":
+        return func.sum(Sale.quantity)
+    return func.count(Sale.id)
+
+
+def bucket_labels(bucket: str, date_from: date, date_to: date) -> pd.Index:
+    """Все метки интервалов периода (для заполнения пропусков)"""
+    start = pd.Timestamp(date_from)
+    if bucket == "week":
+        start -= pd.Timedelta(days=start.weekday())
+    elif bucket == "month":
+        start = start.replace(day=1)
+    end = pd.Timestamp(date_to) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    return pd.date_range(start, end, freq=_PANDAS_FREQ[bucket]).strftime(_LABEL_FORMATS[bucket][0])
+
+
+def count_buckets(bucket: str, date_from: date, date_to: date) -> int:
+    """Оценка числа точек ряда до выполнения запроса"""
+    days = (date_to - date_from).days + 1
+    return {"hour": days * 24, "day": days, "week": days // 7 + 2, "month": days // 28 + 2}[bucket]
+
+
+async def fetch_series(
+    session: AsyncSession,
+    user_id: int,
+    bucket: str = "day",
+    tz_name: str = "UTC",
+    metric: str = "revenue",
+    status: str = "completed",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    days: int = 30
+) -> Tuple[List[str], List[float]]:
+    """Ряд значений метрики по интервалам в часовом поясе пользователя.
+
+    Параметры должны быть предварительно проверены (см. BUCKETS, METRICS,
+    STATUSES); неизвестный часовой пояс приводит к ZoneInfoNotFoundError,
+    некорректный период - к ValueError.
+    """
+    tz = ZoneInfo(tz_name)
+    if date_to is None:
+        date_to = datetime.now(tz).date()
+    if date_from is None:
+        date_from = date_to - timedelta(days=days - 1)
+
+    if date_from > date_to:
+        raise ValueError("Начало периода позже его конца")
+    if count_buckets(bucket, date_from, date_to) > MAX_BUCKETS:
+        raise ValueError(f"Слишком много точек, максимум {MAX_BUCKETS}")
+
+    start, end = local_range_to_utc(date_from, date_to, tz)
+
+    if session.get_bind().dialect.name == "postgresql":
+        bucket_key = _bucket_postgresql(bucket, tz)
+    else:
+        bucket_key = _bucket_sqlite(bucket, tz, start, end)
+    bucket_key = bucket_key.label("bucket")
+
+    query = (
+        select(bucket_key, _metric_column(metric).label("value"))
+        .where(Sale.user_id == user_id)
+        .where(Sale.date >= start)
+        .where(Sale.date < end)
+        .group_by(bucket_key)
+    )
+    if status != "all":
+        query = query.where(Sale.status == status)
+
+    result = await session.execute(query)
+    rows = result.all()
+
+    labels = bucket_labels(bucket, date_from, date_to)
+    values = pd.Series(
+        [row.value for row in rows],
+        index=[row.bucket for row in rows],
+        dtype="int64"
+    ).groupby(level=0).sum().reindex(labels, fill_value=0)
+
+    if metric == "revenue":
+        return list(labels), (values / KOPECKS_PER_RUBLE).round(2).tolist()
+    return list(labels), values.astype(float).tolist()
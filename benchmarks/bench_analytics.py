@@ -0,0 +1,110 @@
+"""Сравнение векторной аналитики (api/analytics.py) с циклами на Python.
+
+Запуск: python -m benchmarks.bench_analytics [число продаж]
+"""
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from api.analytics import (
+    FRAME_COLUMNS,
+    prepare_frame,
+    daily_trends,
+    weekday_profile,
+    hourly_profile,
+    abc_classification,
+    ABC_THRESHOLDS
+)
+
+
+def make_frame(rows: int, days: int = 365, products: int = 500) -> pd.DataFrame:
+    """Синтетические продажи за days дней"""
+    rng = np.random.default_rng(0)
+    start = np.datetime64(datetime.utcnow() - timedelta(days=days), "s")
+    frame = pd.DataFrame({
+        "date": start + rng.integers(0, days * 86400, rows).astype("timedelta64[s]"),
+        "line_total": rng.integers(10_000, 10_000_000, rows),
+        "quantity": rng.integers(1, 4, rows),
+        "status": rng.choice(["completed", "pending", "cancelled"], rows, p=[0.75, 0.15, 0.10]),
+        "product_id": rng.zipf(1.3, rows) % products,
+    })
+    return prepare_frame(frame[FRAME_COLUMNS].copy())
+
+
+def python_loops(records):
+    """Те же метрики обычными циклами по списку продаж"""
+    daily = defaultdict(int)
+    weekday = defaultdict(int)
+    hourly = defaultdict(int)
+    per_product = defaultdict(int)
+    for date, line_total, _, status, product_id in records:
+        if status != "completed":
+            continue
+        daily[date.date()] += line_total
+        weekday[date.weekday()] += line_total
+        hourly[date.hour] += line_total
+        per_product[product_id] += line_total
+
+    day, last = min(daily), max(daily)
+    revenue = []
+    while day <= last:
+        revenue.append(daily.get(day, 0))
+        day += timedelta(days=1)
+
+    rolling, cumulative, growth, running = [], [], [], 0
+    for index, value in enumerate(revenue):
+        window = revenue[max(0, index - 6):index + 1]
+        rolling.append(sum(window) / len(window))
+        running += value
+        cumulative.append(running)
+        previous = revenue[index - 1] if index else 0
+        growth.append((value - previous) / previous * 100 if previous else None)
+
+    total = sum(per_product.values())
+    classes, accumulated = {}, 0
+    for product_id, value in sorted(per_product.items(), key=lambda item: item[1], reverse=True):
+        share = accumulated / total
+        classes[product_id] = "A" if share < ABC_THRESHOLDS[0] else "B" if share < ABC_THRESHOLDS[1] else "C"
+        accumulated += value
+
+    return rolling, cumulative, growth, weekday, hourly, classes
+
+
+def vectorized(frame):
+    return (
+        daily_trends(frame),
+        weekday_profile(frame),
+        hourly_profile(frame),
+        abc_classification(frame),
+    )
+
+
+def measure(function, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    frame = make_frame(rows)
+    records = list(frame.itertuples(index=False, name=None))
+    records = [(pd.Timestamp(row[0]).to_pydatetime(), *row[1:]) for row in records]
+
+    loops = measure(python_loops, records)
+    pandas_time = measure(vectorized, frame)
+    print(f"Продаж: {rows:,}")
+    print(f"Циклы Python: {loops * 1000:.1f} мс")
+    print(f"pandas/NumPy: {pandas_time * 1000:.1f} мс")
+    print(f"Ускорение: x{loops / pandas_time:.1f}")
+
+
+if __name__ == "__main__":
+    main()
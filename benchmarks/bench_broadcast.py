@@ -0,0 +1,142 @@
+"""Рассылка сводок (bot/broadcast.py) через локальный фейковый Telegram.
+
+Фейковый Bot API отвечает на sendMessage с задержкой TELEGRAM_LATENCY и,
+как настоящий, возвращает 429 с retry_after, если за последнюю секунду
+сообщений больше TELEGRAM_LIMIT; каждый BLOCKED_EVERY-й чат заблокировал
+бота (403). Фейковый API продаж отдает страницы сводок и принимает
+подтверждения. Меряется достигнутый темп, число 429 и итоги рассылки при
+разном BROADCAST_RATE; для сравнения - последовательная отправка.
+
+Запуск: python -m benchmarks.bench_broadcast [число пользователей]
+"""
+import asyncio
+import os
+import sys
+import time
+from collections import deque
+
+from aiohttp import web
+
+TELEGRAM_LATENCY = 0.05
+TELEGRAM_LIMIT = 30
+BLOCKED_EVERY = 50
+PAGE_SIZE = 100
+BOT_TOKEN = "123456:bench"
+FAKE_PORT = 18083
+
+os.environ.setdefault("API_URL", f"http://127.0.0.1:{FAKE_PORT}")
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+from bot.api_client import ApiClient  # noqa: E402
+from bot.broadcast import Broadcaster, broadcast_digests  # noqa: E402
+
+
+def fake_servers(users: int, state: dict) -> web.Application:
+    """Bot API с лимитом частоты и API сводок с контрольной точкой"""
+    window = deque()
+
+    async def bot_method(request: web.Request) -> web.Response:
+        data = await request.post()
+        chat_id = int(data["chat_id"])
+        await asyncio.sleep(TELEGRAM_LATENCY)
+        now = time.monotonic()
+        while window and window[0] < now - 1:
+            window.popleft()
+        if len(window) >= TELEGRAM_LIMIT:
+            state["429"] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1}
+            }, status=429)
+        window.append(now)
+        if chat_id % BLOCKED_EVERY == 0:
+            return web.json_response({
+                "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"
+            }, status=403)
+        state["delivered"] += 1
+        return web.json_response({"ok": True, "result": {
+            "message_id": state["delivered"],
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": data.get("text", "")
+        }})
+
+    async def digests(request: web.Request) -> web.Response:
+        after = int(request.query.get("after_user_id", state["checkpoint"]))
+        ids = list(range(after + 1, min(after + PAGE_SIZE, users) + 1))
+        return web.json_response({
+            "day": "2024-01-01",
+            "digests": [{
+                "user_id": user_id,
+                "telegram_id": user_id,
+                "first_name": "Bench",
+                "stats": {
+                    "total_amount": 12345.0, "total_sales": 10, "average_check": 1234.5,
+                    "completed_sales": 8, "pending_sales": 1, "cancelled_sales": 1, "conversion_rate": 80.0
+                },
+                "revenue_change": 5.0
+            } for user_id in ids],
+            "last_user_id": ids[-1] if ids else None,
+            "has_more": bool(ids) and ids[-1] < users,
+            "finished": False
+        })
+
+    async def ack(request: web.Request) -> web.Response:
+        body = await request.json()
+        state["checkpoint"] = max(state["checkpoint"], body["last_user_id"])
+        state["acks"] += 1
+        return web.json_response({"success": True})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", bot_method)
+    app.router.add_get("/api/digests", digests)
+    app.router.add_post("/api/digests/ack", ack)
+    return app
+
+
+async def run_case(users: int, rate: float, workers: int) -> dict:
+    state = {"429": 0, "delivered": 0, "checkpoint": 0, "acks": 0}
+    runner = web.AppRunner(fake_servers(users, state))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", FAKE_PORT).start()
+
+    bot = Bot(BOT_TOKEN, session=AiohttpSession(
+        api=TelegramAPIServer.from_base(f"http://127.0.0.1:{FAKE_PORT}")
+    ))
+    api = ApiClient()
+    await api.start()
+    started = time.perf_counter()
+    try:
+        if workers == 1:
+            # Наивный вариант: по одному сообщению, без темпа
+            broadcaster = Broadcaster(bot, rate=10_000, burst=10_000, workers=1)
+            totals = await broadcaster.send_all((user_id, "digest") for user_id in range(1, users + 1))
+        else:
+            totals = await broadcast_digests(bot, api, Broadcaster(bot, rate=rate, workers=workers))
+    finally:
+        elapsed = time.perf_counter() - started
+        await api.close()
+        await bot.session.close()
+        await runner.cleanup()
+    return {"elapsed": elapsed, "totals": dict(totals), **state}
+
+
+async def main(users: int):
+    print(
+        f"{users} пользователей, лимит Telegram {TELEGRAM_LIMIT}/с, "
+        f"ответ {TELEGRAM_LATENCY * 1000:.0f} мс, страница {PAGE_SIZE}"
+    )
+    cases = [("последовательно", 0, 1), ("rate 25, 16 задач", 25, 16), ("rate 40, 16 задач", 40, 16)]
+    for name, rate, workers in cases:
+        result = await run_case(users, rate, workers)
+        print(
+            f"  {name:<18}: {result['elapsed']:>5.1f} с, {result['delivered'] / result['elapsed']:>5.1f} сообщ./с, "
+            f"429: {result['429']}, итоги {result['totals']}, контрольная точка {result['checkpoint']}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,155 @@
+"""Нагрузка на webhook бота (bot/webhook.py) с локальным фейковым Telegram.
+
+Фейковый Bot API отвечает на sendMessage с задержкой TELEGRAM_LATENCY,
+как настоящий; webhook-сервер поднимается в этом же процессе, клиент
+шлет N обновлений /start в WEBHOOK_MAX_CONNECTIONS соединений, как Telegram.
+Меряется прием (ответы 200/503) и полная обработка (ответ отправлен в
+фейковый Telegram) при разной WEBHOOK_CONCURRENCY.
+
+Запуск: python -m benchmarks.bench_webhook [число обновлений]
+"""
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+TELEGRAM_LATENCY = 0.05
+BOT_TOKEN = "123456:bench"
+FAKE_PORT = 18081
+WEBHOOK_PORT_BENCH = 18082
+
+os.environ.setdefault("API_URL", f"http://127.0.0.1:{FAKE_PORT}")
+os.environ.setdefault("BOT_LOCK_FILE", "/tmp/bench_webhook.lock")
+os.environ.setdefault("SECRET_KEY", "bench")
+# Фейковый API отдает только уведомления об аномалиях - рассылку сводок не запускаем
+os.environ["DIGEST_HOUR"] = ""
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+from bot.main import create_dispatcher  # noqa: E402
+from bot.webhook import (  # noqa: E402
+    SECRET_HEADER,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_PATH,
+    WebhookProcessor,
+    create_webhook_app,
+    webhook_secret
+)
+
+
+def fake_telegram(sent: list) -> web.Application:
+    """Bot API: sendMessage с задержкой; API продаж: пустой список аномалий"""
+    async def bot_method(request: web.Request) -> web.Response:
+        data = await request.post()
+        await asyncio.sleep(TELEGRAM_LATENCY)
+        sent.append(time.perf_counter())
+        return web.json_response({"ok": True, "result": {
+            "message_id": len(sent),
+            "date": int(time.time()),
+            "chat": {"id": int(data.get("chat_id", 1)), "type": "private"},
+            "text": data.get("text", "")
+        }})
+
+    async def alerts(request: web.Request) -> web.Response:
+        return web.json_response({"alerts": []})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", bot_method)
+    app.router.add_get("/api/alerts/anomalies", alerts)
+    return app
+
+
+def make_update(update_id: int) -> dict:
+    user = {"id": 1000 + update_id % 5000, "is_bot": False, "first_name": "Bench"}
+    return {"update_id": update_id, "message": {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user["id"], "type": "private"},
+        "from": user,
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+    }}
+
+
+async def start_site(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def run_case(dispatcher, updates: int, concurrency: int, max_pending: int) -> dict:
+    sent = []
+    telegram = await start_site(fake_telegram(sent), FAKE_PORT)
+
+    bot = Bot(BOT_TOKEN, session=AiohttpSession(
+        api=TelegramAPIServer.from_base(f"http://127.0.0.1:{FAKE_PORT}")
+    ))
+    processor = WebhookProcessor(
+        bot, dispatcher, webhook_secret(BOT_TOKEN),
+        concurrency=concurrency, max_pending=max_pending
+    )
+    webhook = await start_site(create_webhook_app(processor), WEBHOOK_PORT_BENCH)
+
+    url = f"http://127.0.0.1:{WEBHOOK_PORT_BENCH}{WEBHOOK_PATH}"
+    statuses = {}
+    queue = asyncio.Queue()
+    for update_id in range(updates):
+        queue.put_nowait(update_id)
+
+    async def telegram_connection(session: aiohttp.ClientSession):
+        # Как Telegram: следующее обновление в соединении - после ответа на предыдущее
+        while not queue.empty():
+            update_id = queue.get_nowait()
+            async with session.post(
+                url, json=make_update(update_id), headers={SECRET_HEADER: processor.secret}
+            ) as response:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=WEBHOOK_MAX_CONNECTIONS)) as session:
+        await asyncio.gather(*(telegram_connection(session) for _ in range(WEBHOOK_MAX_CONNECTIONS)))
+        accepted = time.perf_counter() - started
+        async with session.post(url, json=make_update(0), headers={SECRET_HEADER: "wrong"}) as response:
+            unauthorized = response.status
+
+    while processor.pending:
+        await asyncio.sleep(0.01)
+    processed = time.perf_counter() - started
+
+    await webhook.cleanup()
+    await telegram.cleanup()
+    return {
+        "statuses": statuses,
+        "unauthorized": unauthorized,
+        "accept_rate": updates / accepted,
+        "process_rate": processor.metrics["processed"] / processed,
+        "processed": processor.metrics["processed"]
+    }
+
+
+async def main(updates: int):
+    print(f"{updates} обновлений, {WEBHOOK_MAX_CONNECTIONS} соединений, ответ Telegram {TELEGRAM_LATENCY * 1000:.0f} мс")
+    # Роутер бота подключается к одному диспетчеру на процесс - он общий для всех прогонов
+    dispatcher = create_dispatcher()
+    for concurrency in (4, 16, 64, 256):
+        result = await run_case(dispatcher, updates, concurrency, max_pending=updates)
+        print(
+            f"  concurrency {concurrency:>3}: прием {result['accept_rate']:>7.0f} upd/s, "
+            f"обработка {result['process_rate']:>6.0f} upd/s, ответы {result['statuses']}, "
+            f"чужой секрет -> {result['unauthorized']}"
+        )
+    result = await run_case(dispatcher, updates, 16, max_pending=100)
+    print(
+        f"  перегрузка (concurrency 16, max_pending 100): ответы {result['statuses']}, "
+        f"обработано {result['processed']}"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,194 @@
+"""HTTP-клиент бота к API: один пул соединений на весь процесс.
+
+Клиент создается при старте диспетчера (bot/main.py) и передается в
+обработчики через workflow data aiogram (параметр api). Соединения с API
+переиспользуются (keep-alive), DNS кэшируется, у каждого вызова свой
+таймаут. Идемпотентные вызовы повторяются при сетевых ошибках и ответах
+429/502/503/504 с экспоненциальной задержкой и полным джиттером
+(или по Retry-After, если API его прислал).
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Mapping, NamedTuple, Optional
+
+import aiohttp
+from multidict import CIMultiDict
+
+
+logger = logging.getLogger(__name__)
+
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", 32))
+API_TIMEOUT_SECONDS = float(os.getenv("API_TIMEOUT_SECONDS", 10))
+API_CONNECT_TIMEOUT_SECONDS = 3
+API_RETRIES = 3
+RETRY_BASE_SECONDS = 0.2
+RETRY_MAX_SECONDS = 5
+DNS_CACHE_SECONDS = 300
+KEEPALIVE_SECONDS = 30
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class ApiResponse(NamedTuple):
+    """Прочитанный ответ API"""
+    status: int
+    body: bytes
+    headers: Mapping[str, str]
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class ApiClient:
+    """Пул соединений к API с таймаутами, повторами и счетчиками"""
+
+    def __init__(self, base_url: str = None, internal_key: str = None):
+        self.base_url = (base_url or os.getenv("API_URL", "http://localhost:8000")).rstrip("/")
+        self.internal_key = internal_key if internal_key is not None else os.getenv("SECRET_KEY", "")
+        self.metrics: Counter = Counter()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._count("connections_created"))
+        trace.on_connection_reuseconn.append(self._count("connections_reused"))
+        trace.on_dns_cache_hit.append(self._count("dns_cache_hits"))
+        trace.on_dns_cache_miss.append(self._count("dns_cache_misses"))
+
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=API_POOL_SIZE,
+                ttl_dns_cache=DNS_CACHE_SECONDS,
+                keepalive_timeout=KEEPALIVE_SECONDS,
+                enable_cleanup_closed=True
+            ),
+            timeout=aiohttp.ClientTimeout(total=API_TIMEOUT_SECONDS, connect=API_CONNECT_TIMEOUT_SECONDS),
+            trace_configs=[trace]
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        logger.info(f"API-клиент закрыт: {self.metrics_snapshot()}")
+
+    def _count(self, name: str):
+        async def handler(session, context, params):
+            self.metrics[name] += 1
+        return handler
+
+    def metrics_snapshot(self) -> Dict[str, float]:
+        """Счетчики запросов, повторов, ошибок и соединений"""
+        snapshot = dict(self.metrics)
+        latency_ms = snapshot.pop("latency_ms", 0)
+        if self.metrics["requests"]:
+            snapshot["avg_latency_ms"] = round(latency_ms / self.metrics["requests"], 1)
+        return snapshot
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: Dict = None,
+        json: Any = None,
+        timeout: float = None,
+        idempotent: bool = None,
+        internal: bool = False
+    ) -> ApiResponse:
+        """Вызов API; сетевые ошибки последней попытки пробрасываются.
+
+        idempotent по умолчанию - для GET; только такие вызовы
+        повторяются. internal - добавить X-Internal-Key.
+        """
+        if self._session is None:
+            raise RuntimeError("ApiClient не запущен")
+        if idempotent is None:
+            idempotent = method == "GET"
+        attempts = API_RETRIES + 1 if idempotent else 1
+        headers = {"X-Internal-Key": self.internal_key} if internal else None
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            started = time.monotonic()
+            self.metrics["requests"] += 1
+            try:
+                async with self._session.request(
+                    method, f"{self.base_url}{path}",
+                    params=_drop_none(params), json=json, headers=headers, timeout=request_timeout
+                ) as response:
+                    body = await response.read()
+                    result = ApiResponse(response.status, body, CIMultiDict(response.headers))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                self.metrics["errors"] += 1
+                if last_attempt:
+                    raise
+                delay = _backoff(attempt)
+                logger.warning(f"API {method} {path}: {type(e).__name__}, повтор через {delay:.2f} с")
+            else:
+                if result.status not in RETRY_STATUSES or last_attempt:
+                    return result
+                delay = _retry_after(result.headers) or _backoff(attempt)
+                logger.warning(f"API {method} {path}: HTTP {result.status}, повтор через {delay:.2f} с")
+            finally:
+                self.metrics["latency_ms"] += (time.monotonic() - started) * 1000
+
+            self.metrics["retries"] += 1
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        path: str,
+        *,
+        params: Dict = None,
+        headers: Dict = None,
+        timeout: float = None
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """GET без чтения тела: ответ читается по частям внутри контекста, без повторов"""
+        if self._session is None:
+            raise RuntimeError("ApiClient не запущен")
+        started = time.monotonic()
+        self.metrics["requests"] += 1
+        try:
+            async with self._session.get(
+                f"{self.base_url}{path}",
+                params=_drop_none(params), headers=headers,
+                timeout=aiohttp.ClientTimeout(total=timeout) if timeout else None
+            ) as response:
+                yield response
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            self.metrics["errors"] += 1
+            raise
+        finally:
+            self.metrics["latency_ms"] += (time.monotonic() - started) * 1000
+
+    async def get(self, path: str, **kwargs) -> ApiResponse:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> ApiResponse:
+        return await self.request("POST", path, **kwargs)
+
+
+def _drop_none(params: Optional[Dict]) -> Optional[Dict]:
+    # aiohttp не принимает None в параметрах запроса
+    return {key: value for key, value in params.items() if value is not None} if params else None
+
+
+def _backoff(attempt: int) -> float:
+    """Экспоненциальная задержка с полным джиттером"""
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+def _retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    try:
+        return min(float(headers["Retry-After"]), RETRY_MAX_SECONDS)
+    except (KeyError, ValueError):
+        return None
@@ -0,0 +1,256 @@
+"""Рассылка утренних сводок KPI всем пользователям.
+
+Сводки считает API (api/digests.py) страницами по id пользователя; бот
+забирает страницу, отправляет ее пулом из BROADCAST_WORKERS задач и
+подтверждает (POST /api/digests/ack), пока следующая страница уже
+загружается. Подтверждение - контрольная точка: после падения бота
+рассылка продолжается со следующей неподтвержденной страницы.
+
+Темп задает общий token bucket (BROADCAST_RATE сообщений в секунду, ниже
+лимита Telegram ~30/с) и не больше одного сообщения в секунду в чат.
+На 429 (TelegramRetryAfter) пауза ставится на весь bucket, а не на одну
+задачу: иначе остальные задачи продолжат упираться в тот же лимит.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, Iterable, Tuple
+from zoneinfo import ZoneInfo
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter
+)
+
+from api.scheduling import seconds_until_hour
+from bot.api_client import ApiClient
+
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))
+BROADCAST_BURST = int(os.getenv("BROADCAST_BURST", 5))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", 16))
+DIGEST_HOUR = os.getenv("DIGEST_HOUR", "9")
+DIGEST_RETRY_SECONDS = 300
+DIGEST_PAGE_TIMEOUT_SECONDS = 60
+REPORT_TZ = os.getenv("REPORT_TZ", "UTC")
+
+CHAT_INTERVAL_SECONDS = 1.0
+CHAT_LIMITER_MAX_KEYS = 10_000
+SEND_ATTEMPTS = 3
+NETWORK_RETRY_SECONDS = 1.0
+
+
+class TokenBucket:
+    """Не больше rate отправок в секунду в среднем и burst подряд"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Ожидающие проходят по очереди (Lock в asyncio честный)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Остановить все отправки на seconds (Telegram ответил 429)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+class ChatLimiter:
+    """Не чаще одного сообщения в чат за interval секунд"""
+
+    def __init__(self, interval: float = CHAT_INTERVAL_SECONDS):
+        self.interval = interval
+        self._next: Dict[int, float] = {}
+
+    async def wait(self, chat_id: int):
+        now = time.monotonic()
+        if len(self._next) >= CHAT_LIMITER_MAX_KEYS:
+            self._next = {chat: ready for chat, ready in self._next.items() if ready > now}
+        ready = self._next.get(chat_id, now)
+        self._next[chat_id] = max(ready, now) + self.interval
+        if ready > now:
+            await asyncio.sleep(ready - now)
+
+
+class Broadcaster:
+    """Пул задач отправки с общим темпом и лимитом на чат"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = BROADCAST_RATE,
+        burst: int = BROADCAST_BURST,
+        workers: int = BROADCAST_WORKERS
+    ):
+        self.bot = bot
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self.chats = ChatLimiter()
+        self.metrics: Counter = Counter()
+
+    async def send_all(self, messages: Iterable[Tuple[int, str]]) -> Counter:
+        """Отправить (chat_id, текст); счетчик исходов: sent, blocked, failed"""
+        results: Counter = Counter()
+        pending = iter(messages)
+
+        async def worker():
+            # Общий итератор: каждое сообщение забирает ровно одна задача
+            for chat_id, text in pending:
+                results[await self._send(chat_id, text)] += 1
+
+        await asyncio.gather(*(worker() for _ in range(self.workers)))
+        self.metrics.update(results)
+        return results
+
+    async def _send(self, chat_id: int, text: str) -> str:
+        for attempt in range(SEND_ATTEMPTS):
+            await self.chats.wait(chat_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id, text)
+                return "sent"
+            except TelegramRetryAfter as e:
+                self.metrics["retry_after"] += 1
+                self.bucket.pause(e.retry_after)
+            except TelegramForbiddenError:
+                return "blocked"  # Пользователь заблокировал бота
+            except TelegramNetworkError:
+                self.metrics["network_errors"] += 1
+                await asyncio.sleep(random.uniform(0, NETWORK_RETRY_SECONDS * 2 ** attempt))
+            except TelegramAPIError:
+                return "failed"
+        return "failed"
+
+
+def format_digest(digest: Dict, day: date) -> str:
+    """Текст утренней сводки"""
+    stats = digest["stats"]
+    name = digest.get("first_name") or "коллега"
+    revenue = f"{stats['total_amount']:,.0f}".replace(",", " ")
+    average_check = f"{stats['average_check']:,.0f}".replace(",", " ")
+    change = digest.get("revenue_change")
+    change_text = f" ({change:+.1f}% к предыдущему дню)" if change is not None else ""
+    return (
+        f"☀️ Доброе утро, {name}!\n\n"
+        f"Итоги за {day.strftime('%d.%m.%Y')}:\n"
+        f"💰 Выручка: {revenue} ₽{change_text}\n"
+        f"🛒 Продаж: {stats['total_sales']}, средний чек {average_check} ₽\n"
+        f"✅ Завершено: {stats['completed_sales']} ({stats['conversion_rate']}%)\n\n"
+        "Подробности - в дашборде."
+    )
+
+
+async def fetch_digest_page(api: ApiClient, day: str = None, after_user_id: int = None) -> Dict:
+    response = await api.get(
+        "/api/digests",
+        params={"day": day, "after_user_id": after_user_id},
+        internal=True,
+        timeout=DIGEST_PAGE_TIMEOUT_SECONDS
+    )
+    if response.status != 200:
+        raise RuntimeError(f"API вернул {response.status} при загрузке сводок")
+    return response.json()
+
+
+async def broadcast_digests(bot: Bot, api: ApiClient, broadcaster: Broadcaster = None) -> Counter:
+    """Разослать сводки за вчера, начиная с контрольной точки; счетчик исходов"""
+    page = await fetch_digest_page(api)
+    totals: Counter = Counter()
+    if page["finished"]:
+        return totals
+
+    day = page["day"]
+    digest_date = date.fromisoformat(day)
+    broadcaster = broadcaster or Broadcaster(bot)
+    cursor = 0
+    started = time.monotonic()
+    while True:
+        # Следующая страница грузится, пока отправляется текущая
+        next_page = None
+        if page["has_more"]:
+            next_page = asyncio.create_task(fetch_digest_page(api, day, page["last_user_id"]))
+        try:
+            results = await broadcaster.send_all(
+                (digest["telegram_id"], format_digest(digest, digest_date)) for digest in page["digests"]
+            )
+            totals.update(results)
+            if page["last_user_id"] is not None:
+                cursor = page["last_user_id"]
+
+            # Подтверждение монотонно по last_user_id, поэтому повтор безопасен
+            ack = await api.post(
+                "/api/digests/ack",
+                json={
+                    "day": day,
+                    "last_user_id": cursor,
+                    "sent": results["sent"],
+                    "failed": results["failed"],
+                    "blocked": results["blocked"],
+                    "finished": next_page is None
+                },
+                internal=True,
+                idempotent=True
+            )
+            if ack.status != 200:
+                raise RuntimeError(f"API вернул {ack.status} при подтверждении сводок")
+        except BaseException:
+            if next_page is not None:
+                next_page.cancel()
+            raise
+
+        if next_page is None:
+            break
+        page = await next_page
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Сводки за {day}: отправлено {totals['sent']}, заблокировали бота {totals['blocked']}, "
+        f"ошибок {totals['failed']}, 429 от Telegram {broadcaster.metrics['retry_after']}; "
+        f"{totals['sent'] / elapsed if elapsed else 0:.1f} сообщ./с"
+    )
+    return totals
+
+
+async def digest_loop(bot: Bot, api: ApiClient):
+    """Фоновая рассылка сводок раз в сутки в DIGEST_HOUR по REPORT_TZ.
+
+    При старте после DIGEST_HOUR незавершенная рассылка за вчера
+    продолжается сразу; завершенную API не отдаст повторно.
+    """
+    zone = ZoneInfo(REPORT_TZ)
+    hour = int(DIGEST_HOUR)
+    while True:
+        if datetime.now(zone).hour >= hour:
+            try:
+                await broadcast_digests(bot, api)
+            except Exception as e:
+                logger.error(f"Ошибка рассылки сводок: {e}")
+                await asyncio.sleep(DIGEST_RETRY_SECONDS)
+                continue
+        await asyncio.sleep(seconds_until_hour(hour, zone))
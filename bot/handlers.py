@@ -1,10 +1,14 @@
+import asyncio
 import os
-import aiohttp
-from aiogram import Router, F
+from collections import defaultdict
+from aiogram import Bot, Router, F
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError, TelegramRetryAfter
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery
 from aiogram.types import WebAppInfo
 from bot.keyboards import get_main_menu, get_report_menu, get_period_menu
+from bot.api_client import ApiClient
+from bot.reports import send_report, PERIOD_NAMES, REPORT_TIMEOUT_SECONDS
 
 router = Router()
 
@@ -75,123 +79,99 @@ async def callback_open_dashboard(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data == "report_today")
-async def callback_report_today(callback: CallbackQuery):
-    """Отчет за сегодня"""
-    await callback.message.answer(
-        "📈 Генерирую отчет за сегодня...\n"
-        "(Функционал будет доступен после создания генератора отчетов)"
-    )
+async def send_period_report(callback: CallbackQuery, api: ApiClient, period: str):
+    """PDF отчет за период (обычно уже собран заранее, см. api/report_batch.py)"""
+    await callback.message.answer(f"📈 Готовлю отчет за {PERIOD_NAMES[period]}, подождите...")
     await callback.answer()
 
+    try:
+        if not await send_report(callback.message, api, callback.from_user.id, "pdf", period):
+            await callback.message.answer(f"📭 Нет продаж за {PERIOD_NAMES[period]}")
+    except Exception as e:
+        await callback.message.answer(f"❌ Ошибка: {str(e)}")
+
+
+@router.callback_query(F.data == "report_today", flags={"single_flight": True})
+async def callback_report_today(callback: CallbackQuery, api: ApiClient):
+    """Отчет за сегодня"""
+    await send_period_report(callback, api, "today")
+
 
-@router.callback_query(F.data == "report_month")
-async def callback_report_month(callback: CallbackQuery):
+@router.callback_query(F.data == "report_month", flags={"single_flight": True})
+async def callback_report_month(callback: CallbackQuery, api: ApiClient):
     """Отчет за месяц"""
-    await callback.message.answer(
-        "📅 Генерирую отчет за месяц...\n"
-        "(Функционал будет доступен после создания генератора отчетов)"
-    )
+    await send_period_report(callback, api, "month")
+
+
+@router.callback_query(F.data == "report_period")
+async def callback_report_period(callback: CallbackQuery):
+    """Выбор периода отчета"""
+    await callback.message.edit_text("📅 Выберите период:", reply_markup=get_period_menu())
     await callback.answer()
 
 
-@router.callback_query(F.data == "demo_mode")
-async def callback_demo_mode(callback: CallbackQuery):
+@router.callback_query(F.data == "demo_mode", flags={"single_flight": True})
+async def callback_demo_mode(callback: CallbackQuery, api: ApiClient):
     """Активация демо-режима"""
     telegram_id = callback.from_user.id
     username = callback.from_user.username
     first_name = callback.from_user.first_name
 
-    api_url = os.getenv("API_URL", "http://localhost:8000")
-
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{api_url}/api/demo/{telegram_id}",
-                params={"username": username, "first_name": first_name}
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    await callback.message.answer(
-                        f"🎯 Демо-режим активирован!\n\n"
-                        f"✅ Создано {data['count']} тестовых продаж за последние 30 дней\n"
-                        f"✅ Сгенерированы случайные товары и суммы\n"
-                        f"✅ Добавлены различные статусы\n\n"
-                        f"Теперь вы можете открыть дашборд или создать отчет!"
-                    )
-                    await callback.answer("Демо-данные созданы!")
-                else:
-                    await callback.message.answer("❌ Ошибка создания демо-данных")
-                    await callback.answer()
+        response = await api.post(
+            f"/api/demo/{telegram_id}",
+            params={"username": username, "first_name": first_name},
+            timeout=REPORT_TIMEOUT_SECONDS
+        )
+        if response.status == 200:
+            data = response.json()
+            await callback.message.answer(
+                f"🎯 Демо-режим активирован!\n\n"
+                f"✅ Создано {data['count']} тестовых продаж за последние 30 дней\n"
+                f"✅ Сгенерированы случайные товары и суммы\n"
+                f"✅ Добавлены различные статусы\n\n"
+                f"Теперь вы можете открыть дашборд или создать отчет!"
+            )
+            await callback.answer("Демо-данные созданы!")
+        elif response.status == 429:
+            await callback.message.answer(
+                f"⏳ Демо-данные недавно пересоздавались, попробуйте через {response.headers.get('Retry-After', '60')} с"
+            )
+            await callback.answer()
+        else:
+            await callback.message.answer("❌ Ошибка создания демо-данных")
+            await callback.answer()
     except Exception as e:
         await callback.message.answer(f"❌ Ошибка: {str(e)}")
         await callback.answer()
 
 
-@router.callback_query(F.data == "report_pdf")
-async def callback_report_pdf(callback: CallbackQuery):
+@router.callback_query(F.data == "report_pdf", flags={"single_flight": True})
+async def callback_report_pdf(callback: CallbackQuery, api: ApiClient):
     """Генерация PDF отчета"""
     telegram_id = callback.from_user.id
-    api_url = os.getenv("API_URL", "http://localhost:8000")
 
     await callback.message.answer("📄 Генерирую PDF отчет, подождите...")
     await callback.answer()
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{api_url}/api/reports/{telegram_id}/pdf") as response:
-                if response.status == 200:
-                    # Сохраняем файл
-                    content = await response.read()
-                    file_path = f"/tmp/report_{telegram_id}.pdf"
-                    with open(file_path, 'wb') as f:
-                        f.write(content)
-
-                    # Отправляем файл пользователю
-                    document = FSInputFile(file_path)
-                    await callback.message.answer_document(
-                        document,
-                        caption="📄 Ваш PDF отчет готов!"
-                    )
-
-                    # Удаляем временный файл
-                    os.remove(file_path)
-                else:
-                    await callback.message.answer("❌ Ошибка генерации отчета. Убедитесь, что у вас есть данные.")
+        if not await send_report(callback.message, api, telegram_id, "pdf"):
+            await callback.message.answer("❌ Ошибка генерации отчета. Убедитесь, что у вас есть данные.")
     except Exception as e:
         await callback.message.answer(f"❌ Ошибка: {str(e)}")
 
 
-@router.callback_query(F.data == "report_excel")
-async def callback_report_excel(callback: CallbackQuery):
+@router.callback_query(F.data == "report_excel", flags={"single_flight": True})
+async def callback_report_excel(callback: CallbackQuery, api: ApiClient):
     """Генерация Excel отчета"""
     telegram_id = callback.from_user.id
-    api_url = os.getenv("API_URL", "http://localhost:8000")
 
     await callback.message.answer("📊 Генерирую Excel отчет, подождите...")
     await callback.answer()
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{api_url}/api/reports/{telegram_id}/excel") as response:
-                if response.status == 200:
-                    # Сохраняем файл
-                    content = await response.read()
-                    file_path = f"/tmp/report_{telegram_id}.xlsx"
-                    with open(file_path, 'wb') as f:
-                        f.write(content)
-
-                    # Отправляем файл пользователю
-                    document = FSInputFile(file_path)
-                    await callback.message.answer_document(
-                        document,
-                        caption="📊 Ваш Excel отчет готов!"
-                    )
-
-                    # Удаляем временный файл
-                    os.remove(file_path)
-                else:
-                    await callback.message.answer("❌ Ошибка генерации отчета. Убедитесь, что у вас есть данные.")
+        if not await send_report(callback.message, api, telegram_id, "excel"):
+            await callback.message.answer("❌ Ошибка генерации отчета. Убедитесь, что у вас есть данные.")
     except Exception as e:
         await callback.message.answer(f"❌ Ошибка: {str(e)}")
 
@@ -206,18 +186,63 @@ async def callback_back_main(callback: CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("period_"))
-async def callback_period(callback: CallbackQuery):
+@router.callback_query(F.data.startswith("period_"), flags={"single_flight": True})
+async def callback_period(callback: CallbackQuery, api: ApiClient):
     """Обработка выбора периода"""
     period = callback.data.split("_")[1]
-    period_names = {
-        "today": "сегодня",
-        "yesterday": "вчера",
-        "week": "неделю",
-        "month": "месяц"
-    }
-    await callback.message.answer(
-        f"Выбран период: {period_names.get(period, period)}\n"
-        "Генерирую отчет..."
-    )
-    await callback.answer()
+    if period not in PERIOD_NAMES:
+        await callback.answer()
+        return
+    await send_period_report(callback, api, period)
+
+
+# Уведомления об аномалиях в продажах (ищет API, см. api/anomalies.py)
+ANOMALY_TEXTS = {
+    ("revenue", "drop"): "📉 {day}: выручка {value:,.2f} ₽ при обычных {expected:,.2f} ₽",
+    ("revenue", "spike"): "📈 {day}: выручка {value:,.2f} ₽ при обычных {expected:,.2f} ₽",
+    ("cancellations", "spike"): "🚫 {day}: отмен {value:.0f} при обычных {expected:.0f}",
+}
+
+
+def format_anomaly_alert(alerts: list) -> str:
+    """Текст уведомления об аномалиях одного пользователя"""
+    lines = ["⚠️ Необычные дни в продажах:\n"]
+    for alert in alerts:
+        template = ANOMALY_TEXTS.get((alert["metric"], alert["kind"]), "❗ {day}: {value} при обычных {expected}")
+        lines.append(template.format(**alert).replace(",", " "))
+    lines.append("\nПодробности - в дашборде.")
+    return "\n".join(lines)
+
+
+async def send_anomaly_alerts(bot: Bot, api: ApiClient) -> int:
+    """Забрать у API неотправленные аномалии и разослать их владельцам.
+
+    Возвращает число подтвержденных уведомлений. Если Telegram просит
+    подождать, остаток уходит в следующий проход.
+    """
+    response = await api.get("/api/alerts/anomalies", internal=True)
+    if response.status != 200:
+        return 0
+    alerts = response.json()["alerts"]
+
+    by_user = defaultdict(list)
+    for alert in alerts:
+        by_user[alert["telegram_id"]].append(alert)
+
+    delivered = []
+    for telegram_id, user_alerts in by_user.items():
+        try:
+            await bot.send_message(telegram_id, format_anomaly_alert(user_alerts))
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            break
+        except TelegramForbiddenError:
+            pass  # Пользователь заблокировал бота - повторять бессмысленно
+        except TelegramAPIError:
+            continue
+        delivered.extend(alert["id"] for alert in user_alerts)
+
+    if delivered:
+        # Подтверждение идемпотентно: повтор только снова проставит notified_at
+        await api.post("/api/alerts/anomalies/ack", json={"ids": delivered}, internal=True, idempotent=True)
+    return len(delivered)
@@ -22,6 +22,9 @@ def get_report_menu() -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📄 PDF отчет", callback_data="report_pdf")],
         [InlineKeyboardButton(text="📊 Excel отчет", callback_data="report_excel")],
+        [InlineKeyboardButton(text="📈 Отчет за сегодня", callback_data="report_today")],
+        [InlineKeyboardButton(text="📅 Отчет за месяц", callback_data="report_month")],
+        [InlineKeyboardButton(text="🗓 Другой период", callback_data="report_period")],
         [InlineKeyboardButton(text="◀️ Назад", callback_data="back_main")]
     ])
     return keyboard
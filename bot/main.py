@@ -3,7 +3,10 @@ import logging
 import os
 from aiogram import Bot, Dispatcher
 from dotenv import load_dotenv
-from bot.handlers import router
+from bot.handlers import router, send_anomaly_alerts
+from bot.api_client import ApiClient
+from bot.middlewares import SingleFlightMiddleware
+from bot.broadcast import digest_loop, DIGEST_HOUR
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -15,6 +18,83 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+ALERTS_POLL_SECONDS = int(os.getenv("ALERTS_POLL_SECONDS", 60))
+BOT_LOCK_FILE = os.getenv("BOT_LOCK_FILE", "/tmp/sales_bot_background.lock")
+
+_lock_file = None
+
+
+async def alerts_loop(bot: Bot, api: ApiClient):
+    """Фоновая рассылка уведомлений об аномалиях"""
+    while True:
+        try:
+            sent = await send_anomaly_alerts(bot, api)
+            if sent:
+                logger.info(f"Отправлено уведомлений об аномалиях: {sent}")
+        except Exception as e:
+            logger.error(f"Ошибка рассылки уведомлений: {e}")
+        await asyncio.sleep(ALERTS_POLL_SECONDS)
+
+
+def acquire_background_lock() -> bool:
+    """Фоновые задачи - только в одном процессе бота на хосте.
+
+    В режиме webhook процессов несколько (воркеры, воркеры uvicorn);
+    первый, кто взял блокировку файла BOT_LOCK_FILE, рассылает
+    уведомления. Блокировка снимается ОС вместе с завершением процесса.
+    """
+    global _lock_file
+    try:
+        import fcntl
+    except ImportError:
+        return True  # нет flock (Windows) - один процесс
+    _lock_file = open(BOT_LOCK_FILE, "w")
+    try:
+        fcntl.flock(_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        _lock_file.close()
+        _lock_file = None
+        return False
+
+
+async def on_startup(bot: Bot, dispatcher: Dispatcher, api: ApiClient):
+    """Старт диспетчера: пул соединений к API и фоновые задачи"""
+    await api.start()
+    if not api.internal_key:
+        # Служебные эндпоинты уведомлений и сводок без ключа закрыты (403)
+        logger.warning("SECRET_KEY не задан: уведомления об аномалиях и сводки не рассылаются")
+    elif acquire_background_lock():
+        dispatcher["alerts_task"] = asyncio.create_task(alerts_loop(bot, api))
+        if DIGEST_HOUR:
+            dispatcher["digest_task"] = asyncio.create_task(digest_loop(bot, api))
+
+
+async def on_shutdown(dispatcher: Dispatcher, api: ApiClient):
+    """Остановка диспетчера: сначала фоновые задачи, затем пул соединений"""
+    for name in ("alerts_task", "digest_task"):
+        task = dispatcher.workflow_data.pop(name, None)
+        if task is not None:
+            task.cancel()
+    await api.close()
+
+
+def create_dispatcher() -> Dispatcher:
+    """Диспетчер с обработчиками и жизненным циклом (общий для polling и webhook)"""
+    dp = Dispatcher()
+
+    # Один пул соединений к API на весь процесс: обработчики получают его параметром api
+    dp["api"] = ApiClient()
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+
+    # Повторные нажатия тяжелых кнопок (отчеты, демо) схлопываются до обращения к API
+    dp.callback_query.middleware(SingleFlightMiddleware())
+
+    # Регистрация роутера с обработчиками
+    dp.include_router(router)
+    return dp
+
 
 async def main():
     """Главная функция запуска бота"""
@@ -26,10 +106,7 @@ async def main():
 
     # Инициализация бота и диспетчера
     bot = Bot(token=bot_token)
-    dp = Dispatcher()
-
-    # Регистрация роутера с обработчиками
-    dp.include_router(router)
+    dp = create_dispatcher()
 
     # Удаление webhook и запуск polling
     await bot.delete_webhook(drop_pending_updates=True)
@@ -43,7 +120,12 @@ async def main():
 
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        logger.info("Бот остановлен")
+    if os.getenv("WEBHOOK_URL"):
+        # Режим webhook: python -m bot.main с WEBHOOK_URL (см. bot/webhook.py)
+        from bot.webhook import run_webhook
+        run_webhook()
+    else:
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            logger.info("Бот остановлен")
@@ -0,0 +1,41 @@
+"""Промежуточные обработчики (middleware) бота"""
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery
+
+
+class SingleFlightMiddleware(BaseMiddleware):
+    """Повторные нажатия кнопки, пока идет обработка первого, не доходят до API.
+
+    Действует на обработчики с флагом single_flight; ключ - пользователь и
+    данные кнопки. Двойное нажатие "📊 Excel отчет" дает один отчет, второе
+    нажатие получает только всплывающую подсказку.
+    """
+
+    def __init__(self):
+        self.metrics: Counter = Counter()
+        self._in_flight: Set[Tuple[int, str]] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not get_flag(data, "single_flight"):
+            return await handler(event, data)
+
+        key = (event.from_user.id, event.data)
+        if key in self._in_flight:
+            self.metrics["collapsed"] += 1
+            await event.answer("⏳ Уже выполняется, подождите...")
+            return None
+
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
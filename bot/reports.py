@@ -0,0 +1,129 @@
+"""Отправка отчетов в Telegram без временных файлов.
+
+Ответ API с отчетом читается частями (STREAM_CHUNK_SIZE) прямо в
+multipart-загрузку Telegram: отчет не пишется на диск и не держится в
+памяти целиком.
+
+Отчет определяется версией данных пользователя (для отчета за период -
+еще и самим периодом). API отдает ее в ETag; после первой загрузки
+file_id документа запоминается вместе с ETag, и повторный запрос
+отчета идет с If-None-Match. Если данные не менялись, API отвечает 304
+без генерации, а бот пересылает документ по file_id - без загрузки.
+"""
+import os
+from collections import OrderedDict
+from typing import AsyncGenerator, Optional, Tuple
+
+import aiohttp
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputFile, Message
+
+from bot.api_client import ApiClient
+
+
+REPORT_TIMEOUT_SECONDS = 60
+STREAM_CHUNK_SIZE = 64 * 1024
+FILE_ID_CACHE_SIZE = int(os.getenv("REPORT_FILE_ID_CACHE_SIZE", 10000))
+
+REPORT_FORMATS = {
+    "pdf": ("sales_report.pdf", "📄 Ваш PDF отчет{period} готов!"),
+    "excel": ("sales_report.xlsx", "📊 Ваш Excel отчет{period} готов!"),
+}
+
+# Периоды отчетов (совпадают с меню get_period_menu и API)
+PERIOD_NAMES = {
+    "today": "сегодня",
+    "yesterday": "вчера",
+    "week": "неделю",
+    "month": "месяц"
+}
+
+
+class ApiStreamFile(InputFile):
+    """Тело ответа API как файл для загрузки в Telegram (читается частями)"""
+
+    def __init__(self, response: aiohttp.ClientResponse, filename: str):
+        super().__init__(filename=filename, chunk_size=STREAM_CHUNK_SIZE)
+        self.response = response
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        async for chunk in self.response.content.iter_chunked(self.chunk_size):
+            yield chunk
+
+
+ReportKey = Tuple[int, str, Optional[str]]  # telegram_id, формат, период
+
+
+class FileIdCache:
+    """file_id загруженных отчетов: (telegram_id, формат, период) -> (ETag, file_id), LRU"""
+
+    def __init__(self, max_entries: int = FILE_ID_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[ReportKey, Tuple[str, str]]" = OrderedDict()
+
+    def get(self, key: ReportKey) -> Optional[Tuple[str, str]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: ReportKey, etag: str, file_id: str):
+        self._entries[key] = (etag, file_id)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: ReportKey):
+        self._entries.pop(key, None)
+
+
+report_file_ids = FileIdCache()
+
+
+async def send_report(
+    message: Message,
+    api: ApiClient,
+    telegram_id: int,
+    report_format: str,
+    period: Optional[str] = None
+) -> bool:
+    """Отправить отчет (за всю историю или за период) в чат; False - у API нет отчета"""
+    filename, caption = REPORT_FORMATS[report_format]
+    caption = caption.format(period=f" за {PERIOD_NAMES[period]}" if period else "")
+    key = (telegram_id, report_format, period)
+    cached = report_file_ids.get(key)
+    headers = {"If-None-Match": cached[0]} if cached else None
+
+    async with api.stream(
+        f"/api/reports/{telegram_id}/{report_format}",
+        params={"period": period},
+        headers=headers,
+        timeout=REPORT_TIMEOUT_SECONDS
+    ) as response:
+        if response.status == 304 and cached:
+            try:
+                await message.answer_document(cached[1], caption=caption)
+                return True
+            except TelegramBadRequest:
+                # file_id больше не принимается - загрузим заново
+                report_file_ids.discard(key)
+                return await send_report(message, api, telegram_id, report_format, period)
+
+        if response.status == 429:
+            # Лимит отчетов в API (api/limits.py): сообщаем, когда повторить
+            retry_after = response.headers.get("Retry-After", "60")
+            await message.answer(f"⏳ Слишком много отчетов подряд, попробуйте через {retry_after} с")
+            return True
+
+        if response.status != 200:
+            return False
+
+        disposition = response.content_disposition
+        if disposition is not None and disposition.filename:
+            filename = disposition.filename
+        sent = await message.answer_document(ApiStreamFile(response, filename), caption=caption)
+        etag = response.headers.get("ETag")
+        if etag and sent.document:
+            report_file_ids.put(key, etag, sent.document.file_id)
+        return True
@@ -0,0 +1,216 @@
+"""Режим webhook: Telegram сам присылает обновления, бот масштабируется процессами.
+
+Запуск отдельно: WEBHOOK_URL=https://bot.example.com python -m bot.main
+- поднимается aiohttp-сервер на WEBHOOK_PORT с WEBHOOK_WORKERS
+процессами на одном порту (SO_REUSEPORT), перед ними может стоять
+балансировщик. Либо внутри API (api/main.py, BOT_WEBHOOK_IN_API=True):
+тот же обработчик как маршрут FastAPI.
+
+Каждый запрос проверяется по секретному токену
+(X-Telegram-Bot-Api-Secret-Token), обновление ставится в обработку и
+сразу подтверждается. Одновременно обрабатывается не больше
+WEBHOOK_CONCURRENCY обновлений на процесс; если в очереди уже
+WEBHOOK_MAX_PENDING, процесс отвечает 503 и Telegram повторит доставку
+позже - память под очередь ограничена.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import multiprocessing
+import os
+from collections import Counter
+from typing import Dict, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", 8080)))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 1))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", 64))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", 1000))
+# Параллельных соединений Telegram к webhook (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 100))
+DRAIN_TIMEOUT_SECONDS = 10
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def webhook_secret(bot_token: str) -> str:
+    """Секрет webhook: WEBHOOK_SECRET или производный от токена (одинаков во всех процессах)"""
+    return os.getenv("WEBHOOK_SECRET") or hashlib.sha256(f"webhook:{bot_token}".encode()).hexdigest()
+
+
+class WebhookProcessor:
+    """Прием обновлений webhook с проверкой секрета и ограничением параллельности"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        dispatcher: Dispatcher,
+        secret: str,
+        concurrency: int = WEBHOOK_CONCURRENCY,
+        max_pending: int = WEBHOOK_MAX_PENDING
+    ):
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.secret = secret
+        self.max_pending = max_pending
+        self.metrics: Counter = Counter()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def start(self):
+        await self.dispatcher.emit_startup(
+            bot=self.bot, dispatcher=self.dispatcher, bots=[self.bot], **self.dispatcher.workflow_data
+        )
+
+    async def close(self):
+        """Дождаться начатых обновлений и остановить диспетчер"""
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=DRAIN_TIMEOUT_SECONDS)
+        await self.dispatcher.emit_shutdown(
+            bot=self.bot, dispatcher=self.dispatcher, bots=[self.bot], **self.dispatcher.workflow_data
+        )
+        await self.bot.session.close()
+
+    def accept(self, secret: Optional[str], payload: Dict) -> int:
+        """Принять обновление; возвращает HTTP-статус ответа Telegram"""
+        if secret is None or not hmac.compare_digest(secret, self.secret):
+            self.metrics["unauthorized"] += 1
+            return 401
+        if self.pending >= self.max_pending:
+            self.metrics["rejected"] += 1
+            return 503
+        try:
+            update = Update.model_validate(payload, context={"bot": self.bot})
+        except ValueError:
+            self.metrics["invalid"] += 1
+            return 400
+
+        self.metrics["received"] += 1
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return 200
+
+    async def _process(self, update: Update):
+        async with self._semaphore:
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+                self.metrics["processed"] += 1
+            except Exception as e:
+                self.metrics["failed"] += 1
+                logger.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+
+    def metrics_snapshot(self) -> Dict[str, int]:
+        return {**self.metrics, "pending": self.pending}
+
+
+def create_processor(bot: Bot = None) -> WebhookProcessor:
+    """Обработчик webhook с диспетчером бота (bot/main.py: create_dispatcher)"""
+    from bot.main import create_dispatcher
+
+    bot = bot or Bot(token=os.environ["BOT_TOKEN"])
+    return WebhookProcessor(bot, create_dispatcher(), webhook_secret(bot.token))
+
+
+# aiohttp: отдельный сервер бота
+
+def create_webhook_app(processor: WebhookProcessor) -> web.Application:
+    async def handle_update(request: web.Request) -> web.Response:
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        return web.Response(status=processor.accept(request.headers.get(SECRET_HEADER), payload))
+
+    async def handle_health(request: web.Request) -> web.Response:
+        return web.json_response(processor.metrics_snapshot())
+
+    async def on_startup(app: web.Application):
+        await processor.start()
+
+    async def on_cleanup(app: web.Application):
+        await processor.close()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    app.router.add_get("/health", handle_health)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+# FastAPI: маршрут внутри API (api/main.py, BOT_WEBHOOK_IN_API=True)
+
+def create_webhook_router():
+    """Маршрут webhook для FastAPI; обработчик берется из app.state.webhook"""
+    from fastapi import APIRouter, Header, Request, Response
+
+    webhook_router = APIRouter()
+
+    @webhook_router.post(WEBHOOK_PATH, include_in_schema=False)
+    async def telegram_webhook(
+        request: Request,
+        secret: Optional[str] = Header(None, alias=SECRET_HEADER)
+    ):
+        try:
+            payload = await request.json()
+        except ValueError:
+            return Response(status_code=400)
+        return Response(status_code=request.app.state.webhook.accept(secret, payload))
+
+    return webhook_router
+
+
+def _serve_worker():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    app = create_webhook_app(create_processor())
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, reuse_port=WEBHOOK_WORKERS > 1, print=None)
+
+
+async def register_webhook(bot: Bot, dispatcher: Dispatcher):
+    """Сообщить Telegram адрес webhook (один раз, до запуска воркеров)"""
+    await bot.set_webhook(
+        url=os.environ["WEBHOOK_URL"].rstrip("/") + WEBHOOK_PATH,
+        secret_token=webhook_secret(bot.token),
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        max_connections=WEBHOOK_MAX_CONNECTIONS
+    )
+    await bot.session.close()
+
+
+def run_webhook():
+    """Регистрация webhook и запуск WEBHOOK_WORKERS процессов сервера"""
+    from bot.main import create_dispatcher
+
+    bot = Bot(token=os.environ["BOT_TOKEN"])
+    asyncio.run(register_webhook(bot, create_dispatcher()))
+    logger.info(f"Webhook: {WEBHOOK_WORKERS} процесс(ов) на порту {WEBHOOK_PORT}")
+
+    if WEBHOOK_WORKERS == 1:
+        _serve_worker()
+        return
+
+    workers = [multiprocessing.Process(target=_serve_worker) for _ in range(WEBHOOK_WORKERS)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
@@ -0,0 +1,155 @@
+"""Определение товарной категории по названию товара.
+
+Словарь ключевых слов (CATEGORIES_FILE, database/data/categories.json)
+компилируется в автомат Ахо-Корасик: все вхождения всех ключевых слов
+находятся за один проход по названию, независимо от размера словаря.
+Ключевое слово - начало слова (основа): "букет" находит "букеты", но
+"роза" не находит "розетка". При нескольких совпадениях побеждает самое
+длинное ключевое слово ("шампанск" точнее, чем "подар").
+
+Категория определяется один раз при создании товара (intern_products) и
+хранится в products.category, поэтому выручка по категориям - обычный
+GROUP BY по индексу. После правки словаря категории пересчитываются
+командой: python -m database.categories
+"""
+import asyncio
+import json
+import os
+import re
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from database.models import async_session, Product
+
+
+CATEGORIES_FILE = os.getenv(
+    "CATEGORIES_FILE",
+    os.path.join(os.path.dirname(__file__), "data", "categories.json")
+)
+RECLASSIFY_BATCH_SIZE = 5000
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр, ё -> е, любые разделители -> один пробел"""
+    return _NON_WORD.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+class KeywordAutomaton:
+    """Автомат Ахо-Корасик над ключевыми словами категорий"""
+
+    def __init__(self, keywords: Dict[str, str]):
+        # Состояние - узел бора: переходы, суффиксная ссылка, найденные слова
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, str]]] = [[]]
+
+        for keyword, category in keywords.items():
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append((len(keyword), category))
+
+        # Суффиксные ссылки обходом в ширину
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Все вхождения ключевых слов: (начало, длина, категория)"""
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, category in self._output[state]:
+                yield position - length + 1, length, category
+
+
+class CategoryClassifier:
+    """Категория товара по названию"""
+
+    def __init__(self, categories: Dict[str, Iterable[str]]):
+        keywords = {}
+        for category, words in categories.items():
+            for word in words:
+                keywords.setdefault(normalize(word), category)
+        self._automaton = KeywordAutomaton(keywords)
+
+    @classmethod
+    def load(cls, path: str = CATEGORIES_FILE) -> "CategoryClassifier":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["categories"])
+
+    def classify(self, name: str) -> Optional[str]:
+        """Категория по самому длинному ключевому слову с начала слова; None - не найдена"""
+        text = normalize(name)
+        best, best_length = None, 0
+        for start, length, category in self._automaton.find(text):
+            if length > best_length and (start == 0 or text[start - 1] == " "):
+                best, best_length = category, length
+        return best
+
+    def classify_many(self, names: Iterable[str]) -> Dict[str, Optional[str]]:
+        return {name: self.classify(name) for name in names}
+
+
+_classifier: Optional[CategoryClassifier] = None
+
+
+def get_classifier() -> CategoryClassifier:
+    """Классификатор по словарю из CATEGORIES_FILE (компилируется при первом вызове)"""
+    global _classifier
+    if _classifier is None:
+        _classifier = CategoryClassifier.load()
+    return _classifier
+
+
+async def reclassify_products() -> int:
+    """Пересчитать категории всех товаров по текущему словарю; возвращает число изменений"""
+    classifier = get_classifier()
+    changed = 0
+    last_id = 0
+    async with async_session() as session:
+        while True:
+            rows = (await session.execute(
+                select(Product.id, Product.name, Product.category)
+                .where(Product.id > last_id)
+                .order_by(Product.id)
+                .limit(RECLASSIFY_BATCH_SIZE)
+            )).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            updates = []
+            for row in rows:
+                category = classifier.classify(row.name)
+                if category != row.category:
+                    updates.append({"id": row.id, "category": category})
+            if updates:
+                await session.execute(update(Product), updates)
+                await session.commit()
+                changed += len(updates)
+    return changed
+
+
+if __name__ == "__main__":
+    print(f"✅ Категории обновлены у {asyncio.run(reclassify_products())} товаров")
@@ -0,0 +1,164 @@
+"""Горячий кэш последних продаж активных пользователей.
+
+Продажи пользователя за последние HOT_WINDOW_DAYS дней хранятся в
+процессе в виде колонок NumPy (время, сумма строки, количество, код
+статуса, товар) вместо ORM-объектов: ~25 байт на продажу. Статистика,
+дневной график и топ товаров за окно считаются векторно без обращения
+к БД.
+
+Кэш ограничен по памяти (HOT_CACHE_MAX_BYTES) и вытесняет давно не
+использованных пользователей (LRU). Записи живут не дольше
+HOT_CACHE_TTL_SECONDS: так ограничено окно устаревания, если продажи
+записал другой процесс. Запись продаж сбрасывает кэш пользователя
+(invalidate), и колонки перечитываются из БД при следующем запросе.
+"""
+import os
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Sale
+
+
+HOT_WINDOW_DAYS = 30
+HOT_CACHE_MAX_BYTES = int(os.getenv("HOT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+HOT_CACHE_TTL_SECONDS = int(os.getenv("HOT_CACHE_TTL_SECONDS", 300))
+
+STATUS_CODES = {"completed": 0, "pending": 1, "cancelled": 2}
+_OTHER_STATUS = 3
+
+_SECONDS_PER_DAY = 86400
+_EPOCH = datetime(1970, 1, 1)
+
+
+class UserColumns:
+    """Колонки продаж одного пользователя за окно"""
+
+    def __init__(self, rows: List[tuple], loaded_since: datetime):
+        self.loaded_since = loaded_since
+        self.loaded_at = time.monotonic()
+        self._set(rows)
+
+    def _set(self, rows: List[tuple]):
+        count = len(rows)
+        self.timestamp = np.fromiter(
+            ((row[0] - _EPOCH).total_seconds() for row in rows), dtype=np.int64, count=count
+        )
+        self.line_total = np.fromiter((row[1] for row in rows), dtype=np.int64, count=count)
+        self.quantity = np.fromiter((row[2] for row in rows), dtype=np.int32, count=count)
+        self.status = np.fromiter(
+            (STATUS_CODES.get(row[3], _OTHER_STATUS) for row in rows), dtype=np.int8, count=count
+        )
+        self.product_id = np.fromiter((row[4] for row in rows), dtype=np.int32, count=count)
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.timestamp.nbytes + self.line_total.nbytes + self.quantity.nbytes
+            + self.status.nbytes + self.product_id.nbytes
+        )
+
+    def covers(self, since: datetime) -> bool:
+        """Есть ли в кэше все продажи начиная с since"""
+        fresh = time.monotonic() - self.loaded_at < HOT_CACHE_TTL_SECONDS
+        return fresh and since >= self.loaded_since
+
+    def _since_mask(self, since: datetime) -> np.ndarray:
+        return self.timestamp >= int((since - _EPOCH).total_seconds())
+
+    def stats(self, since: datetime) -> Dict[str, int]:
+        """Агрегаты для build_stats за период с since"""
+        mask = self._since_mask(since)
+        status = self.status[mask]
+        counts = np.bincount(status, minlength=_OTHER_STATUS + 1)
+        return {
+            'total_kopecks': int(self.line_total[mask].sum()),
+            'total_sales': int(len(status)),
+            'completed_sales': int(counts[STATUS_CODES["completed"]]),
+            'pending_sales': int(counts[STATUS_CODES["pending"]]),
+            'cancelled_sales': int(counts[STATUS_CODES["cancelled"]]),
+        }
+
+    def daily_revenue(self, date_from: date, days: int) -> np.ndarray:
+        """Выручка завершенных продаж по дням UTC, в копейках"""
+        first_day = (date_from - _EPOCH.date()).days
+        day_index = self.timestamp // _SECONDS_PER_DAY - first_day
+        mask = (self.status == STATUS_CODES["completed"]) & (day_index >= 0) & (day_index < days)
+        return np.bincount(day_index[mask], weights=self.line_total[mask], minlength=days).astype(np.int64)
+
+    def top_products(self, since: datetime, limit: int) -> List[tuple]:
+        """[(product_id, выручка, количество, продаж)] завершенных продаж"""
+        mask = self._since_mask(since) & (self.status == STATUS_CODES["completed"])
+        if not mask.any():
+            return []
+        products, inverse = np.unique(self.product_id[mask], return_inverse=True)
+        revenue = np.bincount(inverse, weights=self.line_total[mask]).astype(np.int64)
+        quantity = np.bincount(inverse, weights=self.quantity[mask]).astype(np.int64)
+        sales_count = np.bincount(inverse)
+        order = np.argsort(-revenue, kind="stable")[:limit]
+        return [
+            (int(products[i]), int(revenue[i]), int(quantity[i]), int(sales_count[i]))
+            for i in order
+        ]
+
+
+class HotSalesCache:
+    """LRU-кэш колонок продаж с ограничением по памяти"""
+
+    def __init__(self, max_bytes: int = HOT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._users: "OrderedDict[int, UserColumns]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, session: AsyncSession, user_id: int, since: datetime) -> Optional[UserColumns]:
+        """Колонки пользователя, покрывающие период с since.
+
+        Если since раньше окна кэша, возвращается None и запрос должен
+        идти в БД.
+        """
+        columns = self._users.get(user_id)
+        if columns is not None and columns.covers(since):
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return columns
+
+        window_start = datetime.utcnow() - timedelta(days=HOT_WINDOW_DAYS + 1)
+        if since < window_start:
+            return None
+
+        self.misses += 1
+        result = await session.execute(
+            select(Sale.date, Sale.line_total, Sale.quantity, Sale.status, Sale.product_id)
+            .where(Sale.user_id == user_id)
+            .where(Sale.date >= window_start)
+        )
+        columns = UserColumns(result.all(), window_start)
+        self._store(user_id, columns)
+        return columns
+
+    def invalidate(self, user_id: int):
+        """Сбросить кэш пользователя (после удаления или изменения продаж)"""
+        columns = self._users.pop(user_id, None)
+        if columns is not None:
+            self._bytes -= columns.nbytes
+
+    def _store(self, user_id: int, columns: UserColumns):
+        self.invalidate(user_id)
+        self._users[user_id] = columns
+        self._bytes += columns.nbytes
+        self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._users) > 1:
+            _, columns = self._users.popitem(last=False)
+            self._bytes -= columns.nbytes
+
+
+hot_cache = HotSalesCache()
@@ -0,0 +1,294 @@
+"""Миграции схемы для уже существующих баз данных.
+
+`Base.metadata.create_all` создает только отсутствующие таблицы, поэтому
+изменения существующих таблиц выполняются здесь. Каждая миграция
+идемпотентна: сама проверяет, нужна ли она, по текущей схеме.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+
+def _columns(conn: Connection, table: str) -> set:
+    """Имена колонок таблицы"""
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def _indexes(conn: Connection, table: str) -> set:
+    """Имена индексов таблицы"""
+    return {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+def migrate_money_to_kopecks(conn: Connection):
+    """Перевод sales.amount (Float, рубли) в целые копейки + line_total"""
+    columns = _columns(conn, "sales")
+    if "amount" not in columns:
+        return
+
+    if "amount_kopecks" not in columns:
+        conn.execute(text("ALTER TABLE sales ADD COLUMN amount_kopecks BIGINT"))
+    if "line_total" not in columns:
+        conn.execute(text("ALTER TABLE sales ADD COLUMN line_total BIGINT"))
+
+    conn.execute(text(
+        "UPDATE sales SET "
+        "amount_kopecks = CAST(ROUND(amount * 100) AS BIGINT), "
+        "quantity = COALESCE(quantity, 1)"
+    ))
+    conn.execute(text("UPDATE sales SET line_total = amount_kopecks * quantity"))
+    conn.execute(text("ALTER TABLE sales DROP COLUMN amount"))
+
+
+def migrate_product_names_to_catalog(conn: Connection):
+    """Перенос sales.product_name в справочник products + sales.product_id"""
+    columns = _columns(conn, "sales")
+    if "product_name" not in columns:
+        return
+
+    conn.execute(text(
+        "INSERT INTO products (user_id, name) "
+        "SELECT DISTINCT user_id, product_name FROM sales s "
+        "WHERE NOT EXISTS ("
+        "SELECT 1 FROM products p WHERE p.user_id = s.user_id AND p.name = s.product_name"
+        ")"
+    ))
+    if "product_id" not in columns:
+        conn.execute(text("ALTER TABLE sales ADD COLUMN product_id INTEGER REFERENCES products(id)"))
+    conn.execute(text(
+        "UPDATE sales SET product_id = ("
+        "SELECT p.id FROM products p "
+        "WHERE p.user_id = sales.user_id AND p.name = sales.product_name"
+        ")"
+    ))
+    conn.execute(text("ALTER TABLE sales DROP COLUMN product_name"))
+
+
+def add_user_data_version(conn: Connection):
+    """users.data_version для инвалидации кэшей производных данных"""
+    if "data_version" not in _columns(conn, "users"):
+        conn.execute(text("ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0"))
+
+
+def backfill_check_size_sketches(conn: Connection):
+    """Построение дневных скетчей чеков для продаж, записанных до их появления"""
+    import pandas as pd
+    from database.models import CheckSizeSketch
+    from database.sketches import QuantileSketch
+
+    if conn.execute(text("SELECT 1 FROM check_size_sketches LIMIT 1")).first():
+        return
+
+    frame = pd.DataFrame(
+        conn.execute(text(
+            "SELECT user_id, date, line_total FROM sales WHERE status = 'completed'"
+        )).all(),
+        columns=["user_id", "date", "line_total"]
+    )
+    if frame.empty:
+        return
+
+    frame["day"] = pd.to_datetime(frame["date"]).dt.date
+    rows = []
+    for (user_id, day), group in frame.groupby(["user_id", "day"]):
+        sketch = QuantileSketch()
+        sketch.add(group["line_total"].to_numpy())
+        rows.append({"user_id": int(user_id), "day": day, "data": sketch.to_bytes()})
+
+    conn.execute(CheckSizeSketch.__table__.insert(), rows)
+
+
+def backfill_product_sketches(conn: Connection):
+    """Построение скетчей топа товаров для продаж, записанных до их появления"""
+    import pandas as pd
+    from database.models import ProductSketch
+    from database.sketches import TopKSketch
+
+    if conn.execute(text("SELECT 1 FROM product_sketches LIMIT 1")).first():
+        return
+
+    frame = pd.DataFrame(
+        conn.execute(text(
+            "SELECT user_id, product_id, date, line_total, quantity FROM sales WHERE status = 'completed'"
+        )).all(),
+        columns=["user_id", "product_id", "date", "line_total", "quantity"]
+    )
+    if frame.empty:
+        return
+
+    frame["day"] = pd.to_datetime(frame["date"]).dt.date
+    totals = frame.groupby(["user_id", "day", "product_id"]).agg(
+        revenue=("line_total", "sum"),
+        quantity=("quantity", "sum"),
+        sales_count=("line_total", "size")
+    )
+    all_time = totals.groupby(level=["user_id", "product_id"]).sum()
+
+    rows = []
+    for (user_id, day), group in totals.groupby(level=["user_id", "day"]):
+        sketch = TopKSketch()
+        for (_, _, product_id), row in group.iterrows():
+            sketch.add(int(product_id), int(row.revenue), int(row.quantity), int(row.sales_count))
+        rows.append({"user_id": int(user_id), "day": day, "data": sketch.to_bytes()})
+    for user_id, group in all_time.groupby(level="user_id"):
+        sketch = TopKSketch()
+        for (_, product_id), row in group.iterrows():
+            sketch.add(int(product_id), int(row.revenue), int(row.quantity), int(row.sales_count))
+        rows.append({"user_id": int(user_id), "day": None, "data": sketch.to_bytes()})
+
+    conn.execute(ProductSketch.__table__.insert(), rows)
+
+
+def drop_date_keyed_holiday_uplifts(conn: Connection):
+    """Оценки роста к праздникам по ключу MM-DD заменены ключом id праздника.
+
+    Старые строки удаляются: оценки пересчитываются из истории продаж при
+    первом запросе.
+    """
+    if "holiday_uplifts" in inspect(conn).get_table_names():
+        conn.execute(text("DELETE FROM holiday_uplifts WHERE holiday LIKE '__-__'"))
+
+
+def add_product_categories(conn: Connection):
+    """products.category с разметкой по словарю товаров без категории.
+
+    Размечаются все товары с category IS NULL, а не только при добавлении
+    колонки: таблицу products с колонкой могла создать create_all, а
+    migrate_product_names_to_catalog заполняет ее без категорий. Товары,
+    которых нет в словаре, проверяются заново при каждом старте.
+    """
+    from database.categories import get_classifier
+
+    if "category" not in _columns(conn, "products"):
+        conn.execute(text("ALTER TABLE products ADD COLUMN category VARCHAR"))
+    classifier = get_classifier()
+    updates = [
+        {"id": product_id, "category": classifier.classify(name)}
+        for product_id, name in conn.execute(text("SELECT id, name FROM products WHERE category IS NULL"))
+    ]
+    updates = [row for row in updates if row["category"] is not None]
+    if updates:
+        conn.execute(text("UPDATE products SET category = :category WHERE id = :id"), updates)
+
+
+def create_product_search_index(conn: Connection):
+    """Полнотекстовый индекс названий товаров (см. api/search.py).
+
+    SQLite: contentless-таблица FTS5 products_fts (название + токен
+    владельца u<user_id>), синхронизируется триггерами на products.
+    PostgreSQL: вычисляемая колонка products.search_vector с GIN-индексом.
+    ё заменяется на е и при индексации, и в запросе.
+    """
+    if conn.dialect.name == "postgresql":
+        if "search_vector" not in _columns(conn, "products"):
+            conn.execute(text(
+                "ALTER TABLE products ADD COLUMN search_vector tsvector "
+                "GENERATED ALWAYS AS (to_tsvector('simple', replace(lower(name), 'ё', 'е'))) STORED"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING gin (search_vector)"
+            ))
+        return
+
+    if "products_fts" in inspect(conn).get_table_names():
+        return
+
+    name = "replace(replace({row}.name, 'ё', 'е'), 'Ё', 'Е')"
+    owner = "'u' || {row}.user_id"
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE products_fts USING fts5("
+        "name, owner, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN "
+        f"INSERT INTO products_fts(rowid, name, owner) VALUES (new.id, {name.format(row='new')}, {owner.format(row='new')}); "
+        "END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, name, owner) "
+        f"VALUES ('delete', old.id, {name.format(row='old')}, {owner.format(row='old')}); "
+        "END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER products_fts_update AFTER UPDATE OF name, user_id ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, name, owner) "
+        f"VALUES ('delete', old.id, {name.format(row='old')}, {owner.format(row='old')}); "
+        f"INSERT INTO products_fts(rowid, name, owner) VALUES (new.id, {name.format(row='new')}, {owner.format(row='new')}); "
+        "END"
+    ))
+    conn.execute(text(
+        "INSERT INTO products_fts(rowid, name, owner) "
+        f"SELECT id, {name.format(row='products')}, {owner.format(row='products')} FROM products"
+    ))
+
+
+def create_missing_indexes(conn: Connection):
+    """Создание индексов, добавленных в модели после создания таблиц"""
+    from database.models import Base
+
+    for table in Base.metadata.sorted_tables:
+        existing = _indexes(conn, table.name)
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+
+
+def add_user_delete_cascade(conn: Connection):
+    """ON DELETE CASCADE у внешних ключей на users и products (PostgreSQL).
+
+    В SQLite ограничение нельзя изменить без пересборки таблицы: в базах,
+    созданных раньше, ключи остаются без каскада, и api/retention.py
+    удаляет зависимые строки сам.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    from database.models import Base
+
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        for foreign_key in inspector.get_foreign_keys(table.name):
+            if foreign_key["referred_table"] not in ("users", "products"):
+                continue
+            if (foreign_key["options"].get("ondelete") or "").upper() == "CASCADE":
+                continue
+            name = foreign_key["name"]
+            columns = ", ".join(foreign_key["constrained_columns"])
+            referred = ", ".join(foreign_key["referred_columns"])
+            conn.execute(text(
+                f"ALTER TABLE {table.name} DROP CONSTRAINT {name}, "
+                f"ADD CONSTRAINT {name} FOREIGN KEY ({columns}) "
+                f"REFERENCES {foreign_key['referred_table']} ({referred}) ON DELETE CASCADE"
+            ))
+
+
+def drop_redundant_sales_indexes(conn: Connection):
+    """Удаление индексов sales, которые покрыты другими.
+
+    ix_sales_id дублирует первичный ключ, ix_sales_user_status_product -
+    подмножество колонок ix_sales_user_product_date.
+    """
+    existing = _indexes(conn, "sales")
+    for name in ("ix_sales_id", "ix_sales_user_status_product"):
+        if name in existing:
+            conn.execute(text(f"DROP INDEX {name}"))
+
+
+# Порядок важен: миграции применяются последовательно
+MIGRATIONS = [
+    migrate_money_to_kopecks,
+    migrate_product_names_to_catalog,
+    add_user_data_version,
+    backfill_check_size_sketches,
+    backfill_product_sketches,
+    drop_date_keyed_holiday_uplifts,
+    add_product_categories,
+    create_product_search_index,
+    create_missing_indexes,
+    add_user_delete_cascade,
+    drop_redundant_sales_indexes,
+]
+
+
+def run_migrations(conn: Connection):
+    """Применение всех необходимых миграций"""
+    for migration in MIGRATIONS:
+        migration(conn)
@@ -1,10 +1,25 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey
+from typing import Optional
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Date, Boolean, Float, LargeBinary, ForeignKey, Index, UniqueConstraint, event, update, insert, select
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, relationship
 import os
 
 
+# Денежные суммы храним в копейках (целые числа), наружу отдаем рубли
+KOPECKS_PER_RUBLE = 100
+
+
+def to_kopecks(rubles: float) -> int:
+    """Перевод рублей в копейки с округлением до ближайшей копейки"""
+    return int(round(rubles * KOPECKS_PER_RUBLE))
+
+
+def to_rubles(kopecks: int) -> float:
+    """Перевод копеек в рубли"""
+    return round((kopecks or 0) / KOPECKS_PER_RUBLE, 2)
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -19,26 +34,271 @@ class User(Base):
     first_name = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_demo = Column(Boolean, default=False)
+    # Увеличивается при каждом изменении продаж; ключ для кэшей производных данных
+    data_version = Column(Integer, default=0, nullable=False, server_default="0")
+
+    # Связь с продажами; при удалении пользователя строки удаляет сама БД
+    # (ON DELETE CASCADE), ORM не загружает их в память
+    sales = relationship("Sale", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+
+    # Каталог товаров пользователя
+    products = relationship("Product", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+
+    # id удаленных пользователей не выдаются заново (в SQLite без AUTOINCREMENT
+    # выдаются): кэши по user_id в других процессах не достанутся новому пользователю
+    __table_args__ = {"sqlite_autoincrement": True}
 
-    # Связь с продажами
-    sales = relationship("Sale", back_populates="user", cascade="all, delete-orphan")
+
+class Product(Base):
+    """Справочник товаров (отдельный каталог у каждого пользователя)"""
+    __tablename__ = "products"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String, nullable=False)
+    # Товарная категория по словарю ключевых слов (database/categories.py); NULL - не определена
+    category = Column(String, nullable=True)
+
+    user = relationship("User", back_populates="products")
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "name", name="uq_products_user_name"),
+        Index("ix_products_user_category", "user_id", "category"),
+    )
 
 
 class Sale(Base):
     """Модель продажи"""
     __tablename__ = "sales"
 
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    product_name = Column(String, nullable=False)
-    amount = Column(Float, nullable=False)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    amount_kopecks = Column(BigInteger, nullable=False)  # цена за единицу в копейках
     quantity = Column(Integer, default=1)
+    line_total = Column(BigInteger, nullable=False)  # amount_kopecks * quantity, поддерживается при записи
     date = Column(DateTime, default=datetime.utcnow)
     status = Column(String, default="completed")  # completed, pending, cancelled
 
     # Связь с пользователем
     user = relationship("User", back_populates="sales")
 
+    # Название товара подгружается тем же запросом, что и продажа
+    product = relationship("Product", lazy="joined")
+
+    # Покрывающие индексы для агрегатов: статистика, графики и выручка
+    # считаются по индексу без обращения к строкам таблицы. Выручка по
+    # товарам (группировка по product_id) идет по ix_sales_user_product_date
+    __table_args__ = (
+        Index("ix_sales_user_status_date", "user_id", "status", "date", "line_total", "quantity"),
+        # Для выборок за период по всем статусам (сравнение периодов, отчеты за период)
+        Index("ix_sales_user_date_cover", "user_id", "date", "status", "product_id", "line_total", "quantity"),
+        # Продажи выбранных товаров без обращения к таблице (поиск по названию, api/search.py)
+        Index(
+            "ix_sales_user_product_date",
+            "user_id", "product_id", "date", "id", "status", "line_total", "quantity"
+        ),
+        # Проверка внешнего ключа при удалении товаров (каскад от пользователя)
+        Index("ix_sales_product", "product_id"),
+    )
+
+    @property
+    def product_name(self) -> str:
+        """Название товара из справочника"""
+        return self.product.name
+
+    @property
+    def amount(self) -> float:
+        """Цена за единицу в рублях"""
+        return to_rubles(self.amount_kopecks)
+
+    @property
+    def total(self) -> float:
+        """Сумма строки в рублях"""
+        return to_rubles(self.line_total)
+
+
+class CheckSizeSketch(Base):
+    """Дневной скетч распределения чеков пользователя (см. database/sketches.py)"""
+    __tablename__ = "check_size_sketches"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)  # дата UTC
+    data = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", name="uq_check_size_sketches_user_day"),
+    )
+
+
+class ProductSketch(Base):
+    """Скетч топа товаров за день; day = NULL - за всю историю (см. database/sketches.py)"""
+    __tablename__ = "product_sketches"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=True)  # дата UTC
+    data = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        Index("ix_product_sketches_user_day", "user_id", "day"),
+    )
+
+
+class HolidayUplift(Base):
+    """Сглаженный рост выручки пользователя вокруг праздника (см. api/holiday_forecast.py)"""
+    __tablename__ = "holiday_uplifts"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    holiday = Column(String, nullable=False)  # id праздника из api/data/holidays.json
+    uplift = Column(Float, nullable=True)  # рост в процентах к базовому уровню; NULL - нет данных
+    observations = Column(Integer, nullable=False, default=0)
+    last_year = Column(Integer, nullable=False)  # последний учтенный год
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "holiday", name="uq_holiday_uplifts_user_holiday"),
+    )
+
+
+class RevenueForecastState(Base):
+    """Состояние модели прогноза дневной выручки пользователя (см. api/forecasting.py)"""
+    __tablename__ = "revenue_forecast_states"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, unique=True)
+    alpha = Column(Float, nullable=False)
+    beta = Column(Float, nullable=False)
+    gamma = Column(Float, nullable=False)
+    level = Column(Float, nullable=False)  # копейки в день
+    trend = Column(Float, nullable=False)
+    season = Column(LargeBinary, nullable=False)  # сезонные компоненты, float64
+    sse = Column(Float, nullable=False)  # сумма квадратов ошибок прогноза на шаг
+    observations = Column(Integer, nullable=False)
+    last_day = Column(Date, nullable=False)  # последний учтенный день (UTC)
+
+
+class SalesAnomaly(Base):
+    """Аномальный день в продажах пользователя (см. api/anomalies.py)"""
+    __tablename__ = "sales_anomalies"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Date, nullable=False)  # дата UTC
+    metric = Column(String, nullable=False)  # revenue, cancellations
+    kind = Column(String, nullable=False)  # drop, spike
+    value = Column(Float, nullable=False)  # выручка в копейках или число отмен
+    expected = Column(Float, nullable=False)  # медиана за предыдущие дни
+    score = Column(Float, nullable=False)  # робастный z-score
+    created_at = Column(DateTime, default=datetime.utcnow)
+    notified_at = Column(DateTime, nullable=True)  # когда бот отправил уведомление
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", "metric", name="uq_sales_anomalies_user_day_metric"),
+        Index("ix_sales_anomalies_notified", "notified_at", "id"),
+    )
+
+
+class SalesEvent(Base):
+    """Изменение продаж пользователя (outbox для живого дашборда, см. api/live.py)"""
+    __tablename__ = "sales_events"
+
+    id = Column(Integer, primary_key=True)  # номер события, Last-Event-ID в SSE
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    data_version = Column(Integer, nullable=False)
+    # Самая ранняя дата измененных продаж; NULL - продажи заменены целиком
+    since = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class RateLimitBucket(Base):
+    """Состояние ограничителя частоты, общее для воркеров API (см. api/limits.py)"""
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String(64), primary_key=True)  # "класс маршрута:telegram_id"
+    tat = Column(Float, nullable=False)  # время (unix) следующего запроса без ожидания
+
+
+class PeriodReport(Base):
+    """Готовый отчет за период (собирается заранее, см. api/report_batch.py)"""
+    __tablename__ = "period_reports"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    period = Column(String(16), nullable=False)  # today, yesterday, week, month
+    format = Column(String(8), nullable=False)  # pdf, excel
+    tz = Column(String(64), nullable=False)
+    date_from = Column(Date, nullable=False)  # первый день периода (локальная дата)
+    data_version = Column(Integer, nullable=False)  # версия данных пользователя при сборке
+    content = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "period", "format", "tz", name="uq_period_reports_user_period"),
+    )
+
+
+class DigestRun(Base):
+    """Рассылка утренних сводок за день: контрольная точка для продолжения после сбоя"""
+    __tablename__ = "digest_runs"
+
+    day = Column(Date, primary_key=True)  # день, за который сводка
+    last_user_id = Column(Integer, default=0, nullable=False)  # страницы до него отправлены
+    sent = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    blocked = Column(Integer, default=0, nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class UserSalesTotals(Base):
+    """Итоги продаж пользователя за всю историю на версию данных (см. api/admin_stats.py)"""
+    __tablename__ = "user_sales_totals"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    data_version = Column(Integer, nullable=False)  # users.data_version на момент подсчета
+    total_kopecks = Column(BigInteger, nullable=False)
+    total_sales = Column(Integer, nullable=False)
+    completed_sales = Column(Integer, nullable=False)
+    pending_sales = Column(Integer, nullable=False)
+    cancelled_sales = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        # Рейтинг пользователей по выручке без сортировки всей таблицы
+        Index("ix_user_sales_totals_total", "total_kopecks"),
+    )
+
+
+@event.listens_for(Sale, "before_insert")
+@event.listens_for(Sale, "before_update")
+def _update_line_total(mapper, connection, target):
+    """Пересчет line_total при любой записи продажи через ORM"""
+    if target.quantity is None:
+        target.quantity = 1
+    target.line_total = target.amount_kopecks * target.quantity
+
+
+async def bump_data_version(session: AsyncSession, user_id: int, since: Optional[datetime] = None):
+    """Отметить изменение продаж пользователя (инвалидирует кэши производных данных).
+
+    В той же транзакции пишется событие в sales_events: since - самая
+    ранняя дата затронутых продаж (None - изменилось все).
+    """
+    await session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(data_version=User.data_version + 1)
+    )
+    await session.execute(
+        insert(SalesEvent).values(
+            user_id=user_id,
+            data_version=select(User.data_version).where(User.id == user_id).scalar_subquery(),
+            since=since,
+            created_at=datetime.utcnow()
+        )
+    )
+
 
 # Настройка базы данных
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./app.db")
@@ -48,6 +308,15 @@ engine = create_async_engine(
     echo=True if os.getenv("DEBUG") == "True" else False
 )
 
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+        """SQLite проверяет внешние ключи и выполняет ON DELETE CASCADE только с этой настройкой"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
 async_session = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -57,8 +326,11 @@ async_session = async_sessionmaker(
 
 async def init_db():
     """Инициализация базы данных"""
+    from database.migrations import run_migrations
+
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
 
 
 async def get_session() -> AsyncSession:
@@ -0,0 +1,91 @@
+from typing import Dict, Iterable, Tuple
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database.categories import get_classifier
+from database.models import Product
+
+
+# Кэш справочника товаров: (user_id, название) -> product_id.
+# Товары не переименовываются, поэтому запись кэша остается верной,
+# пока жив пользователь (см. forget_user_products). Об удалении пользователя
+# в другом процессе кэш узнает по ошибке внешнего ключа (database/seed.py)
+_product_ids: Dict[Tuple[int, str], int] = {}
+
+# Ограничение размера кэша, чтобы процесс не рос бесконечно
+PRODUCT_CACHE_MAX_SIZE = 100_000
+
+# Найденные и созданные в транзакции id ждут в session.info до ее фиксации
+_PENDING_KEY = "pending_product_ids"
+
+
+async def intern_products(session: AsyncSession, user_id: int, names: Iterable[str]) -> Dict[str, int]:
+    """Получить id товаров по названиям, создавая отсутствующие в справочнике.
+
+    Известные названия берутся из кэша без обращения к БД, остальные
+    разрешаются одним SELECT и одной пачкой INSERT; категория новых
+    товаров определяется по названию здесь же. Найденные и новые id
+    попадают в кэш только после фиксации транзакции: при откате id,
+    которых нет в БД, в кэше не останутся.
+    """
+    ids = {}
+    missing = set()
+    for name in names:
+        product_id = _product_ids.get((user_id, name))
+        if product_id is None:
+            missing.add(name)
+        else:
+            ids[name] = product_id
+
+    if not missing:
+        return ids
+
+    result = await session.execute(
+        select(Product.id, Product.name)
+        .where(Product.user_id == user_id)
+        .where(Product.name.in_(missing))
+    )
+    for product_id, name in result:
+        ids[name] = product_id
+        missing.discard(name)
+
+    if missing:
+        categories = get_classifier().classify_many(missing)
+        new_products = [
+            Product(user_id=user_id, name=name, category=categories[name])
+            for name in missing
+        ]
+        session.add_all(new_products)
+        await session.flush()
+        for product in new_products:
+            ids[product.name] = product.id
+
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for name, product_id in ids.items():
+        pending[(user_id, name)] = product_id
+
+    return ids
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_committed_products(session: Session):
+    """Транзакция зафиксирована - id ее товаров можно кэшировать"""
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    if len(_product_ids) + len(pending) > PRODUCT_CACHE_MAX_SIZE:
+        _product_ids.clear()
+    _product_ids.update(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_uncommitted_products(session: Session):
+    """Откат: созданных в транзакции товаров в БД нет"""
+    session.info.pop(_PENDING_KEY, None)
+
+
+def forget_user_products(user_id: int):
+    """Сбросить кэш товаров пользователя (после удаления его каталога)"""
+    for key in [key for key in _product_ids if key[0] == user_id]:
+        del _product_ids[key]
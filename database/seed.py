@@ -1,8 +1,13 @@
 import asyncio
 import random
 from datetime import datetime, timedelta
-from sqlalchemy import select
-from database.models import init_db, async_session, User, Sale
+from typing import Dict, List
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from database.models import init_db, async_session, User, Sale, HolidayUplift, RevenueForecastState, to_kopecks, bump_data_version
+from database.products import intern_products, forget_user_products
+from database.sketches import record_sales, clear_sketches
+from database.hot_cache import hot_cache
 
 
 # Список товаров для демо-данных
@@ -29,6 +34,56 @@ STATUSES = ["completed", "pending", "cancelled"]
 STATUS_WEIGHTS = [0.75, 0.15, 0.10]  # 75% completed, 15% pending, 10% cancelled
 
 
+def generate_demo_sales(user_id: int, product_ids: Dict[str, int]) -> List[Sale]:
+    """50 случайных продаж за последние 30 дней (product_ids - id товаров по названию)"""
+    sales = []
+    for _ in range(50):
+        # Случайная дата за последние 30 дней
+        days_ago = random.randint(0, 30)
+        sale_date = datetime.utcnow() - timedelta(days=days_ago)
+
+        # Случайный товар
+        product = random.choice(DEMO_PRODUCTS)
+
+        # Случайная цена в зависимости от товара
+        base_prices = {
+            "Ноутбук MacBook Pro": 150000,
+            "Смартфон iPhone 15": 90000,
+            "Планшет iPad Air": 60000,
+            "Наушники AirPods Pro": 25000,
+            "Умные часы Apple Watch": 35000,
+            "Клавиатура Magic Keyboard": 12000,
+            "Мышь MX Master 3": 8000,
+            "Монитор LG UltraWide": 45000,
+            "Веб-камера Logitech": 15000,
+            "Микрофон Blue Yeti": 18000,
+            "SSD накопитель Samsung": 10000,
+            "Внешний HDD Seagate": 6000,
+            "Роутер Wi-Fi 6": 8000,
+            "Принтер HP LaserJet": 20000,
+            "Графический планшет Wacom": 30000
+        }
+        base_price = base_prices.get(product, 10000)
+        amount = base_price * random.uniform(0.9, 1.1)  # ±10% от базовой цены
+
+        # Случайное количество (обычно 1, иногда больше)
+        quantity = random.choices([1, 2, 3], weights=[0.8, 0.15, 0.05])[0]
+
+        # Случайный статус
+        status = random.choices(STATUSES, weights=STATUS_WEIGHTS)[0]
+
+        sale = Sale(
+            user_id=user_id,
+            product_id=product_ids[product],
+            amount_kopecks=to_kopecks(amount),
+            quantity=quantity,
+            date=sale_date,
+            status=status
+        )
+        sales.append(sale)
+    return sales
+
+
 async def create_demo_data(telegram_id: int, username: str = None, first_name: str = None):
     """Создание демо-данных для пользователя"""
     async with async_session() as session:
@@ -50,66 +105,38 @@ async def create_demo_data(telegram_id: int, username: str = None, first_name: s
             await session.commit()
             await session.refresh(user)
         else:
-            # Удаляем старые демо-данные, если они были
-            result = await session.execute(
-                select(Sale).where(Sale.user_id == user.id)
-            )
-            old_sales = result.scalars().all()
-            for sale in old_sales:
-                await session.delete(sale)
+            # Удаляем старые демо-данные, если они были (одним DELETE, без загрузки продаж)
+            await session.execute(delete(Sale).where(Sale.user_id == user.id))
+            await clear_sketches(session, user.id)
+            # Прогнозные модели строились по старым продажам - обучаем заново
+            await session.execute(delete(HolidayUplift).where(HolidayUplift.user_id == user.id))
+            await session.execute(delete(RevenueForecastState).where(RevenueForecastState.user_id == user.id))
             await session.commit()
 
-        # Генерируем 50 случайных продаж за последние 30 дней
-        sales = []
-        for _ in range(50):
-            # Случайная дата за последние 30 дней
-            days_ago = random.randint(0, 30)
-            sale_date = datetime.utcnow() - timedelta(days=days_ago)
-
-            # Случайный товар
-            product = random.choice(DEMO_PRODUCTS)
-
-            # Случайная цена в зависимости от товара
-            base_prices = {
-                "Ноутбук MacBook Pro": 150000,
-                "Смартфон iPhone 15": 90000,
-                "Планшет iPad Air": 60000,
-                "Наушники AirPods Pro": 25000,
-                "Умные часы Apple Watch": 35000,
-                "Клавиатура Magic Keyboard": 12000,
-                "Мышь MX Master 3": 8000,
-                "Монитор LG UltraWide": 45000,
-                "Веб-камера Logitech": 15000,
-                "Микрофон Blue Yeti": 18000,
-                "SSD накопитель Samsung": 10000,
-                "Внешний HDD Seagate": 6000,
-                "Роутер Wi-Fi 6": 8000,
-                "Принтер HP LaserJet": 20000,
-                "Графический планшет Wacom": 30000
-            }
-            base_price = base_prices.get(product, 10000)
-            amount = base_price * random.uniform(0.9, 1.1)  # ±10% от базовой цены
-
-            # Случайное количество (обычно 1, иногда больше)
-            quantity = random.choices([1, 2, 3], weights=[0.8, 0.15, 0.05])[0]
-
-            # Случайный статус
-            status = random.choices(STATUSES, weights=STATUS_WEIGHTS)[0]
-
-            sale = Sale(
-                user_id=user.id,
-                product_name=product,
-                amount=round(amount, 2),
-                quantity=quantity,
-                date=sale_date,
-                status=status
-            )
-            sales.append(sale)
-
-        # Сохраняем все продажи
-        session.add_all(sales)
+        user_id = user.id
+        for attempt in range(2):
+            # id товаров из справочника (без запросов, если каталог уже в кэше)
+            product_ids = await intern_products(session, user_id, DEMO_PRODUCTS)
+            sales = generate_demo_sales(user_id, product_ids)
+            session.add_all(sales)
+            try:
+                await session.flush()
+                break
+            except IntegrityError:
+                # Каталог из кэша удален в другом процессе (api/retention.py) - разрешаем заново
+                await session.rollback()
+                forget_user_products(user_id)
+                if attempt:
+                    raise
+
+        # Сохраняем все продажи и обновляем скетчи
+        await record_sales(session, user_id, sales)
+        await bump_data_version(session, user_id)
         await session.commit()
 
+        # Продажи заменены целиком - горячий кэш пользователя больше не актуален
+        hot_cache.invalidate(user_id)
+
         print(f"✅ Создано {len(sales)} демо-продаж для пользователя {telegram_id}")
         return len(sales)
 
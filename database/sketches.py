@@ -0,0 +1,281 @@
+"""Потоковые скетчи: распределение чеков и топ товаров.
+
+QuantileSketch - логарифмическая гистограмма (DDSketch, Masson et al.,
+2019): значение x попадает в корзину ceil(log_gamma(x)), где
+gamma = (1 + a) / (1 - a). Любой квантиль восстанавливается с
+относительной ошибкой не более a (RELATIVE_ERROR = 1%), скетчи
+складываются без потери точности, а размер не зависит от числа продаж:
+для чеков от 1 копейки до 10 млн рублей это не более ~1000 корзин.
+
+TopKSketch - взвешенный Space-Saving (Metwally et al., 2005) по выручке
+товаров: хранит не более TOP_K_CAPACITY товаров, оценка выручки любого
+товара завышена не более чем на его error. Пока в каталоге не больше
+TOP_K_CAPACITY товаров, скетч точен.
+
+Скетчи ведутся на (пользователь, день) при записи продаж и
+объединяются при чтении за любой период; для топа товаров за всю
+историю дополнительно ведется скетч с day = NULL.
+"""
+import math
+import struct
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Sale, CheckSizeSketch, ProductSketch
+
+
+RELATIVE_ERROR = 0.01
+
+_GAMMA = (1 + RELATIVE_ERROR) / (1 - RELATIVE_ERROR)
+_LOG_GAMMA = math.log(_GAMMA)
+_HEADER = struct.Struct("<II")  # число корзин, число нулевых значений
+
+TOP_K_CAPACITY = 100
+_TOP_K_ENTRY = struct.Struct("<iqiiq")  # product_id, выручка, количество, продаж, ошибка
+
+
+class QuantileSketch:
+    """Сливаемый скетч квантилей с гарантированной относительной ошибкой"""
+
+    def __init__(self, keys: Optional[np.ndarray] = None, counts: Optional[np.ndarray] = None, zero_count: int = 0):
+        self.keys = keys if keys is not None else np.empty(0, dtype=np.int32)
+        self.counts = counts if counts is not None else np.empty(0, dtype=np.int64)
+        self.zero_count = zero_count
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum()) + self.zero_count
+
+    def add(self, values: Sequence[float]):
+        """Добавить пачку неотрицательных значений"""
+        values = np.asarray(values, dtype=float)
+        positive = values[values > 0]
+        self.zero_count += int(len(values) - len(positive))
+        keys = np.ceil(np.log(positive) / _LOG_GAMMA).astype(np.int32)
+        self._absorb(keys, np.ones(len(keys), dtype=np.int64))
+
+    def merge(self, other: "QuantileSketch"):
+        """Добавить содержимое другого скетча"""
+        self.zero_count += other.zero_count
+        self._absorb(other.keys, other.counts)
+
+    def _absorb(self, keys: np.ndarray, counts: np.ndarray):
+        all_keys = np.concatenate([self.keys, keys])
+        all_counts = np.concatenate([self.counts, counts])
+        self.keys, inverse = np.unique(all_keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=all_counts, minlength=len(self.keys)).astype(np.int64)
+
+    def quantiles(self, qs: Iterable[float]) -> List[Optional[float]]:
+        """Оценки квантилей (q от 0 до 1); None для пустого скетча"""
+        qs = list(qs)
+        total = self.count
+        if total == 0:
+            return [None] * len(qs)
+
+        cumulative = np.cumsum(self.counts) + self.zero_count
+        estimates = []
+        for q in qs:
+            rank = q * (total - 1)
+            if rank < self.zero_count:
+                estimates.append(0.0)
+                continue
+            index = int(np.searchsorted(cumulative, rank, side="right"))
+            index = min(index, len(self.keys) - 1)
+            estimates.append(2 * _GAMMA ** int(self.keys[index]) / (_GAMMA + 1))
+        return estimates
+
+    def to_bytes(self) -> bytes:
+        return (
+            _HEADER.pack(len(self.keys), self.zero_count)
+            + self.keys.astype("<i4").tobytes()
+            + self.counts.astype("<u4").tobytes()
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "QuantileSketch":
+        size, zero_count = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        keys = np.frombuffer(data, dtype="<i4", count=size, offset=offset).astype(np.int32)
+        counts = np.frombuffer(data, dtype="<u4", count=size, offset=offset + 4 * size).astype(np.int64)
+        return cls(keys, counts, zero_count)
+
+
+class TopKSketch:
+    """Сливаемый Space-Saving по выручке товаров"""
+
+    def __init__(self, capacity: int = TOP_K_CAPACITY):
+        self.capacity = capacity
+        # product_id -> [выручка, количество, продаж, ошибка выручки]
+        self.entries: Dict[int, List[int]] = {}
+
+    def add(self, product_id: int, revenue: int, quantity: int, sales_count: int = 1):
+        """Учесть выручку товара (можно уже агрегированную за пачку продаж)"""
+        entry = self.entries.get(product_id)
+        if entry is not None:
+            entry[0] += revenue
+            entry[1] += quantity
+            entry[2] += sales_count
+        elif len(self.entries) < self.capacity:
+            self.entries[product_id] = [revenue, quantity, sales_count, 0]
+        else:
+            # Вытесняем товар с минимальной выручкой, наследуя ее как ошибку
+            victim = min(self.entries, key=lambda pid: self.entries[pid][0])
+            floor = self.entries.pop(victim)[0]
+            self.entries[product_id] = [floor + revenue, quantity, sales_count, floor]
+
+    def merge(self, other: "TopKSketch"):
+        """Объединение скетчей: суммы по товарам, затем усечение до capacity"""
+        for product_id, (revenue, quantity, sales_count, error) in other.entries.items():
+            entry = self.entries.setdefault(product_id, [0, 0, 0, 0])
+            entry[0] += revenue
+            entry[1] += quantity
+            entry[2] += sales_count
+            entry[3] += error
+        if len(self.entries) > self.capacity:
+            ranked = sorted(self.entries.items(), key=lambda item: item[1][0], reverse=True)
+            floor = ranked[self.capacity][1][0]
+            self.entries = {}
+            for product_id, entry in ranked[:self.capacity]:
+                entry[3] += floor
+                self.entries[product_id] = entry
+
+    def top(self, limit: int) -> List[tuple]:
+        """[(product_id, выручка, количество, продаж, ошибка)] по убыванию выручки"""
+        ranked = sorted(self.entries.items(), key=lambda item: item[1][0], reverse=True)
+        return [(product_id, *entry) for product_id, entry in ranked[:limit]]
+
+    def to_bytes(self) -> bytes:
+        return b"".join(
+            _TOP_K_ENTRY.pack(product_id, *entry) for product_id, entry in self.entries.items()
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes, capacity: int = TOP_K_CAPACITY) -> "TopKSketch":
+        sketch = cls(capacity)
+        for product_id, *entry in _TOP_K_ENTRY.iter_unpack(data):
+            sketch.entries[product_id] = entry
+        return sketch
+
+
+async def record_sales(session: AsyncSession, user_id: int, sales: Sequence[Sale]):
+    """Учесть новые продажи во всех скетчах пользователя.
+
+    Вызывается после flush, когда у продаж уже заполнен line_total.
+    """
+    await record_check_sizes(session, user_id, sales)
+    await record_top_products(session, user_id, sales)
+
+
+async def clear_sketches(session: AsyncSession, user_id: int):
+    """Удалить скетчи пользователя (перед перегенерацией его продаж)"""
+    await session.execute(delete(CheckSizeSketch).where(CheckSizeSketch.user_id == user_id))
+    await session.execute(delete(ProductSketch).where(ProductSketch.user_id == user_id))
+
+
+async def record_top_products(session: AsyncSession, user_id: int, sales: Iterable[Sale]):
+    """Учесть завершенные продажи в дневных скетчах топа и в скетче за всю историю"""
+    by_day: Dict[Optional[date], Dict[int, List[int]]] = defaultdict(lambda: defaultdict(lambda: [0, 0, 0]))
+    for sale in sales:
+        if sale.status != "completed":
+            continue
+        for day in (sale.date.date(), None):
+            totals = by_day[day][sale.product_id]
+            totals[0] += sale.line_total
+            totals[1] += sale.quantity
+            totals[2] += 1
+    if not by_day:
+        return
+
+    days = [day for day in by_day if day is not None]
+    result = await session.execute(
+        select(ProductSketch)
+        .where(ProductSketch.user_id == user_id)
+        .where(ProductSketch.day.in_(days) | ProductSketch.day.is_(None))
+    )
+    existing = {row.day: row for row in result.scalars()}
+
+    for day, products in by_day.items():
+        row = existing.get(day)
+        sketch = TopKSketch.from_bytes(row.data) if row else TopKSketch()
+        for product_id, (revenue, quantity, sales_count) in products.items():
+            sketch.add(product_id, revenue, quantity, sales_count)
+        if row:
+            row.data = sketch.to_bytes()
+        else:
+            session.add(ProductSketch(user_id=user_id, day=day, data=sketch.to_bytes()))
+
+
+async def load_top_products_sketch(
+    session: AsyncSession,
+    user_id: int,
+    date_from: Optional[date] = None
+) -> TopKSketch:
+    """Скетч топа товаров с date_from (дата UTC) или за всю историю"""
+    query = select(ProductSketch.data).where(ProductSketch.user_id == user_id)
+    if date_from is None:
+        query = query.where(ProductSketch.day.is_(None))
+    else:
+        query = query.where(ProductSketch.day >= date_from)
+
+    sketch = TopKSketch()
+    for data in (await session.execute(query)).scalars():
+        sketch.merge(TopKSketch.from_bytes(data))
+    return sketch
+
+
+async def record_check_sizes(session: AsyncSession, user_id: int, sales: Iterable[Sale]):
+    """Учесть новые продажи в дневных скетчах пользователя.
+
+    Учитываются завершенные продажи (чек = line_total в копейках).
+    Существующие скетчи нужных дней читаются одним запросом.
+    """
+    by_day: Dict[date, List[int]] = defaultdict(list)
+    for sale in sales:
+        if sale.status == "completed":
+            by_day[sale.date.date()].append(sale.line_total)
+    if not by_day:
+        return
+
+    result = await session.execute(
+        select(CheckSizeSketch)
+        .where(CheckSizeSketch.user_id == user_id)
+        .where(CheckSizeSketch.day.in_(list(by_day)))
+    )
+    existing = {row.day: row for row in result.scalars()}
+
+    for day, values in by_day.items():
+        row = existing.get(day)
+        sketch = QuantileSketch.from_bytes(row.data) if row else QuantileSketch()
+        sketch.add(values)
+        if row:
+            row.data = sketch.to_bytes()
+        else:
+            session.add(CheckSizeSketch(user_id=user_id, day=day, data=sketch.to_bytes()))
+
+
+async def load_check_sketch(
+    session: AsyncSession,
+    user_id: int,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+) -> QuantileSketch:
+    """Объединенный скетч чеков за период (включительно, даты UTC)"""
+    query = select(CheckSizeSketch.data).where(CheckSizeSketch.user_id == user_id)
+    if date_from is not None:
+        query = query.where(CheckSizeSketch.day >= date_from)
+    if date_to is not None:
+        query = query.where(CheckSizeSketch.day <= date_to)
+
+    parts = [QuantileSketch.from_bytes(data) for data in (await session.execute(query)).scalars()]
+    sketch = QuantileSketch(zero_count=sum(part.zero_count for part in parts))
+    if parts:
+        sketch._absorb(
+            np.concatenate([part.keys for part in parts]),
+            np.concatenate([part.counts for part in parts])
+        )
+    return sketch
@@ -5,8 +5,8 @@ from datetime import datetime
 import tempfile
 
 
-def generate_excel_report(stats, sales, top_products, user_name="Пользователь"):
-    """Генерация Excel отчета"""
+def generate_excel_report(stats, sales, top_products, user_name="Пользователь", period_label=None):
+    """Генерация Excel отчета (period_label - подпись периода, None - вся история)"""
 
     # Создаем workbook
     wb = Workbook()
@@ -31,6 +31,8 @@ def generate_excel_report(stats, sales, top_products, user_name="Пользов
     ws_summary['A1'].font = title_font
     ws_summary['A2'] = f"Дата: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
     ws_summary['A3'] = f"Пользователь: {user_name}"
+    if period_label:
+        ws_summary['A4'] = f"Период: {period_label}"
 
     # Сводные показатели
     ws_summary['A5'] = "Показатель"
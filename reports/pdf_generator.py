@@ -9,8 +9,8 @@ from io import BytesIO
 import tempfile
 
 
-def generate_pdf_report(stats, sales, top_products, user_name="Пользователь"):
-    """Генерация PDF отчета"""
+def generate_pdf_report(stats, sales, top_products, user_name="Пользователь", period_label=None):
+    """Генерация PDF отчета (period_label - подпись периода, None - вся история)"""
 
     # Создаем временный файл для PDF
     temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
@@ -55,7 +55,10 @@ def generate_pdf_report(stats, sales, top_products, user_name="Пользова
     elements.append(title)
 
     # Дата и пользователь
-    date_text = f"<para align=center>Дата формирования: {datetime.now().strftime('%d.%m.%Y %H:%M')}<br/>Пользователь: {user_name}</para>"
+    date_text = f"<para align=center>Дата формирования: {datetime.now().strftime('%d.%m.%Y %H:%M')}<br/>Пользователь: {user_name}"
+    if period_label:
+        date_text += f"<br/>Период: {period_label}"
+    date_text += "</para>"
     elements.append(Paragraph(date_text, styles['Normal']))
     elements.append(Spacer(1, 20))
 
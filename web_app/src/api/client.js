@@ -12,8 +12,10 @@ const apiClient = axios.create({
 
 export const api = {
   // Получить статистику пользователя
-  getStats: async (telegramId) => {
-    const response = await apiClient.get(`/stats/${telegramId}`);
+  getStats: async (telegramId, days) => {
+    const response = await apiClient.get(`/stats/${telegramId}`, {
+      params: { days }
+    });
     return response.data;
   },
 
@@ -25,18 +27,89 @@ export const api = {
     return response.data;
   },
 
+  // Поиск продаж по названию товара; cursor - next_cursor предыдущей страницы
+  searchSales: async (telegramId, query, { limit = 50, cursor, status } = {}) => {
+    const response = await apiClient.get(`/search/${telegramId}`, {
+      params: { q: query, limit, cursor, status }
+    });
+    return response.data;
+  },
+
   // Получить данные для графика продаж по дням
-  getDailySalesChart: async (telegramId, days = 30) => {
+  getDailySalesChart: async (telegramId, days = 30, maxPoints) => {
     const response = await apiClient.get(`/charts/${telegramId}/daily`, {
-      params: { days }
+      params: { days, max_points: maxPoints }
+    });
+    return response.data;
+  },
+
+  // Получить временной ряд: bucket = hour|day|week|month, metric = revenue|count|quantity
+  // maxPoints ограничивает число точек (прореживание LTTB на сервере)
+  getSalesSeries: async (telegramId, { bucket = 'day', tz = 'UTC', metric = 'revenue', status = 'completed', days = 30, maxPoints } = {}) => {
+    const response = await apiClient.get(`/charts/${telegramId}/series`, {
+      params: { bucket, tz, metric, status, days, max_points: maxPoints }
     });
     return response.data;
   },
 
   // Получить топ товаров
-  getTopProducts: async (telegramId, limit = 5) => {
+  getTopProducts: async (telegramId, limit = 5, days) => {
     const response = await apiClient.get(`/charts/${telegramId}/top-products`, {
-      params: { limit }
+      params: { limit, days }
+    });
+    return response.data;
+  },
+
+  // Выручка по товарным категориям
+  getCategoryTotals: async (telegramId, days = null) => {
+    const response = await apiClient.get(`/charts/${telegramId}/categories`, {
+      params: days ? { days } : {}
+    });
+    return response.data;
+  },
+
+  // Сравнение с предыдущим периодом: window = day|week|month
+  getComparison: async (telegramId, window = 'week', tz = 'UTC') => {
+    const response = await apiClient.get(`/compare/${telegramId}`, {
+      params: { window, tz }
+    });
+    return response.data;
+  },
+
+  // Прогноз выручки на 7-30 дней с интервалом
+  getForecast: async (telegramId, days = 14, confidence = 0.95) => {
+    const response = await apiClient.get(`/forecast/${telegramId}`, {
+      params: { days, confidence }
+    });
+    return response.data;
+  },
+
+  // Аномальные дни (провалы/всплески выручки, всплески отмен)
+  getAnomalies: async (telegramId, days = 30) => {
+    const response = await apiClient.get(`/anomalies/${telegramId}`, {
+      params: { days }
+    });
+    return response.data;
+  },
+
+  // Аналитика: тренды, профили по дням недели/часам, ABC-анализ
+  getAnalyticsTrends: async (telegramId, days = 90, tz = 'UTC') => {
+    const response = await apiClient.get(`/analytics/${telegramId}/trends`, {
+      params: { days, tz }
+    });
+    return response.data;
+  },
+
+  getAnalyticsProfile: async (telegramId, days = 90, tz = 'UTC') => {
+    const response = await apiClient.get(`/analytics/${telegramId}/profile`, {
+      params: { days, tz }
+    });
+    return response.data;
+  },
+
+  getAbcAnalysis: async (telegramId, days) => {
+    const response = await apiClient.get(`/analytics/${telegramId}/abc`, {
+      params: { days }
     });
     return response.data;
   },
@@ -78,6 +151,18 @@ export const api = {
   getCategoryInsights: async () => {
     const response = await apiClient.get(`/holidays/insights`);
     return response.data;
+  },
+
+  // Живой дашборд (SSE): onSnapshot - полное состояние, onDelta - изменения.
+  // Переподключение с Last-Event-ID делает сам EventSource; возвращает функцию отписки
+  subscribeDashboard: (telegramId, { onSnapshot, onDelta, onError } = {}) => {
+    const source = new EventSource(`${API_URL}/live/${telegramId}`);
+    source.addEventListener('snapshot', (event) => onSnapshot?.(JSON.parse(event.data)));
+    source.addEventListener('delta', (event) => onDelta?.(JSON.parse(event.data)));
+    if (onError) {
+      source.onerror = onError;
+    }
+    return () => source.close();
   }
 };
 
@@ -4,6 +4,14 @@ import KPICards from './KPICards';
 import SalesChart from './SalesChart';
 import TopProducts from './TopProducts';
 
+// Точки дельты заменяют дни с теми же подписями, новые дни дописываются в конец
+const mergeChart = (current, delta) => {
+  const values = new Map(current.labels.map((label, i) => [label, current.values[i]]));
+  delta.labels.forEach((label, i) => values.set(label, delta.values[i]));
+  const labels = [...values.keys()].slice(-current.labels.length);
+  return { labels, values: labels.map((label) => values.get(label)) };
+};
+
 const Dashboard = ({ telegramId }) => {
   const [stats, setStats] = useState(null);
   const [chartData, setChartData] = useState(null);
@@ -15,6 +23,19 @@ const Dashboard = ({ telegramId }) => {
     loadData();
   }, [telegramId]);
 
+  // Живые обновления: снимок заменяет данные, дельта - KPI, топ и измененные дни графика
+  useEffect(() => {
+    const applyState = (state, isDelta) => {
+      setStats(state.stats);
+      setTopProducts({ products: state.top_products });
+      setChartData((current) => (isDelta && current ? mergeChart(current, state.chart) : state.chart));
+    };
+    return api.subscribeDashboard(telegramId, {
+      onSnapshot: (state) => applyState(state, false),
+      onDelta: (state) => applyState(state, true)
+    });
+  }, [telegramId]);
+
   const loadData = async () => {
     try {
       setLoading(true);
@@ -22,9 +43,9 @@ const Dashboard = ({ telegramId }) => {
 
       // Загружаем все данные параллельно
       const [statsData, chartDataRes, topProductsData] = await Promise.all([
-        api.getStats(telegramId),
+        api.getStats(telegramId, 30),
         api.getDailySalesChart(telegramId, 30),
-        api.getTopProducts(telegramId, 5)
+        api.getTopProducts(telegramId, 5, 30)
       ]);
 
       setStats(statsData);